@@ -2,15 +2,17 @@ import torch
 from torch import nn
 from torchvision.transforms import v2
 
-from torchsummary import summary
-
 import model
 
 import sys
 
 sys.path.append("../")
 from helpers import utils
+from helpers import profiler_util
 from helpers import load_data_util as ldu
+from helpers import autocast_util
+from helpers import compile_util
+from helpers import parallel_evaluate_util
 
 
 def he_initalization(m):
@@ -19,6 +21,13 @@ def he_initalization(m):
             torch.nn.init.kaiming_normal_(i.weight, mode="fan_in", nonlinearity="relu")
 
 
+# selecting the device at module level so that the train function can also be used when this file is imported
+device = (
+    "cuda"
+    if torch.cuda.is_available()
+    else "mps" if torch.backends.mps.is_available() else "cpu"
+)
+
 # this is the same as the ResNet paper
 train_batch_size = 128
 
@@ -60,7 +69,21 @@ def train(
     loss_fn,
     optimizer,
     lr_scheduler,
+    use_compile=False,
+    autocast_dtype=None,
+    freezer=None,
+    ema=None,
 ):
+    metrics_model = model
+    if use_compile is True:
+        # forward, loss, backward and optimizer step are compiled, the metrics are computed with a separate compiled model
+        train_step = compile_util.CompiledTrainStep(
+            model, loss_fn, optimizer, autocast_dtype
+        )
+        metrics_model = compile_util.CompiledEvalModel(model)
+
+    grad_scaler = autocast_util.make_grad_scaler(device, autocast_dtype)
+
     # set the model on training model
     for current_epoch in range(0, epochs):
         print(f"current epoch: {current_epoch}")
@@ -71,41 +94,53 @@ def train(
 
             X, y = X.to(device), y.to(device)
 
+            if use_compile is True:
+                train_step(X, y)
+                if ema is not None:
+                    ema.step()
+                continue
+
             # compute prediction error
-            # here we are making the prediction
-            trainig_pred = model(X)
-            # computing the loss from our prediction and true val
-            training_loss = loss_fn(trainig_pred, y)
+            # here we are making the prediction, with autocast the convs and linear layers run in bf16 / fp16
+            with autocast_util.autocast(device, autocast_dtype):
+                trainig_pred = model(X)
+            # computing the loss from our prediction and true val, the loss is always computed in fp32
+            training_loss = autocast_util.compute_loss(loss_fn, trainig_pred, y)
 
             # have to zero out the gradients, for each batch since they can be accumulated
             optimizer.zero_grad()
 
-            # backpropagation
-            training_loss.backward()
+            # backpropagation, the scaler only scales the loss for fp16 on cuda otherwise this is a normal backward
+            grad_scaler.scale(training_loss).backward()
 
             # Adjust learning weights
-            optimizer.step()
+            grad_scaler.step(optimizer)
+            grad_scaler.update()
+            # ema_util.ModelEMA, updates the average of the weights after the step
+            if ema is not None:
+                ema.step()
 
+        # with an ema the metrics are the ones of the averaged weights
         utils.compute_train_validation_loss_accuracy(
             current_epoch,
-            model,
+            metrics_model,
             loss_fn,
             device,
             training_dataloader,
             validation_dataloader,
+            autocast_dtype,
+            ema,
         )
         # we step the lr scheduler this happens after each epoch
         lr_scheduler.step()
+        # freezing_util.ProgressiveFreezer, decides after every epoch if the next early stage is frozen
+        if freezer is not None:
+            freezer.step(current_epoch)
 
     print("training finished")
 
 
 if __name__ == "__main__":
-    device = (
-        "cuda"
-        if torch.cuda.is_available()
-        else "mps" if torch.backends.mps.is_available() else "cpu"
-    )
     print(f"Using {device} device")
 
     validation_set_size = 5000
@@ -113,6 +148,17 @@ if __name__ == "__main__":
     # if true use cifar 10 dataset otherwise cifar 100 data set is used
     use_Cifar10 = True
     use_her_parameters = False
+    # torch.compile the training step, the compiled graphs are cached on disk so a rerun doesn't compile again
+    use_compile = False
+    # shard the test set evaluation over multiple processes, this only has an effect when running on the cpu
+    use_parallel_evaluation = False
+    # run the convs and linear layers in bf16 (torch.bfloat16, cpus with AMX / AVX512-BF16) or fp16 (torch.float16,
+    # cuda), None trains in fp32
+    autocast_dtype = None
+    # shortcut used when the shape changes, "A": subsampling + zero padding without parameters, "B": 1x1 conv + bn
+    shortcut_option = "B"
+    # the option A models are saved under a different name so they can be compared with the option B ones
+    shortcut_suffix = "_optionA" if shortcut_option == "A" else ""
 
     # cifar 10 dataset
     if use_Cifar10 is True:
@@ -130,24 +176,32 @@ if __name__ == "__main__":
         test_dataloader = ldu.load_CIFAR100_test(test_batch_size, test_transformations)
         num_classes = 100
 
-    resnet20 = model.resnet20(num_classes).to(device)
+    resnet20 = model.resnet20(num_classes, option=shortcut_option).to(device)
     resnet20.apply(he_initalization)
 
-    resnet56 = model.resnet56(num_classes).to(device)
+    resnet56 = model.resnet56(num_classes, option=shortcut_option).to(device)
     resnet56.apply(he_initalization)
 
-    resnet110 = model.resnet110(num_classes).to(device)
+    resnet110 = model.resnet110(num_classes, option=shortcut_option).to(device)
     resnet110.apply(he_initalization)
 
-	# ! torch summary only works with cpu or cuda and not mps
-    # print(summary(resnet20.to("cpu"), input_size=(3, 32, 32)))
-    # print(summary(resnet56.to("cpu"), input_size=(3, 32, 32)))
-    # print(summary(resnet110.to("cpu"), input_size=(3, 32, 32)))
+	# MACs, parameters, activation memory and forward / backward latency of every layer, works on every device
+    # profiler_util.print_profile(profiler_util.profile_model(resnet20, (3, 32, 32), device=device))
+    # profiler_util.print_profile(profiler_util.profile_model(resnet56, (3, 32, 32), device=device))
+    # profiler_util.print_profile(profiler_util.profile_model(resnet110, (3, 32, 32), device=device))
 
     # for name, param in resnet20.named_parameters():
     #     if param.requires_grad:
     #         print(name, param.device)
 
+    if use_parallel_evaluation is True:
+        evaluate = parallel_evaluate_util.evaluate
+    else:
+        evaluate = utils.evaluate
+
+    if use_compile is True:
+        compile_util.enable_compile_cache()
+
     # defining loss function
     if use_her_parameters is True:
         print("using cross entropy loss with label smoothing")
@@ -179,8 +233,11 @@ if __name__ == "__main__":
         loss_fn,
         optimizer,
         lr_scheduler,
+        use_compile,
+        autocast_dtype=autocast_dtype,
     )
-    utils.evaluate(resnet20, test_dataloader, loss_fn, device)
+    evaluate(resnet20, test_dataloader, loss_fn, device, autocast_dtype=autocast_dtype)
+    utils.save_model(resnet20, f"resnet20{shortcut_suffix}_cifar{num_classes}")
     utils.plot_training_validation_loss_and_accuracy()
     utils.clear_histogram()
 
@@ -207,8 +264,11 @@ if __name__ == "__main__":
         loss_fn,
         optimizer,
         lr_scheduler,
+        use_compile,
+        autocast_dtype=autocast_dtype,
     )
-    utils.evaluate(resnet56, test_dataloader, loss_fn, device)
+    evaluate(resnet56, test_dataloader, loss_fn, device, autocast_dtype=autocast_dtype)
+    utils.save_model(resnet56, f"resnet56{shortcut_suffix}_cifar{num_classes}")
     utils.plot_training_validation_loss_and_accuracy()
     utils.clear_histogram()
 
@@ -244,7 +304,10 @@ if __name__ == "__main__":
         loss_fn,
         optimizer,
         lr_scheduler,
+        use_compile,
+        autocast_dtype=autocast_dtype,
     )
-    utils.evaluate(resnet110, test_dataloader, loss_fn, device)
+    evaluate(resnet110, test_dataloader, loss_fn, device, autocast_dtype=autocast_dtype)
+    utils.save_model(resnet110, f"resnet110{shortcut_suffix}_cifar{num_classes}")
     utils.plot_training_validation_loss_and_accuracy()
     utils.clear_histogram()
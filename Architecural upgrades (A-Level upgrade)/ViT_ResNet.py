@@ -2,8 +2,6 @@ import torch
 from torch import nn
 from torchvision.transforms import v2
 
-from torchsummary import summary
-
 import model
 from blocks.Patchify_Embed_Block import Patchify_EmbedBlock
 
@@ -11,7 +9,10 @@ import sys
 
 sys.path.append("../")
 from helpers import utils
+from helpers import profiler_util
 from helpers import load_data_util as ldu
+from helpers import autocast_util
+from helpers import compile_util
 
 
 def he_initalization(m):
@@ -20,6 +21,13 @@ def he_initalization(m):
 			torch.nn.init.kaiming_normal_(i.weight, mode="fan_in", nonlinearity="relu")
 
 
+# selecting the device at module level so that the train function can also be used when this file is imported
+device = (
+	"cuda"
+	if torch.cuda.is_available()
+	else "mps" if torch.backends.mps.is_available() else "cpu"
+)
+
 # this is the same as the ResNet paper
 train_batch_size = 128
 
@@ -61,7 +69,17 @@ def train(
 	loss_fn,
 	optimizer,
 	lr_scheduler,
+	use_compile=False,
+	autocast_dtype=None,
 ):
+	metrics_model = model
+	if use_compile is True:
+		# forward, loss, backward and optimizer step are compiled, the metrics are computed with a separate compiled model
+		train_step = compile_util.CompiledTrainStep(model, loss_fn, optimizer, autocast_dtype)
+		metrics_model = compile_util.CompiledEvalModel(model)
+
+	grad_scaler = autocast_util.make_grad_scaler(device, autocast_dtype)
+
 	# set the model on training model
 	for current_epoch in range(0, epochs):
 		print(f"current epoch: {current_epoch}")
@@ -72,28 +90,35 @@ def train(
 
 			X, y = X.to(device), y.to(device)
 
+			if use_compile is True:
+				train_step(X, y)
+				continue
+
 			# compute prediction error
-			# here we are making the prediction
-			trainig_pred = model(X)
-			# computing the loss from our prediction and true val
-			training_loss = loss_fn(trainig_pred, y)
+			# here we are making the prediction, with autocast the convs and linear layers run in bf16 / fp16
+			with autocast_util.autocast(device, autocast_dtype):
+				trainig_pred = model(X)
+			# computing the loss from our prediction and true val, the loss is always computed in fp32
+			training_loss = autocast_util.compute_loss(loss_fn, trainig_pred, y)
 
 			# have to zero out the gradients, for each batch since they can be accumulated
 			optimizer.zero_grad()
 
-			# backpropagation
-			training_loss.backward()
+			# backpropagation, the scaler only scales the loss for fp16 on cuda otherwise this is a normal backward
+			grad_scaler.scale(training_loss).backward()
 
 			# Adjust learning weights
-			optimizer.step()
+			grad_scaler.step(optimizer)
+			grad_scaler.update()
 
 		utils.compute_train_validation_loss_accuracy(
 			current_epoch,
-			model,
+			metrics_model,
 			loss_fn,
 			device,
 			training_dataloader,
 			validation_dataloader,
+			autocast_dtype,
 		)
 		# we step the lr scheduler this happens after each epoch
 		lr_scheduler.step()
@@ -102,11 +127,6 @@ def train(
 
 
 if __name__ == "__main__":
-	device = (
-		"cuda"
-		if torch.cuda.is_available()
-		else "mps" if torch.backends.mps.is_available() else "cpu"
-	)
 	print(f"Using {device} device")
 
 	validation_set_size = 5000
@@ -114,6 +134,11 @@ if __name__ == "__main__":
 	# if true use cifar 10 dataset otherwise cifar 100 data set is used
 	use_Cifar10 = True
 	use_her_parameters = False
+	# torch.compile the training step, the compiled graphs are cached on disk so a rerun doesn't compile again
+	use_compile = False
+	# run the convs and linear layers in bf16 (torch.bfloat16, cpus with AMX / AVX512-BF16) or fp16 (torch.float16,
+	# cuda), None trains in fp32
+	autocast_dtype = None
 	num_epochs_to_train = 200
 
 	# cifar 10 dataset
@@ -145,10 +170,13 @@ if __name__ == "__main__":
 	# #     if param.requires_grad:
 	# #         print(name, param.device)
 
-	# ! torch summary only works with cpu or cuda and not mps
-	# print(summary(ViT_resnet20.to("cpu"), input_size=(3, 32, 32)))
-	# print(summary(ViT_resnet56.to("cpu"), input_size=(3, 32, 32)))
-	# print(summary(ViT_resnet110.to("cpu"), input_size=(3, 32, 32)))
+	# MACs, parameters, activation memory and forward / backward latency of every layer, works on every device
+	# profiler_util.print_profile(profiler_util.profile_model(ViT_resnet20, (3, 32, 32), device=device))
+	# profiler_util.print_profile(profiler_util.profile_model(ViT_resnet56, (3, 32, 32), device=device))
+	# profiler_util.print_profile(profiler_util.profile_model(ViT_resnet110, (3, 32, 32), device=device))
+
+	if use_compile is True:
+		compile_util.enable_compile_cache()
 
 	# defining loss function
 	if use_her_parameters is True:
@@ -181,8 +209,11 @@ if __name__ == "__main__":
 		loss_fn,
 		optimizer,
 		lr_scheduler,
+		use_compile,
+		autocast_dtype=autocast_dtype,
 	)
-	utils.evaluate(ViT_resnet20, test_dataloader, loss_fn, device)
+	utils.evaluate(ViT_resnet20, test_dataloader, loss_fn, device, autocast_dtype)
+	utils.save_model(ViT_resnet20, f"ViT_resnet20_cifar{num_classes}")
 	utils.plot_training_validation_loss_and_accuracy()
 	utils.clear_histogram()
 
@@ -209,8 +240,11 @@ if __name__ == "__main__":
 		loss_fn,
 		optimizer,
 		lr_scheduler,
+		use_compile,
+		autocast_dtype=autocast_dtype,
 	)
-	utils.evaluate(ViT_resnet56, test_dataloader, loss_fn, device)
+	utils.evaluate(ViT_resnet56, test_dataloader, loss_fn, device, autocast_dtype)
+	utils.save_model(ViT_resnet56, f"ViT_resnet56_cifar{num_classes}")
 	utils.plot_training_validation_loss_and_accuracy()
 	utils.clear_histogram()
 
@@ -246,7 +280,10 @@ if __name__ == "__main__":
 		loss_fn,
 		optimizer,
 		lr_scheduler,
+		use_compile,
+		autocast_dtype=autocast_dtype,
 	)
-	utils.evaluate(ViT_resnet110, test_dataloader, loss_fn, device)
+	utils.evaluate(ViT_resnet110, test_dataloader, loss_fn, device, autocast_dtype)
+	utils.save_model(ViT_resnet110, f"ViT_resnet110_cifar{num_classes}")
 	utils.plot_training_validation_loss_and_accuracy()
 	utils.clear_histogram()
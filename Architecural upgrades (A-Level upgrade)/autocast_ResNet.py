@@ -0,0 +1,148 @@
+import time
+
+import torch
+from torch import nn
+
+import model
+from ResNet import (
+    device,
+    he_initalization,
+    train,
+    train_transformations,
+    test_transformations,
+)
+
+import sys
+
+sys.path.append("../")
+from helpers import utils
+from helpers import autocast_util
+from helpers import load_data_util as ldu
+
+# this is the same as the ResNet paper
+train_batch_size = 128
+
+# setting batch size at test time to be 100 have division since we have 10k images at test time
+test_batch_size = 100
+
+
+def measure_training_throughput(
+    resnet, autocast_dtype, num_warmup=3, num_iterations=10
+):
+    optimizer = torch.optim.SGD(resnet.parameters(), lr=0.1, momentum=0.9)
+    loss_fn = nn.CrossEntropyLoss()
+    grad_scaler = autocast_util.make_grad_scaler(device, autocast_dtype)
+    X = torch.randn(train_batch_size, 3, 32, 32, device=device)
+    y = torch.randint(0, 10, (train_batch_size,), device=device)
+
+    resnet.train()
+    for iteration in range(num_warmup + num_iterations):
+        if iteration == num_warmup:
+            start = time.perf_counter()
+        with autocast_util.autocast(device, autocast_dtype):
+            pred = resnet(X)
+        loss = autocast_util.compute_loss(loss_fn, pred, y)
+        optimizer.zero_grad()
+        grad_scaler.scale(loss).backward()
+        grad_scaler.step(optimizer)
+        grad_scaler.update()
+    # the loss has to be read so that all the kernels on a gpu are done before the clock is stopped
+    loss.item()
+
+    return num_iterations * train_batch_size / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    print(f"Using {device} device")
+    if device == "cpu":
+        # bf16 is only fast with AMX or AVX512-BF16, on other cpus it is emulated and slower than fp32
+        print(f"cpu capability: {torch.backends.cpu.get_cpu_capability()}")
+
+    validation_set_size = 5000
+
+    # if true use cifar 10 dataset otherwise cifar 100 data set is used
+    use_Cifar10 = True
+    # if true resnet20 is trained with each dtype to compare the final test accuracy, otherwise only the throughput
+    # is measured
+    train_for_accuracy = True
+    num_epochs_to_train = 200
+
+    # fp16 is only compared on cuda, on the cpu most of its kernels are emulated and much slower than fp32
+    autocast_dtypes = [None, torch.bfloat16]
+    if device == "cuda":
+        autocast_dtypes.append(torch.float16)
+
+    print(
+        f"------------- training throughput, batch size {train_batch_size} -----------------"
+    )
+    for name in ["resnet20", "resnet56"]:
+        for autocast_dtype in autocast_dtypes:
+            torch.manual_seed(0)
+            resnet = getattr(model, name)(10).to(device)
+            images_per_second = measure_training_throughput(resnet, autocast_dtype)
+            if autocast_dtype is None:
+                fp32_images_per_second = images_per_second
+            print(
+                f"{name} {str(autocast_dtype or 'fp32'):>14}: {images_per_second:6.1f} img/s "
+                f"({images_per_second / fp32_images_per_second:.2f}x)"
+            )
+
+    if train_for_accuracy is True:
+        if use_Cifar10 is True:
+            print("Dataset is CIFAR10")
+            validation_loader, training_dataloader = ldu.load_CIFAR10_train_validation(
+                train_batch_size, train_transformations, validation_set_size
+            )
+            test_dataloader = ldu.load_CIFAR10_test(
+                test_batch_size, test_transformations
+            )
+            num_classes = 10
+        else:
+            print("Dataset is CIFAR100")
+            validation_loader, training_dataloader = ldu.load_CIFAR100_train_validation(
+                train_batch_size, train_transformations, validation_set_size
+            )
+            test_dataloader = ldu.load_CIFAR100_test(
+                test_batch_size, test_transformations
+            )
+            num_classes = 100
+
+        loss_fn = nn.CrossEntropyLoss()
+        accuracies = {}
+        for autocast_dtype in autocast_dtypes:
+            print(
+                f"------------- training resnet20 with {autocast_dtype or 'fp32'} -----------------"
+            )
+            torch.manual_seed(0)
+            resnet20 = model.resnet20(num_classes).to(device)
+            resnet20.apply(he_initalization)
+
+            optimizer = torch.optim.SGD(
+                resnet20.parameters(), lr=0.1, momentum=0.9, weight_decay=0.0001
+            )
+            lr_scheduler = torch.optim.lr_scheduler.MultiStepLR(
+                optimizer, [100, 150], gamma=0.1
+            )
+            start = time.perf_counter()
+            train(
+                num_epochs_to_train,
+                training_dataloader,
+                validation_loader,
+                resnet20,
+                loss_fn,
+                optimizer,
+                lr_scheduler,
+                autocast_dtype=autocast_dtype,
+            )
+            training_time = time.perf_counter() - start
+            # the weights are fp32 in every mode so the test accuracy is computed with the same dtype as the training
+            num_correct, _ = utils.evaluate(
+                resnet20, test_dataloader, loss_fn, device, autocast_dtype
+            )
+            accuracies[autocast_dtype] = num_correct / len(test_dataloader.dataset)
+            utils.clear_histogram()
+
+            print(
+                f"{str(autocast_dtype or 'fp32')}: test accuracy {(100*accuracies[autocast_dtype]):>0.2f}% "
+                f"(fp32 {(100*accuracies[None]):>0.2f}%), training time {training_time:.0f} s"
+            )
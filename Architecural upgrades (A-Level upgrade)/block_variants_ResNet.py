@@ -0,0 +1,114 @@
+import torch
+from torch import nn
+
+import model
+from fuse_inference import fuse_for_inference
+from ResNet import (
+    device,
+    he_initalization,
+    train,
+    train_transformations,
+    test_transformations,
+)
+
+import sys
+
+sys.path.append("../")
+from helpers import utils
+from helpers import load_data_util as ldu
+from helpers import benchmark_util
+
+# this is the same as the ResNet paper
+train_batch_size = 128
+
+# setting batch size at test time to be 100 have division since we have 10k images at test time
+test_batch_size = 100
+
+# every row has the basic, the bottleneck and the inverted residual network at about the same number of MACs
+model_groups = [
+    ["resnet20", "bottleneck_resnet29", "inverted_resnet38"],
+    ["resnet56", "bottleneck_resnet83", "inverted_resnet110"],
+    ["resnet110", "bottleneck_resnet164", "inverted_resnet209"],
+]
+
+
+if __name__ == "__main__":
+    print(f"Using {device} device")
+
+    validation_set_size = 5000
+
+    # if true use cifar 10 dataset otherwise cifar 100 data set is used
+    use_Cifar10 = True
+    # if true the models without a checkpoint are trained first, otherwise they are reported as not trained
+    train_missing_models = False
+    num_epochs_to_train = 200
+
+    if use_Cifar10 is True:
+        print("Dataset is CIFAR10")
+        validation_loader, training_dataloader = ldu.load_CIFAR10_train_validation(
+            train_batch_size, train_transformations, validation_set_size
+        )
+        test_dataloader = ldu.load_CIFAR10_test(test_batch_size, test_transformations)
+        num_classes = 10
+    else:
+        print("Dataset is CIFAR100")
+        validation_loader, training_dataloader = ldu.load_CIFAR100_train_validation(
+            train_batch_size, train_transformations, validation_set_size
+        )
+        test_dataloader = ldu.load_CIFAR100_test(test_batch_size, test_transformations)
+        num_classes = 100
+
+    loss_fn = nn.CrossEntropyLoss()
+    # the latency is measured on the cpu with the bn folded into the convs, as the models would be deployed
+    example_batch = next(iter(test_dataloader))[0]
+
+    for group in model_groups:
+        print(f"------------- {' / '.join(group)} -----------------")
+        for name in group:
+            resnet = getattr(model, name)(num_classes).to(device)
+            checkpoint_name = f"{name}_cifar{num_classes}"
+            found = utils.load_model(resnet, checkpoint_name, device)
+
+            if found is False and train_missing_models is True:
+                resnet.apply(he_initalization)
+                optimizer = torch.optim.SGD(
+                    resnet.parameters(), lr=0.1, momentum=0.9, weight_decay=0.0001
+                )
+                lr_scheduler = torch.optim.lr_scheduler.MultiStepLR(
+                    optimizer, [100, 150], gamma=0.1
+                )
+                train(
+                    num_epochs_to_train,
+                    training_dataloader,
+                    validation_loader,
+                    resnet,
+                    loss_fn,
+                    optimizer,
+                    lr_scheduler,
+                )
+                utils.save_model(resnet, checkpoint_name)
+                utils.clear_histogram()
+                found = True
+
+            macs, num_params = benchmark_util.count_macs_and_params(
+                resnet, (3, 32, 32), device
+            )
+            fused_resnet = fuse_for_inference(resnet).to("cpu")
+            latency = benchmark_util.measure_latency(fused_resnet, example_batch)
+            single_image_latency = benchmark_util.measure_latency(
+                fused_resnet, example_batch[:1]
+            )
+
+            if found is True:
+                accuracy = utils.compute_accuracy_on_whole_dataloader(
+                    resnet, test_dataloader, device
+                )
+                accuracy = f"{(100*accuracy):>0.2f}%"
+            else:
+                accuracy = "not trained"
+
+            print(
+                f"{name:>21}: {macs / 1e6:6.1f} MMACs, {num_params:>8} parameters, cpu latency "
+                f"{1000*latency:7.2f} ms / batch of {test_batch_size}, {1000*single_image_latency:5.2f} ms / image, "
+                f"accuracy {accuracy}"
+            )
@@ -0,0 +1,60 @@
+from torch import nn
+from blocks.ResNetBlock import ZeroPadShortcut
+
+
+class BottleneckBlock(nn.Module):
+	# bottleneck block from the ResNet paper (used for ResNet-164 on CIFAR), a 1x1 conv reduces the channels, the 3x3
+	# conv works on the reduced channels and a second 1x1 conv expands them again, so the output has
+	# out_channels * expansion channels
+	expansion = 4
+
+	def __init__(self, in_channels, out_channels, stride=1, option="B"):
+		super().__init__()
+		self.conv_1 = nn.Conv2d(in_channels, out_channels, kernel_size=1, bias=False)
+		self.bn_1 = nn.BatchNorm2d(out_channels)
+		# the stride is in the 3x3 conv as in the torchvision implementation (ResNet v1.5)
+		self.conv_2 = nn.Conv2d(
+			out_channels, out_channels, kernel_size=3, stride=stride, padding=1, bias=False
+		)
+		self.bn_2 = nn.BatchNorm2d(out_channels)
+		self.conv_3 = nn.Conv2d(out_channels, out_channels * self.expansion, kernel_size=1, bias=False)
+		self.bn_3 = nn.BatchNorm2d(out_channels * self.expansion)
+
+		self.relu = nn.ReLU(inplace=True)
+
+		self.residual = nn.Sequential()
+		if stride != 1 or in_channels != out_channels * self.expansion:
+			if option == "A":
+				self.residual = ZeroPadShortcut(in_channels, out_channels * self.expansion, stride)
+			elif option == "B":
+				self.residual = nn.Sequential(
+					nn.Conv2d(
+						in_channels,
+						out_channels * self.expansion,
+						kernel_size=1,
+						stride=stride,
+						bias=False,
+					),
+					nn.BatchNorm2d(self.expansion * out_channels),
+				)
+			else:
+				raise ValueError("uncorrect option choosen")
+
+	def forward(self, x):
+		identity = x
+
+		x = self.conv_1(x)
+		x = self.bn_1(x)
+		x = self.relu(x)
+
+		x = self.conv_2(x)
+		x = self.bn_2(x)
+		x = self.relu(x)
+
+		x = self.conv_3(x)
+		x = self.bn_3(x)
+
+		x = x + self.residual(identity)
+
+		x = self.relu(x)
+		return x
@@ -0,0 +1,58 @@
+import contextlib
+
+import torch
+from torch import nn
+from torch.utils.checkpoint import checkpoint
+
+
+@contextlib.contextmanager
+def _keep_batch_norm_statistics(modules):
+	# the blocks are run a second time in the backward pass which would update the running mean, var and the number
+	# of batches tracked again, so they are copied before the recomputation and put back afterwards
+	batch_norms = [m for m in modules if isinstance(m, nn.modules.batchnorm._BatchNorm)]
+	statistics = [
+		(bn.running_mean.clone(), bn.running_var.clone(), bn.num_batches_tracked.clone()) for bn in batch_norms
+	]
+	try:
+		yield
+	finally:
+		for bn, (running_mean, running_var, num_batches_tracked) in zip(batch_norms, statistics):
+			bn.running_mean.copy_(running_mean)
+			bn.running_var.copy_(running_var)
+			bn.num_batches_tracked.copy_(num_batches_tracked)
+
+
+class CheckpointedSequential(nn.Sequential):
+	# a stage of blocks where only the input of every segment of segment_size blocks is kept during the forward pass,
+	# the activations inside of a segment are recomputed in the backward pass, so memory goes down for an extra forward.
+	# it is still a Sequential with the blocks as children so the state dict is the same as without checkpointing
+	def __init__(self, *blocks, segment_size):
+		super().__init__(*blocks)
+		self.segment_size = segment_size
+
+	def _run_segment(self, start, x):
+		# slicing a Sequential would build a new CheckpointedSequential, so the blocks are taken from a list
+		for block in list(self)[start : start + self.segment_size]:
+			x = block(x)
+		return x
+
+	def forward(self, x):
+		# nothing is stored for the backward pass when evaluating so there is nothing to save
+		if not (self.training and torch.is_grad_enabled()):
+			return super().forward(x)
+
+		for start in range(0, len(self), self.segment_size):
+			segment_modules = [
+				m for block in list(self)[start : start + self.segment_size] for m in block.modules()
+			]
+			x = checkpoint(
+				self._run_segment,
+				start,
+				x,
+				use_reentrant=False,
+				context_fn=lambda: (
+					contextlib.nullcontext(),
+					_keep_batch_norm_statistics(segment_modules),
+				),
+			)
+		return x
@@ -0,0 +1,18 @@
+import torch
+from torch import nn
+
+
+class EarlyExitHead(nn.Module):
+	# a cheap classifier on the output of an intermediate stage, the same global average pool + linear as the final
+	# classifier so easy images can be classified without running the deeper stages
+	def __init__(self, in_channels, num_classes):
+		super().__init__()
+		self.avgpool = nn.AdaptiveAvgPool2d((1, 1))
+		self.classifier = nn.Linear(in_channels, num_classes)
+		torch.nn.init.kaiming_normal_(self.classifier.weight, mode="fan_in", nonlinearity="relu")
+		torch.nn.init.zeros_(self.classifier.bias)
+
+	def forward(self, x):
+		x = self.avgpool(x)
+		x = torch.flatten(x, 1)
+		return self.classifier(x)
@@ -0,0 +1,54 @@
+from torch import nn
+
+
+class InvertedResidualBlock(nn.Module):
+	# inverted residual block from MobileNetV2, a 1x1 conv expands the channels by expand_ratio, a depthwise 3x3 conv
+	# (one filter per channel) does the spatial filtering and a 1x1 conv projects back to out_channels. the 3x3 conv is
+	# depthwise separable, so most of the MACs are in the cheap 1x1 convs
+	expansion = 1
+
+	# option is only there so every block can be built the same way, as in MobileNetV2 there is no shortcut when the
+	# shape changes
+	def __init__(self, in_channels, out_channels, stride=1, option="B", expand_ratio=6):
+		super().__init__()
+		hidden_channels = in_channels * expand_ratio
+
+		self.conv_1 = nn.Conv2d(in_channels, hidden_channels, kernel_size=1, bias=False)
+		self.bn_1 = nn.BatchNorm2d(hidden_channels)
+		self.conv_2 = nn.Conv2d(
+			hidden_channels,
+			hidden_channels,
+			kernel_size=3,
+			stride=stride,
+			padding=1,
+			groups=hidden_channels,
+			bias=False,
+		)
+		self.bn_2 = nn.BatchNorm2d(hidden_channels)
+		self.conv_3 = nn.Conv2d(hidden_channels, out_channels, kernel_size=1, bias=False)
+		self.bn_3 = nn.BatchNorm2d(out_channels)
+
+		self.relu = nn.ReLU(inplace=True)
+
+		self.use_residual = stride == 1 and in_channels == out_channels
+		# always an (empty) sequential so the block looks like the others to fuse_for_inference
+		self.residual = nn.Sequential()
+
+	def forward(self, x):
+		identity = x
+
+		x = self.conv_1(x)
+		x = self.bn_1(x)
+		x = self.relu(x)
+
+		x = self.conv_2(x)
+		x = self.bn_2(x)
+		x = self.relu(x)
+
+		# the projection is linear, a relu on the few output channels would destroy too much information
+		x = self.conv_3(x)
+		x = self.bn_3(x)
+
+		if self.use_residual:
+			x = x + self.residual(identity)
+		return x
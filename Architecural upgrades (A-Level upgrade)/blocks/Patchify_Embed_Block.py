@@ -2,10 +2,19 @@ from torch import nn
 
 
 class Patchify_EmbedBlock(nn.Module):
-    def __init__(self, in_channels, out_channels, patch_size):
+    # stride None gives non overlapping patches (stride = patch_size), a smaller stride makes the patches overlap. the
+    # output size is (input_size + 2 * padding - patch_size) // stride + 1, which is input_size / stride when the stride
+    # divides the input size, so e.g. patch size 4 or 3 with stride 2 gives 16x16 like patch size 2 does. only an even
+    # patch size with stride 1 can't keep the size, it would need more padding on one side than the other and the
+    # symmetric padding gives input_size + 1
+    def __init__(self, in_channels, out_channels, patch_size, stride=None):
         super().__init__()
+        stride = stride or patch_size
+        if stride == 1 and patch_size % 2 == 0:
+            raise ValueError("uncorrect patch size choosen, an even patch size needs a stride of at least 2")
+        padding = (patch_size - stride + 1) // 2
 
-        self.p = nn.Conv2d(in_channels, out_channels, kernel_size=patch_size, stride=patch_size)
+        self.p = nn.Conv2d(in_channels, out_channels, kernel_size=patch_size, stride=stride, padding=padding)
         nn.init.zeros_(self.p.bias)
 
     def forward(self, x):
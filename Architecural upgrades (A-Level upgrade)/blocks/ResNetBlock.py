@@ -1,4 +1,23 @@
+import torch
 from torch import nn
+import torch.nn.functional as F
+
+
+class ZeroPadShortcut(nn.Module):
+	# option A from the ResNet paper, the identity is subsampled with the stride and the extra channels are filled with
+	# zeros, so the shortcut has no parameters. the channels are padded equally on both sides as in the original
+	# CIFAR implementation
+	def __init__(self, in_channels, out_channels, stride):
+		super().__init__()
+		self.stride = stride
+		self.pad_front = (out_channels - in_channels) // 2
+		self.pad_back = out_channels - in_channels - self.pad_front
+
+	def forward(self, x):
+		x = x[:, :, :: self.stride, :: self.stride]
+		# F.pad pads the last dimensions first, so the channels are the 5th and 6th value
+		return F.pad(x, (0, 0, 0, 0, self.pad_front, self.pad_back))
+
 
 class ResNetBlock(nn.Module):
 	expansion = 1
@@ -21,6 +40,10 @@ class ResNetBlock(nn.Module):
 
 		self.relu = nn.ReLU(inplace=True)
 
+		# stochastic depth (Huang et al.), the probability that the residual branch is run in a training step. it is set by
+		# the ResNet, 1.0 always runs the branch
+		self.survival_prob = 1.0
+
 		# this is how define the identity just using the sequl
 		self.residual = nn.Sequential()
 
@@ -31,8 +54,7 @@ class ResNetBlock(nn.Module):
 		# as the out_channel indicating that we are not in the same layer
 		if stride != 1 or in_channels != out_channels:
 			if option == "A":
-				# self.residual =
-				raise ValueError("Not implemented")
+				self.residual = ZeroPadShortcut(in_channels, out_channels * self.expansion, stride)
 			elif option == "B":
 				# here we use a 1x1 conv to match the dimension but we also have to add a batch normalization since this is a conv layer
 				# note how we reduce the output depth here
@@ -52,6 +74,12 @@ class ResNetBlock(nn.Module):
 	def forward(self, x):
 		identity = x
 
+		# a dropped branch is not computed at all, the block is only the shortcut. the draw is on the cpu generator so it
+		# doesn't sync with the gpu, and activation checkpointing restores the rng state so the recomputation drops the
+		# same blocks. the relu is not in place since the identity shortcut returns the input of the block
+		if self.training and self.survival_prob < 1.0 and torch.rand(1).item() >= self.survival_prob:
+			return F.relu(self.residual(identity))
+
 		x = self.conv_1(x)
 		x = self.bn_1(x)
 		x = self.relu(x)
@@ -60,7 +88,12 @@ class ResNetBlock(nn.Module):
 		x = self.bn_2(x)
 
 		# add residual connection this happen before second activation as described in the paper
-		x = x + self.residual(identity)
+		if not self.training and self.survival_prob < 1.0:
+			# at inference every branch runs, scaled with its survival probability so it matches the expected output
+			# during training
+			x = torch.add(self.residual(identity), x, alpha=self.survival_prob)
+		else:
+			x = x + self.residual(identity)
 
 		x = self.relu(x)
 		return x
\ No newline at end of file
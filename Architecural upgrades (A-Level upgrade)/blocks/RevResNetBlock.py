@@ -0,0 +1,105 @@
+import torch
+from torch import nn
+
+from blocks.CheckpointedSequential import _keep_batch_norm_statistics
+
+
+def _residual_function(num_channels):
+	# the same conv -> bn -> relu -> conv -> bn as in the normal block, but on half of the channels
+	return nn.Sequential(
+		nn.Conv2d(num_channels, num_channels, kernel_size=3, stride=1, padding=1, bias=False),
+		nn.BatchNorm2d(num_channels),
+		nn.ReLU(inplace=True),
+		nn.Conv2d(num_channels, num_channels, kernel_size=3, stride=1, padding=1, bias=False),
+		nn.BatchNorm2d(num_channels),
+	)
+
+
+class RevResNetBlock(nn.Module):
+	# reversible block from "The Reversible Residual Network" (Gomez et al.), the channels are split in two halves and
+	#   y1 = x1 + F(x2)
+	#   y2 = x2 + G(y1)
+	# so the input can be computed back from the output with x2 = y2 - G(y1), x1 = y1 - F(x2) and doesn't have to be
+	# stored for the backward pass. this only works when the shape doesn't change, so the first block of a stage that
+	# downsamples is a normal ResNetBlock (see ResNet._make_layer)
+	expansion = 1
+	reversible = True
+
+	# option is only there so every block can be built the same way, the reversible block has no shortcut
+	def __init__(self, in_channels, out_channels, stride=1, option="B"):
+		super().__init__()
+		if stride != 1 or in_channels != out_channels:
+			raise ValueError("a reversible block can't change the shape of the input")
+
+		self.F = _residual_function(out_channels // 2)
+		self.G = _residual_function(out_channels // 2)
+
+	def forward(self, x):
+		x1, x2 = torch.chunk(x, 2, dim=1)
+		y1 = x1 + self.F(x2)
+		y2 = x2 + self.G(y1)
+		# no relu after the addition since it would make the block not invertible
+		return torch.cat([y1, y2], dim=1)
+
+	def backward_pass(self, y, grad_y):
+		# reconstructs the input of the block from its output and computes the gradients, the gradients of the weights
+		# of F and G are accumulated into .grad by the backward calls
+		y1, y2 = torch.chunk(y, 2, dim=1)
+		grad_y1, grad_y2 = torch.chunk(grad_y, 2, dim=1)
+
+		# the recomputation in train mode would update the bn running statistics a second time
+		with _keep_batch_norm_statistics(self.modules()):
+			with torch.enable_grad():
+				y1 = y1.detach().requires_grad_()
+				g_y1 = self.G(y1)
+				torch.autograd.backward(g_y1, grad_y2)
+
+			with torch.no_grad():
+				x2 = y2 - g_y1
+				# y1 is used by G and is an output, so its total gradient is the sum of both
+				grad_y1 = grad_y1 + y1.grad
+				del g_y1
+
+			with torch.enable_grad():
+				x2 = x2.detach().requires_grad_()
+				f_x2 = self.F(x2)
+				torch.autograd.backward(f_x2, grad_y1)
+
+			with torch.no_grad():
+				x1 = y1 - f_x2
+				grad_x2 = grad_y2 + x2.grad
+
+		return torch.cat([x1, x2], dim=1).detach(), torch.cat([grad_y1, grad_x2], dim=1)
+
+
+class _ReversibleFunction(torch.autograd.Function):
+	@staticmethod
+	def forward(ctx, x, blocks, *params):
+		# the parameters are only passed so that the output requires grad, the activations of the blocks are not stored
+		with torch.no_grad():
+			for block in blocks:
+				x = block(x)
+
+		ctx.blocks = blocks
+		# only the output of the last block is kept, everything before is reconstructed in the backward pass
+		ctx.save_for_backward(x)
+		return x
+
+	@staticmethod
+	def backward(ctx, grad_y):
+		(y,) = ctx.saved_tensors
+		for block in reversed(ctx.blocks):
+			y, grad_y = block.backward_pass(y, grad_y)
+
+		# the gradients of the parameters were already accumulated by the backward calls in backward_pass
+		return (grad_y, None) + (None,) * sum(1 for _ in ctx.blocks.parameters())
+
+
+class ReversibleSequential(nn.Sequential):
+	# runs a sequence of reversible blocks in a single autograd function so that the activation memory is the same no
+	# matter how many blocks there are
+	def forward(self, x):
+		if not (self.training and torch.is_grad_enabled()):
+			return super().forward(x)
+
+		return _ReversibleFunction.apply(x, self, *self.parameters())
@@ -1,10 +1,11 @@
+import torch
 from torch import nn
+from blocks.ResNetBlock import ZeroPadShortcut
 
 class SE_block(nn.Module):
 	def __init__(self, num_channels, reduction_ratio=16):
 		super().__init__()
 
-		self.avg_pool = nn.AdaptiveAvgPool2d((1,1))
 		self.se_operations = nn.Sequential(
 			# setting bias to False as we have down conv in ResNet
 			nn.Linear(
@@ -16,18 +17,28 @@ class SE_block(nn.Module):
 			),
 			nn.Sigmoid()
 		)
+		# the fused add has no int8 kernel, quantization_util sets this to False before tracing so the multiply and the
+		# add stay separate operations that are quantized (quantized.mul and quantized.add_relu)
+		self.fuse_residual = True
 		
 	
-	def forward(self, x):
-		batch_size, channels, _, _ =  x.size()
+	def forward(self, x, residual=None, branch_scale=1.0):
+		# the squeeze is a mean over the spatial dimensions, this gives (N, C) directly so the two linear layers are a
+		# single matmul each without any reshaping in between
+		y = self.se_operations(x.mean(dim=(2, 3)))
 
-		y = self.avg_pool(x).view(batch_size, channels)
-		y = self.se_operations(y).view(batch_size, channels, 1, 1)
+		# the scale broadcasts over the spatial dimensions, no expanded copy of it is needed
+		y = y[:, :, None, None]
+		if branch_scale != 1.0:
+			y = y * branch_scale
+		if residual is None:
+			return x * y
+		if not self.fuse_residual:
+			return x * y + residual
 
-		# performing final scaling dot product of what we have computed so far and the original feature_map values
-		# here we are expanding the output to match size of x which is out feature maps U in the papper, this is also important
-  		# the size will differ when going from one layer to the next and here we don't have to deal with it
-		return x * y.expand_as(x)
+		# scaling the feature maps U from the paper and adding the residual in one operation, this doesn't allocate the
+		# scaled feature maps as a separate tensor before the add
+		return torch.addcmul(residual, x, y)
 
 
 class SE_ResNetBlock(nn.Module):
@@ -55,6 +66,9 @@ class SE_ResNetBlock(nn.Module):
 
 		self.relu = nn.ReLU(inplace=True)
 
+		# stochastic depth, the probability that the residual branch is run in a training step (see ResNetBlock)
+		self.survival_prob = 1.0
+
 		# this is how define the identity just using the sequl
 		self.residual = nn.Sequential()
 
@@ -65,8 +79,7 @@ class SE_ResNetBlock(nn.Module):
 		# as the out_channel indicating that we are not in the same layer
 		if stride != 1 or in_channels != out_channels:
 			if option == "A":
-				# self.residual =
-				raise ValueError("Not implemented")
+				self.residual = ZeroPadShortcut(in_channels, out_channels * self.expansion, stride)
 			elif option == "B":
 				# here we use a 1x1 conv to match the dimension but we also have to add a batch normalization since this is a conv layer
 				# note how we reduce the output depth here
@@ -86,6 +99,9 @@ class SE_ResNetBlock(nn.Module):
 	def forward(self, x):
 		identity = x
 
+		if self.training and self.survival_prob < 1.0 and torch.rand(1).item() >= self.survival_prob:
+			return torch.relu(self.residual(identity))
+
 		x = self.conv_1(x)
 		x = self.bn_1(x)
 		x = self.relu(x)
@@ -93,10 +109,11 @@ class SE_ResNetBlock(nn.Module):
 		x = self.conv_2(x)
 		x = self.bn_2(x)
 		
-		x = self.se_layer(x)
-
-		# add residual connection this happen before second activation as described in the paper
-		x = x + self.residual(identity)
+		# the se scaling and the residual connection are done together, this happen before second activation as
+		# described in the paper
+		# at inference the branch is scaled with its survival probability, this is folded into the se scale
+		branch_scale = self.survival_prob if not self.training else 1.0
+		x = self.se_layer(x, self.residual(identity), branch_scale)
 
 		x = self.relu(x)
 		return x
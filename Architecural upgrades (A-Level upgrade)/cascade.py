@@ -0,0 +1,207 @@
+import itertools
+import time
+
+import torch
+from torch import nn
+import torch.nn.functional as F
+from torch.utils.data import DataLoader, Subset
+
+import model
+from fuse_inference import fuse_for_inference
+from ResNet import device, test_transformations
+
+import sys
+
+sys.path.append("../")
+from helpers import utils
+from helpers import load_data_util as ldu
+from helpers import benchmark_util
+
+# setting batch size at test time to be 100 have division since we have 10k images at test time
+test_batch_size = 100
+
+
+def margin(logits, temperature=1.0):
+	# the difference between the two largest softmax probabilities, a small margin means the model can't decide between
+	# two classes which is where a bigger model helps the most
+	top2 = (logits / temperature).softmax(dim=1).topk(2, dim=1).values
+	return top2[:, 0] - top2[:, 1]
+
+
+def fit_temperature(logits, labels, max_iter=50):
+	# temperature scaling (Guo et al.), a single scalar per model fitted on held out images so the softmax probabilities
+	# match how often the model is right. the argmax doesn't change, but the margins of the models become comparable
+	log_temperature = torch.zeros(1, requires_grad=True)
+	optimizer = torch.optim.LBFGS([log_temperature], lr=0.1, max_iter=max_iter)
+
+	def closure():
+		optimizer.zero_grad()
+		loss = F.cross_entropy(logits / log_temperature.exp(), labels)
+		loss.backward()
+		return loss
+
+	optimizer.step(closure)
+	return log_temperature.exp().item()
+
+
+class CascadePredictor(nn.Module):
+	# runs the cheapest model on the whole batch, the images with a calibrated margin below the threshold are gathered and
+	# run through the next model and its logits are scattered back into the output. everything stays on the device, the
+	# only sync is reading the number of escalated images, which is needed to know the size of the smaller batch
+	def __init__(self, models, temperatures, thresholds):
+		super().__init__()
+		assert len(temperatures) == len(models) and len(thresholds) == len(models) - 1
+		self.models = nn.ModuleList(models)
+		self.temperatures = temperatures
+		self.thresholds = thresholds
+
+	def forward(self, X):
+		logits = self.models[0](X)
+		margins = margin(logits, self.temperatures[0])
+		# the position in the original batch of the images the current model has seen
+		positions = torch.arange(X.size(0), device=X.device)
+
+		for next_model, temperature, threshold in zip(self.models[1:], self.temperatures[1:], self.thresholds):
+			escalate = (margins < threshold).nonzero().squeeze(1)
+			if escalate.numel() == 0:
+				break
+
+			positions = positions.index_select(0, escalate)
+			X = X.index_select(0, escalate)
+			next_logits = next_model(X)
+			logits.index_copy_(0, positions, next_logits.to(logits.dtype))
+			margins = margin(next_logits, temperature)
+
+		return logits
+
+
+def collect_logits(models, dataloader):
+	# the logits of every model for the whole dataloader, (num_models, N, num_classes)
+	all_logits, labels = [[] for _ in models], []
+	with torch.inference_mode():
+		for X, y in dataloader:
+			X = X.to(device)
+			for logits, m in zip(all_logits, models):
+				m.eval()
+				logits.append(m(X).float().cpu())
+			labels.append(y)
+	return torch.stack([torch.cat(logits) for logits in all_logits]), torch.cat(labels)
+
+
+def simulate_cascade(margins, correct, latencies, thresholds):
+	# the accuracy and the mean latency per image of the cascade, from the margins and predictions of every model on
+	# every image. this makes the same decisions as CascadePredictor
+	num_models, num_images = correct.shape
+	decided_by = torch.full((num_images,), num_models - 1, dtype=torch.long)
+	undecided = torch.ones(num_images, dtype=torch.bool)
+	latency = torch.full((num_images,), latencies[0], dtype=torch.float64)
+
+	for stage, threshold in enumerate(thresholds):
+		confident = margins[stage] >= threshold
+		decided_by[undecided & confident] = stage
+		undecided &= ~confident
+		latency += undecided * latencies[stage + 1]
+
+	accuracy = correct.gather(0, decided_by.unsqueeze(0)).double().mean().item()
+	return accuracy, latency.mean().item()
+
+
+def choose_thresholds(logits, labels, temperatures, latencies, target_accuracy, num_candidates=50):
+	# grid search over the thresholds of every stage, the candidates are quantiles of the calibrated margins plus 0 (never
+	# escalate) and inf (always escalate). returns the thresholds with the lowest mean latency that reach the target
+	# accuracy, if no thresholds reach it the most accurate ones are returned
+	margins = torch.stack([margin(l, t) for l, t in zip(logits, temperatures)])
+	correct = logits.argmax(dim=2) == labels
+
+	quantiles = torch.linspace(0, 1, num_candidates)
+	candidates = [
+		[0.0] + margins[stage].quantile(quantiles).tolist() + [float("inf")] for stage in range(len(logits) - 1)
+	]
+
+	best, most_accurate = None, None
+	for thresholds in itertools.product(*candidates):
+		accuracy, latency = simulate_cascade(margins, correct, latencies, thresholds)
+		if most_accurate is None or (accuracy, -latency) > (most_accurate[1], -most_accurate[2]):
+			most_accurate = (list(thresholds), accuracy, latency)
+		if accuracy >= target_accuracy and (best is None or (latency, -accuracy) < (best[2], -best[1])):
+			best = (list(thresholds), accuracy, latency)
+
+	if best is None:
+		print(f"no thresholds reach an accuracy of {(100*target_accuracy):>0.2f}%, using the most accurate ones")
+		return most_accurate
+	return best
+
+
+if __name__ == "__main__":
+	print(f"Using {device} device")
+
+	# if true use cifar 10 dataset otherwise cifar 100 data set is used
+	use_Cifar10 = True
+	# from the cheapest to the most expensive model
+	model_names = ["resnet20", "resnet56", "resnet110"]
+	# the thresholds are chosen for every target accuracy, None uses the accuracy of every model but the first
+	target_accuracies = None
+
+	if use_Cifar10 is True:
+		print("Dataset is CIFAR10")
+		test_dataloader = ldu.load_CIFAR10_test(test_batch_size, test_transformations)
+		num_classes = 10
+	else:
+		print("Dataset is CIFAR100")
+		test_dataloader = ldu.load_CIFAR100_test(test_batch_size, test_transformations)
+		num_classes = 100
+
+	# the validation split of load_CIFAR10_train_validation is sampled again in every run, so its images were most likely
+	# in the training set of the checkpoints and the models would look far too confident on it. the test set is split in
+	# two halves instead, the temperatures and thresholds are chosen on the first and reported on the second
+	test_dataset = test_dataloader.dataset
+	half = len(test_dataset) // 2
+	calibration_dataloader = DataLoader(Subset(test_dataset, range(half)), test_batch_size)
+	report_dataloader = DataLoader(Subset(test_dataset, range(half, len(test_dataset))), test_batch_size)
+
+	resnets = []
+	for name in model_names:
+		resnet = getattr(model, name)(num_classes).to(device)
+		utils.load_model(resnet, f"{name}_cifar{num_classes}", device, required=True)
+		resnets.append(fuse_for_inference(resnet).to(device))
+
+	# the latency per image at the test batch size, the escalated images are also run as a batch
+	example_batch = torch.randn(test_batch_size, 3, 32, 32, device=device)
+	latencies = [benchmark_util.measure_latency(resnet, example_batch) / test_batch_size for resnet in resnets]
+
+	calibration_logits, calibration_labels = collect_logits(resnets, calibration_dataloader)
+	temperatures = [fit_temperature(logits, calibration_labels) for logits in calibration_logits]
+	report_logits, report_labels = collect_logits(resnets, report_dataloader)
+	report_margins = torch.stack([margin(l, t) for l, t in zip(report_logits, temperatures)])
+	report_correct = report_logits.argmax(dim=2) == report_labels
+
+	print("------------- single models on the report half -----------------")
+	for name, latency, temperature, correct in zip(model_names, latencies, temperatures, report_correct):
+		print(
+			f"{name:>10}: accuracy {(100*correct.double().mean().item()):>0.2f}%, "
+			f"{1000*latency:.3f} ms / image, temperature {temperature:.2f}"
+		)
+
+	if target_accuracies is None:
+		target_accuracies = (calibration_logits[1:].argmax(dim=2) == calibration_labels).double().mean(dim=1).tolist()
+
+	print("------------- cascade -----------------")
+	for target_accuracy in target_accuracies:
+		thresholds, calibration_accuracy, calibration_latency = choose_thresholds(
+			calibration_logits, calibration_labels, temperatures, latencies, target_accuracy
+		)
+		accuracy, latency = simulate_cascade(report_margins, report_correct, latencies, thresholds)
+
+		# the simulated latency doesn't include gathering and scattering the escalated images, so the cascade also runs
+		cascade = CascadePredictor(resnets, temperatures, thresholds)
+		start = time.perf_counter()
+		measured_accuracy = utils.compute_accuracy_on_whole_dataloader(cascade, report_dataloader, device)
+		benchmark_util.synchronize(device)
+		measured_latency = (time.perf_counter() - start) / len(report_dataloader.dataset)
+
+		print(
+			f"target {(100*target_accuracy):>0.2f}%: thresholds {', '.join(f'{t:.3f}' for t in thresholds)}, "
+			f"calibration {(100*calibration_accuracy):>0.2f}% at {1000*calibration_latency:.3f} ms / image, "
+			f"report {(100*accuracy):>0.2f}% at {1000*latency:.3f} ms / image "
+			f"(measured {(100*measured_accuracy):>0.2f}% at {1000*measured_latency:.3f} ms / image with data loading)"
+		)
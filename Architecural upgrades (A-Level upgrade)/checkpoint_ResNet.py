@@ -0,0 +1,81 @@
+import functools
+
+import torch
+from torch import nn
+
+import model
+
+import sys
+
+sys.path.append("../")
+from helpers import benchmark_util
+
+num_classes = 10
+
+
+def check_checkpointing(name, checkpoint_policy, batch_size=16):
+    # the checkpointed model has to give the same gradients and batch norm statistics as the normal model
+    torch.manual_seed(0)
+    resnet = getattr(model, name)(num_classes)
+    checkpointed_resnet = getattr(model, name)(
+        num_classes, checkpoint_policy=checkpoint_policy
+    )
+    checkpointed_resnet.load_state_dict(resnet.state_dict())
+
+    X = torch.randn(batch_size, 3, 32, 32)
+    y = torch.randint(0, num_classes, (batch_size,))
+    for m in (resnet, checkpointed_resnet):
+        m.train()
+        nn.functional.cross_entropy(m(X), y).backward()
+
+    # the patchify parameters are not used when use_ViT is false so they have no gradient
+    max_grad_difference = max(
+        (p.grad - q.grad).abs().max().item()
+        for p, q in zip(resnet.parameters(), checkpointed_resnet.parameters())
+        if p.grad is not None
+    )
+    max_buffer_difference = max(
+        (a.float() - b.float()).abs().max().item()
+        for a, b in zip(resnet.buffers(), checkpointed_resnet.buffers())
+    )
+    return max_grad_difference, max_buffer_difference
+
+
+if __name__ == "__main__":
+    # the memory is measured as the peak resident memory of a fresh process for every policy
+    device = "cpu"
+    print(f"Using {device} device")
+
+    name = "resnet110"
+    checkpoint_policies = [None, "stage", 9, 6, 3, 1]
+    batch_sizes = [128, 256]
+
+    for checkpoint_policy in checkpoint_policies[1:]:
+        max_grad_difference, max_buffer_difference = check_checkpointing(
+            name, checkpoint_policy
+        )
+        print(
+            f"checkpoint policy {checkpoint_policy}: max gradient difference {max_grad_difference:.2e}, "
+            f"max batch norm statistics difference {max_buffer_difference:.2e}"
+        )
+
+    for batch_size in batch_sizes:
+        print(f"------------- {name}, batch size {batch_size} -----------------")
+        baseline_memory = None
+        for checkpoint_policy in checkpoint_policies:
+            memory, images_per_second = benchmark_util.measure_training_memory(
+                functools.partial(
+                    getattr(model, name),
+                    num_classes,
+                    checkpoint_policy=checkpoint_policy,
+                ),
+                batch_size,
+                num_classes,
+            )
+
+            if baseline_memory is None:
+                baseline_memory, baseline_images_per_second = memory, images_per_second
+            print(
+                f"checkpoint policy {str(checkpoint_policy):>5}: training memory {memory:7.0f} MB ({memory / baseline_memory:.2f}x), "
+                f"{images_per_second:6.1f} img/s ({images_per_second / baseline_images_per_second:.2f}x)"
+            )
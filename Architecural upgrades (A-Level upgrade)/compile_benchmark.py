@@ -0,0 +1,83 @@
+import time
+
+import torch
+from torch import nn
+
+import model
+
+import sys
+
+sys.path.append("../")
+from baseline.VGG1 import VGG1
+from helpers import benchmark_util
+from helpers import compile_util
+
+
+def eager_train_step(vgg_or_resnet, loss_fn, optimizer):
+    def step(X, y):
+        training_loss = loss_fn(vgg_or_resnet(X), y)
+        optimizer.zero_grad()
+        training_loss.backward()
+        optimizer.step()
+
+    return step
+
+
+def steps_per_second(step, X, y, num_steps, num_warmup_steps=2):
+    # the warmup steps include the compilation so they are timed on their own, the compiled train step runs the very
+    # first optimizer step eagerly and compiles the optimizer step in the second one
+    start = time.perf_counter()
+    for _ in range(num_warmup_steps):
+        step(X, y)
+    benchmark_util.synchronize(X.device)
+    warmup_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(num_steps):
+        step(X, y)
+    benchmark_util.synchronize(X.device)
+
+    return num_steps / (time.perf_counter() - start), warmup_time
+
+
+if __name__ == "__main__":
+    device = "cpu"
+    print(f"Using {device} device")
+
+    num_steps = 50
+
+    # running the script a second time shows how much of the warmup time is saved by the cache
+    compile_util.enable_compile_cache()
+
+    for name, build_model, batch_size in [
+        ("resnet20", lambda: model.resnet20(10), 128),
+        ("VGG1", VGG1, 64),
+    ]:
+        X = torch.randn(batch_size, 3, 32, 32, device=device)
+        y = torch.randint(0, 10, (batch_size,), device=device)
+        loss_fn = nn.CrossEntropyLoss()
+
+        results = {}
+        for mode in ["eager", "compiled"]:
+            # same initial weights for both modes
+            torch.manual_seed(0)
+            benchmark_model = build_model().to(device).train()
+            optimizer = torch.optim.SGD(
+                benchmark_model.parameters(), lr=0.1, momentum=0.9, weight_decay=0.0001
+            )
+
+            if mode == "eager":
+                step = eager_train_step(benchmark_model, loss_fn, optimizer)
+            else:
+                step = compile_util.CompiledTrainStep(
+                    benchmark_model, loss_fn, optimizer
+                )
+
+            results[mode] = steps_per_second(step, X, y, num_steps)
+
+        eager_steps, eager_warmup = results["eager"]
+        compiled_steps, compiled_warmup = results["compiled"]
+        print(
+            f"{name} (batch size {batch_size}): eager {eager_steps:.2f} steps/s, compiled {compiled_steps:.2f} steps/s "
+            f"({compiled_steps / eager_steps:.2f}x), warmup eager {eager_warmup:.2f} s, compiled {compiled_warmup:.2f} s"
+        )
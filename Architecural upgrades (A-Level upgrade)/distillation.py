@@ -0,0 +1,233 @@
+import os
+
+import torch
+from torch import nn
+import torch.nn.functional as F
+from torch.utils.data import DataLoader, Dataset, Subset
+
+import model
+from ResNet import he_initalization, train_transformations, test_transformations
+from sophisticated_data_augmentations_ResNet import device, train
+
+import sys
+
+sys.path.append("../")
+from helpers import utils
+from helpers import load_data_util as ldu
+
+# this is the same as the ResNet paper
+train_batch_size = 128
+
+# setting batch size at test time to be 100 have division since we have 10k images at test time
+test_batch_size = 100
+
+
+def _pack_target(teacher_logits, y):
+	# the train loop only moves X and y to the device and passes y to the loss, so the teacher logits are sent together
+	# with the label in a single tensor, the last column is the label
+	return torch.cat([teacher_logits.float(), y.float().unsqueeze(-1)], dim=-1)
+
+
+class DistillationLoss(nn.Module):
+	def __init__(self, temperature=4.0, alpha=0.9, label_smoothing=0.0):
+		super().__init__()
+		self.temperature = temperature
+		self.alpha = alpha
+		self.label_smoothing = label_smoothing
+
+	def forward(self, pred, y):
+		# plain labels, this happens when the train loop computes the loss on the unmodified dataloaders
+		if y.dim() == 1:
+			return F.cross_entropy(pred, y, label_smoothing=self.label_smoothing)
+
+		teacher_logits, y = y[:, :-1], y[:, -1].long()
+
+		ce_loss = F.cross_entropy(pred, y, label_smoothing=self.label_smoothing)
+
+		# KL between the softened distributions, multiplied with T^2 so the gradients have the same scale as the CE as
+		# described in the Hinton et al. paper
+		kd_loss = F.kl_div(
+			F.log_softmax(pred / self.temperature, dim=1),
+			F.log_softmax(teacher_logits / self.temperature, dim=1),
+			reduction="batchmean",
+			log_target=True,
+		) * (self.temperature**2)
+
+		return self.alpha * kd_loss + (1 - self.alpha) * ce_loss
+
+
+class TeacherLogitsLoader:
+	# computes the teacher logits on the fly for every batch of the wrapped dataloader
+	def __init__(self, dataloader, teacher, device):
+		self.dataloader = dataloader
+		self.teacher = teacher
+		self.device = device
+
+	def __len__(self):
+		return len(self.dataloader)
+
+	def __iter__(self):
+		self.teacher.eval()
+		for X, y in self.dataloader:
+			X, y = X.to(self.device), y.to(self.device)
+
+			with torch.inference_mode():
+				teacher_logits = self.teacher(X)
+
+			# packing outside of inference mode so the target is a normal tensor which autograd is allowed to save
+			yield X, _pack_target(teacher_logits, y)
+
+
+class SeededViewDataset(Dataset):
+	# every (view, index) pair gets its own seed, so the random augmentations of an image are the same every time the
+	# same view is requested, this is what lets us compute the teacher logits once and reuse them in later epochs
+	def __init__(self, dataset, teacher_logits=None):
+		self.dataset = dataset
+		self.teacher_logits = teacher_logits
+		self.view = 0
+
+	def __len__(self):
+		return len(self.dataset)
+
+	def __getitem__(self, index):
+		with torch.random.fork_rng(devices=[]):
+			torch.manual_seed(self.view * len(self.dataset) + index)
+			X, y = self.dataset[index]
+
+		if self.teacher_logits is None:
+			return X, y
+		return X, _pack_target(self.teacher_logits[self.view, index], torch.tensor(y))
+
+
+def build_teacher_logits_cache(teacher, dataset, num_views, batch_size, device):
+	# the cache is built over the whole dataset and not the training subset, the indices of the validation split
+	# are random for each run but the cache can still be reused since it's aligned to the original dataset indices
+	seeded_dataset = SeededViewDataset(dataset)
+	teacher.eval()
+
+	teacher_logits = None
+	with torch.inference_mode():
+		for view in range(num_views):
+			print(f"computing teacher logits for view {view}")
+			seeded_dataset.view = view
+			dataloader = DataLoader(seeded_dataset, batch_size, shuffle=False, num_workers=2)
+
+			start = 0
+			for X, _ in dataloader:
+				logits = teacher(X.to(device)).cpu()
+				if teacher_logits is None:
+					# half precision is enough for logits and halves the memory of the cache
+					teacher_logits = torch.empty(
+						num_views, len(dataset), logits.size(1), dtype=torch.float16
+					)
+				teacher_logits[view, start : start + len(X)] = logits
+				start += len(X)
+
+	return teacher_logits
+
+
+class CachedTeacherLogitsLoader:
+	# iterates the training subset with the augmentations that were used when building the cache, each epoch moves
+	# to the next view so the student sees num_views different augmentations of every image
+	def __init__(self, training_subset, teacher_logits, batch_size):
+		self.seeded_dataset = SeededViewDataset(training_subset.dataset, teacher_logits)
+		self.num_views = teacher_logits.size(0)
+		self.epoch = 0
+		self.dataloader = DataLoader(
+			Subset(self.seeded_dataset, training_subset.indices),
+			batch_size,
+			shuffle=True,
+			num_workers=2,
+		)
+
+	def __len__(self):
+		return len(self.dataloader)
+
+	def __iter__(self):
+		# the workers get a copy of the dataset when the iterator is created so the view has to be set before that
+		self.seeded_dataset.view = self.epoch % self.num_views
+		self.epoch += 1
+		return iter(self.dataloader)
+
+
+if __name__ == "__main__":
+	print(f"Using {device} device")
+
+	validation_set_size = 5000
+
+	# if true use cifar 10 dataset otherwise cifar 100 data set is used
+	use_Cifar10 = True
+	# if true the teacher logits are computed once for num_views augmentations and reused, otherwise the teacher
+	# runs on every batch
+	use_logit_cache = True
+	num_views = 10
+	num_epochs_to_train = 200
+	teacher_name = "sophisticated_resnet110"
+	student_name = "resnet20"
+
+	if use_Cifar10 is True:
+		print("Dataset is CIFAR10")
+		validation_loader, training_dataloader = ldu.load_CIFAR10_train_validation(
+			train_batch_size, train_transformations, validation_set_size
+		)
+		test_dataloader = ldu.load_CIFAR10_test(test_batch_size, test_transformations)
+		num_classes = 10
+	else:
+		print("Dataset is CIFAR100")
+		validation_loader, training_dataloader = ldu.load_CIFAR100_train_validation(
+			train_batch_size, train_transformations, validation_set_size
+		)
+		test_dataloader = ldu.load_CIFAR100_test(test_batch_size, test_transformations)
+		num_classes = 100
+
+	# the teacher is frozen, only the student is trained
+	teacher = model.resnet110(num_classes).to(device)
+	utils.load_model(teacher, f"{teacher_name}_cifar{num_classes}", device, required=True)
+	teacher.eval()
+	for param in teacher.parameters():
+		param.requires_grad = False
+
+	student = getattr(model, student_name)(num_classes).to(device)
+	student.apply(he_initalization)
+
+	if use_logit_cache is True:
+		cache_path = f"checkpoints/{teacher_name}_cifar{num_classes}_logits_{num_views}_views.pt"
+		if os.path.exists(cache_path):
+			teacher_logits = torch.load(cache_path)
+		else:
+			teacher_logits = build_teacher_logits_cache(
+				teacher, training_dataloader.dataset.dataset, num_views, test_batch_size, device
+			)
+			os.makedirs("checkpoints", exist_ok=True)
+			torch.save(teacher_logits, cache_path)
+
+		distillation_dataloader = CachedTeacherLogitsLoader(
+			training_dataloader.dataset, teacher_logits, train_batch_size
+		)
+	else:
+		distillation_dataloader = TeacherLogitsLoader(training_dataloader, teacher, device)
+
+	loss_fn = DistillationLoss(temperature=4.0, alpha=0.9)
+
+	print(f"------------- distilling {teacher_name} into {student_name} -----------------")
+	optimizer = torch.optim.SGD(
+		student.parameters(), lr=0.1, momentum=0.9, weight_decay=0.0001
+	)
+	lr_scheduler = torch.optim.lr_scheduler.MultiStepLR(
+		optimizer, [100, 150], gamma=0.1
+	)
+	# the metrics are computed on the normal dataloaders, the loss then falls back to plain cross entropy
+	train(
+		num_epochs_to_train,
+		distillation_dataloader,
+		validation_loader,
+		training_dataloader,
+		student,
+		loss_fn,
+		optimizer,
+		lr_scheduler,
+	)
+	utils.evaluate(student, test_dataloader, loss_fn, device)
+	utils.save_model(student, f"distilled_{student_name}_cifar{num_classes}")
+	utils.plot_training_validation_loss_and_accuracy()
+	utils.clear_histogram()
@@ -0,0 +1,266 @@
+import time
+
+import torch
+from torch import nn
+
+import model
+from fuse_inference import fuse_for_inference
+from ResNet import device, he_initalization, train_transformations, test_transformations
+
+import sys
+
+sys.path.append("../")
+from helpers import utils
+from helpers import load_data_util as ldu
+from helpers import benchmark_util
+
+# this is the same as the ResNet paper
+train_batch_size = 128
+
+# setting batch size at test time to be 100 have division since we have 10k images at test time
+test_batch_size = 100
+
+
+def exit_macs(resnet, input_size=(3, 32, 32)):
+    # the MACs per image to reach every exit, an image that leaves at the last exit has also run the two early heads
+    stage_macs = [0, 0, 0]
+
+    def exit_of(name):
+        if name.startswith("exit_heads."):
+            return int(name.split(".")[1])
+        if name.startswith("layer2"):
+            return 1
+        if name.startswith("layer3") or name.startswith("classifier"):
+            return 2
+        # the stem and layer1
+        return 0
+
+    def count_hook(name, module, inputs, output):
+        stage_macs[exit_of(name)] += benchmark_util.module_macs(module, output)
+
+    handles = [
+        m.register_forward_hook(
+            lambda module, inputs, output, name=name: count_hook(
+                name, module, inputs, output
+            )
+        )
+        for name, m in resnet.named_modules()
+        if isinstance(m, (nn.Conv2d, nn.Linear))
+    ]
+
+    resnet.eval()
+    with torch.inference_mode():
+        resnet.forward_exits(
+            torch.zeros(1, *input_size, device=next(resnet.parameters()).device)
+        )
+
+    for handle in handles:
+        handle.remove()
+
+    return [sum(stage_macs[: i + 1]) for i in range(len(stage_macs))]
+
+
+def collect_exit_logits(resnet, dataloader):
+    # the logits of all exits for the whole dataloader, computing them once is enough to evaluate every threshold
+    resnet.eval()
+    exit_logits, labels = [], []
+    with torch.inference_mode():
+        for X, y in dataloader:
+            exit_logits.append(torch.stack(resnet.forward_exits(X.to(device))).cpu())
+            labels.append(y)
+    return torch.cat(exit_logits, dim=1), torch.cat(labels)
+
+
+def accuracy_flops_curve(exit_logits, labels, macs_per_exit, thresholds):
+    # every image leaves at the first exit where the softmax confidence is at least the threshold, this is the same
+    # decision forward_early_exit makes
+    confidence, prediction = exit_logits.softmax(dim=2).max(dim=2)
+    num_exits = exit_logits.size(0)
+    macs_per_exit = torch.tensor(macs_per_exit, dtype=torch.float64)
+
+    curve = []
+    for threshold in thresholds:
+        confident = confidence >= threshold
+        # the last exit always takes the images that are left
+        confident[-1] = True
+        exit_index = confident.long().argmax(dim=0)
+
+        chosen_prediction = prediction.gather(0, exit_index.unsqueeze(0)).squeeze(0)
+        accuracy = (chosen_prediction == labels).double().mean().item()
+        average_macs = macs_per_exit[exit_index].mean().item()
+        exit_fractions = torch.bincount(exit_index, minlength=num_exits) / len(labels)
+        curve.append((threshold, accuracy, average_macs, exit_fractions.tolist()))
+    return curve
+
+
+def train_exits(
+    epochs,
+    training_dataloader,
+    validation_dataloader,
+    resnet,
+    optimizer,
+    lr_scheduler,
+    exit_weights,
+    train_backbone,
+):
+    # the loss is a weighted sum of the cross entropy of every exit. when the backbone is not trained it is kept in eval
+    # mode so the bn statistics of the trained model don't change and only the heads get gradients
+    loss_fn = nn.CrossEntropyLoss()
+
+    for current_epoch in range(0, epochs):
+        print(f"current epoch: {current_epoch}")
+
+        for X, y in training_dataloader:
+            if train_backbone is True:
+                resnet.train()
+            else:
+                resnet.eval()
+                resnet.exit_heads.train()
+
+            X, y = X.to(device), y.to(device)
+
+            training_loss = sum(
+                weight * loss_fn(exit_pred, y)
+                for weight, exit_pred in zip(exit_weights, resnet.forward_exits(X))
+            )
+
+            optimizer.zero_grad()
+            training_loss.backward()
+            optimizer.step()
+
+        exit_logits, labels = collect_exit_logits(resnet, validation_dataloader)
+        exit_accuracies = (exit_logits.argmax(dim=2) == labels).double().mean(dim=1)
+        print(
+            f"Epoch: {current_epoch}, Loss: {training_loss.item():.4f}, validation accuracy per exit: "
+            + ", ".join(f"{(100*accuracy):>0.2f}%" for accuracy in exit_accuracies)
+        )
+        lr_scheduler.step()
+
+    print("training finished")
+
+
+def early_exit_wall_clock(resnet, dataloader, threshold):
+    # seconds for the whole dataloader with the adaptive inference, the images that don't leave early are run through
+    # the deeper stages as one smaller batch
+    resnet.eval()
+    num_correct = 0
+    with torch.inference_mode():
+        start = time.perf_counter()
+        for X, y in dataloader:
+            logits, _ = resnet.forward_early_exit(X, threshold)
+            num_correct += (logits.argmax(1) == y).sum().item()
+        seconds = time.perf_counter() - start
+    return seconds, num_correct / len(dataloader.dataset)
+
+
+if __name__ == "__main__":
+    print(f"Using {device} device")
+
+    validation_set_size = 5000
+
+    # if true use cifar 10 dataset otherwise cifar 100 data set is used
+    use_Cifar10 = True
+    model_name = "resnet56"
+    # if true the backbone and the heads are trained together from scratch, otherwise the heads are trained on top of
+    # the trained model (which is not changed)
+    train_jointly = False
+    num_epochs_to_train = 200 if train_jointly else 30
+    # the weight of the layer1, layer2 and final exit in the loss, only the first two matter when training post hoc
+    exit_weights = [1.0, 1.0, 1.0]
+    thresholds = [0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99, 0.999, 1.01]
+
+    if use_Cifar10 is True:
+        print("Dataset is CIFAR10")
+        validation_loader, training_dataloader = ldu.load_CIFAR10_train_validation(
+            train_batch_size, train_transformations, validation_set_size
+        )
+        test_dataloader = ldu.load_CIFAR10_test(test_batch_size, test_transformations)
+        num_classes = 10
+    else:
+        print("Dataset is CIFAR100")
+        validation_loader, training_dataloader = ldu.load_CIFAR100_train_validation(
+            train_batch_size, train_transformations, validation_set_size
+        )
+        test_dataloader = ldu.load_CIFAR100_test(test_batch_size, test_transformations)
+        num_classes = 100
+
+    resnet = getattr(model, model_name)(num_classes, early_exits=True).to(device)
+    checkpoint_name = (
+        f"early_exit_{model_name}{'_joint' if train_jointly else ''}_cifar{num_classes}"
+    )
+
+    if utils.load_model(resnet, checkpoint_name, device) is False:
+        if train_jointly is True:
+            resnet.apply(he_initalization)
+            parameters = resnet.parameters()
+            lr_milestones = [100, 150]
+        else:
+            # the trained model has no exit heads, those are the only missing weights
+            backbone = getattr(model, model_name)(num_classes).to(device)
+            utils.load_model(
+                backbone, f"{model_name}_cifar{num_classes}", device, required=True
+            )
+            missing_keys, _ = resnet.load_state_dict(
+                backbone.state_dict(), strict=False
+            )
+            assert all(key.startswith("exit_heads.") for key in missing_keys)
+
+            for param in resnet.parameters():
+                param.requires_grad = False
+            for param in resnet.exit_heads.parameters():
+                param.requires_grad = True
+            parameters = resnet.exit_heads.parameters()
+            lr_milestones = [15, 25]
+
+        print(f"------------- training the exits of {model_name} -----------------")
+        optimizer = torch.optim.SGD(
+            parameters, lr=0.1, momentum=0.9, weight_decay=0.0001
+        )
+        lr_scheduler = torch.optim.lr_scheduler.MultiStepLR(
+            optimizer, lr_milestones, gamma=0.1
+        )
+        train_exits(
+            num_epochs_to_train,
+            training_dataloader,
+            validation_loader,
+            resnet,
+            optimizer,
+            lr_scheduler,
+            exit_weights,
+            train_jointly,
+        )
+        utils.save_model(resnet, checkpoint_name)
+
+    macs_per_exit = exit_macs(resnet)
+    print(
+        "MMACs per image to reach the exits: "
+        + ", ".join(f"{macs / 1e6:.2f}" for macs in macs_per_exit)
+    )
+
+    # the thresholds are evaluated on the test set from the logits of all exits, a threshold above 1 never exits early
+    exit_logits, labels = collect_exit_logits(resnet, test_dataloader)
+    print(f"------------- accuracy vs average MACs of {model_name} -----------------")
+    for threshold, accuracy, average_macs, exit_fractions in accuracy_flops_curve(
+        exit_logits, labels, macs_per_exit, thresholds
+    ):
+        print(
+            f"threshold {threshold:>5}: accuracy {(100*accuracy):>0.2f}%, {average_macs / 1e6:6.2f} MMACs / image "
+            f"({macs_per_exit[-1] / average_macs:.2f}x less), exits "
+            + " / ".join(f"{(100*fraction):>5.1f}%" for fraction in exit_fractions)
+        )
+
+    # the MACs don't count the cost of splitting the batch, so the adaptive inference is also timed on the cpu
+    print(f"------------- cpu wall clock on the test set -----------------")
+    fused_resnet = fuse_for_inference(resnet).to("cpu")
+    start = time.perf_counter()
+    utils.compute_accuracy_on_whole_dataloader(fused_resnet, test_dataloader, "cpu")
+    full_seconds = time.perf_counter() - start
+    print(f"without early exits: {full_seconds:.2f} s")
+    for threshold in [0.9, 0.99]:
+        seconds, accuracy = early_exit_wall_clock(
+            fused_resnet, test_dataloader, threshold
+        )
+        print(
+            f"threshold {threshold}: {seconds:.2f} s ({full_seconds / seconds:.2f}x faster), "
+            f"accuracy {(100*accuracy):>0.2f}%"
+        )
@@ -0,0 +1,131 @@
+import time
+
+import torch
+from torch import nn
+
+import model
+from ResNet import (
+    device,
+    he_initalization,
+    train,
+    train_transformations,
+    test_transformations,
+)
+
+import sys
+
+sys.path.append("../")
+from helpers import utils
+from helpers import load_data_util as ldu
+from helpers import benchmark_util
+from helpers import ema_util
+
+# this is the same as the ResNet paper
+train_batch_size = 128
+
+# setting batch size at test time to be 100 have division since we have 10k images at test time
+test_batch_size = 100
+
+
+def seconds_per_ema_step(ema, num_steps=200, num_warmup_steps=20):
+    # the average time ema.step() adds to a training step, only every update_every-th call does the update
+    for step in range(num_warmup_steps + num_steps):
+        if step == num_warmup_steps:
+            benchmark_util.synchronize(device)
+            start = time.perf_counter()
+        ema.step()
+    benchmark_util.synchronize(device)
+    return (time.perf_counter() - start) / num_steps
+
+
+if __name__ == "__main__":
+    print(f"Using {device} device")
+
+    validation_set_size = 5000
+
+    # if true use cifar 10 dataset otherwise cifar 100 data set is used
+    use_Cifar10 = True
+    model_name = "resnet56"
+    ema_decay = 0.999
+    # the average is updated every ema_update_every steps with ema_decay ** ema_update_every
+    ema_update_every = 4
+    # "average": the bn running statistics are averaged like the weights, "raw": the ones of the model are used
+    ema_bn_buffers = "average"
+    # if true the bn statistics of the ema weights are computed with a pass over the training data after training
+    recompute_bn_statistics = False
+    num_epochs_to_train = 200
+
+    if use_Cifar10 is True:
+        print("Dataset is CIFAR10")
+        validation_loader, training_dataloader = ldu.load_CIFAR10_train_validation(
+            train_batch_size, train_transformations, validation_set_size
+        )
+        test_dataloader = ldu.load_CIFAR10_test(test_batch_size, test_transformations)
+        num_classes = 10
+    else:
+        print("Dataset is CIFAR100")
+        validation_loader, training_dataloader = ldu.load_CIFAR100_train_validation(
+            train_batch_size, train_transformations, validation_set_size
+        )
+        test_dataloader = ldu.load_CIFAR100_test(test_batch_size, test_transformations)
+        num_classes = 100
+
+    resnet = getattr(model, model_name)(num_classes).to(device)
+    resnet.apply(he_initalization)
+    ema = ema_util.ModelEMA(resnet, ema_decay, ema_update_every, ema_bn_buffers)
+
+    # the overhead of the ema per training step
+    step_seconds = benchmark_util.seconds_per_training_step(
+        getattr(model, model_name)(num_classes).to(device),
+        device,
+        train_batch_size,
+        num_classes,
+    )
+    ema_seconds = seconds_per_ema_step(ema)
+    print(
+        f"training step: {1000*step_seconds:.2f} ms, ema: {1000*ema_seconds:.3f} ms per step "
+        f"({100 * ema_seconds / step_seconds:.2f}% overhead), ema memory: {ema.num_bytes() / 2**20:.2f} MB"
+    )
+    # the timing changed the average, it starts again from the initial weights
+    ema = ema_util.ModelEMA(resnet, ema_decay, ema_update_every, ema_bn_buffers)
+
+    loss_fn = nn.CrossEntropyLoss()
+
+    print(
+        f"------------- working on {model_name} with ema {ema_decay} -----------------"
+    )
+    optimizer = torch.optim.SGD(
+        resnet.parameters(), lr=0.1, momentum=0.9, weight_decay=0.0001
+    )
+    lr_scheduler = torch.optim.lr_scheduler.MultiStepLR(
+        optimizer, [100, 150], gamma=0.1
+    )
+    train(
+        num_epochs_to_train,
+        training_dataloader,
+        validation_loader,
+        resnet,
+        loss_fn,
+        optimizer,
+        lr_scheduler,
+        ema=ema,
+    )
+    utils.plot_training_validation_loss_and_accuracy()
+    utils.clear_histogram()
+    if recompute_bn_statistics is True:
+        ema.recompute_bn_statistics(training_dataloader, device)
+
+    print(f"------------- raw weights vs ema weights -----------------")
+    raw_correct, _ = utils.evaluate(resnet, test_dataloader, loss_fn, device)
+    ema_correct, _ = utils.evaluate(resnet, test_dataloader, loss_fn, device, ema=ema)
+    raw_accuracy = raw_correct / len(test_dataloader.dataset)
+    ema_accuracy = ema_correct / len(test_dataloader.dataset)
+    print(
+        f"accuracy {(100*raw_accuracy):>0.2f}% -> {(100*ema_accuracy):>0.2f}% "
+        f"({(100*(ema_accuracy - raw_accuracy)):+0.2f}%)"
+    )
+
+    # the ema checkpoint is a normal checkpoint of the model
+    utils.save_model(resnet, f"ema_raw_{model_name}_cifar{num_classes}")
+    with ema.swap():
+        utils.save_model(resnet, f"ema_{model_name}_cifar{num_classes}")
@@ -0,0 +1,79 @@
+import sys
+
+import model
+
+sys.path.append("../")
+from helpers import utils
+from helpers import benchmark_util
+from helpers import export_util
+
+# what an inference worker did before, the imports of the training script (torchvision, torchsummary, matplotlib),
+# building the model in python and loading the state dict, ends with the same "prediction" line as the loader
+eager_startup = """
+import torch
+import ResNet
+import model
+from helpers import utils
+resnet = getattr(model, "{name}")({num_classes})
+utils.load_model(resnet, "{name}_cifar{num_classes}", "cpu")
+resnet.eval()
+image = ResNet.test_transformations(torch.zeros(3, 32, 32, dtype=torch.uint8))
+with torch.inference_mode():
+    print(f"prediction {{resnet(image[None]).argmax(dim=1).item()}}", flush=True)
+"""
+
+
+if __name__ == "__main__":
+    # the exported programs are meant for the cpu inference workers
+    device = "cpu"
+    print(f"Using {device} device")
+
+    # if true use cifar 10 dataset otherwise cifar 100 data set is used
+    use_Cifar10 = True
+    # if true the time from launching a new process to the first prediction is measured for the exported program
+    # and for the old way of building the model in python
+    measure_cold_start = True
+
+    num_classes = 10 if use_Cifar10 is True else 100
+
+    for name in [
+        "resnet20",
+        "resnet56",
+        "resnet110",
+        "SE_resnet20",
+        "SE_resnet56",
+        "SE_resnet110",
+        "ViT_resnet20",
+        "ViT_resnet56",
+        "ViT_resnet110",
+    ]:
+        print(f"------------- exporting {name} -----------------")
+        resnet = getattr(model, name)(num_classes).to(device)
+        utils.load_model(resnet, f"{name}_cifar{num_classes}", device, required=True)
+
+        path = f"checkpoints/{name}_cifar{num_classes}_torchscript.pt"
+        exported_resnet = export_util.export_torchscript(
+            resnet, path, export_util.cifar_mean, export_util.cifar_std
+        )
+        max_difference, same_predictions = export_util.check_export(
+            resnet, exported_resnet, export_util.cifar_mean, export_util.cifar_std
+        )
+        print(
+            f"saved to {path}, max logit difference: {max_difference:.2e}, same predictions: {(100*same_predictions):>0.1f}%"
+        )
+
+        if measure_cold_start is True:
+            loader_cold_start = benchmark_util.measure_cold_start(
+                [sys.executable, "../helpers/torchscript_loader.py", path]
+            )
+            eager_cold_start = benchmark_util.measure_cold_start(
+                [
+                    sys.executable,
+                    "-c",
+                    eager_startup.format(name=name, num_classes=num_classes),
+                ]
+            )
+            print(
+                f"cold start to first prediction: exported {1000*loader_cold_start:.0f} ms, "
+                f"python model {1000*eager_cold_start:.0f} ms ({eager_cold_start / loader_cold_start:.2f}x)"
+            )
@@ -0,0 +1,142 @@
+import os
+
+import torch
+from torch import nn
+
+import model
+from ResNet import device, train, train_transformations, test_transformations
+
+import sys
+
+sys.path.append("../")
+from helpers import utils
+from helpers import load_data_util as ldu
+from helpers import benchmark_util
+from helpers import factorization_util
+
+# this is the same as the ResNet paper
+train_batch_size = 128
+
+# setting batch size at test time to be 100 have division since we have 10k images at test time
+test_batch_size = 100
+
+
+def measure(resnet, test_dataloader, loss_fn):
+    macs, num_params = benchmark_util.count_macs_and_params(resnet, (3, 32, 32), device)
+    num_correct, _ = utils.evaluate(resnet, test_dataloader, loss_fn, device)
+    return macs, num_params, num_correct / len(test_dataloader.dataset)
+
+
+def report(name, resnet, factorized_resnet, measurements, baseline_measurements):
+    macs, num_params, accuracy = measurements
+    baseline_macs, _, baseline_accuracy = baseline_measurements
+    # the latency of the original model is measured again right before, the cpu timings drift over a long run
+    example_input = torch.randn(test_batch_size, 3, 32, 32, device=device)
+    baseline_latency = benchmark_util.measure_latency(resnet, example_input)
+    latency = benchmark_util.measure_latency(factorized_resnet, example_input)
+    print(
+        f"{name}: MACs: {macs / 1e6:.1f}M ({100 * (1 - macs / baseline_macs):.1f}% less), "
+        f"params: {num_params / 1e3:.1f}K, latency: {1000*latency:.2f} ms ({baseline_latency / latency:.2f}x speedup), "
+        f"accuracy: {(100*accuracy):>0.3f}% ({(100*(accuracy - baseline_accuracy)):+0.2f}%) \n"
+    )
+
+
+if __name__ == "__main__":
+    print(f"Using {device} device")
+
+    validation_set_size = 5000
+
+    # if true use cifar 10 dataset otherwise cifar 100 data set is used
+    use_Cifar10 = True
+    model_name = "resnet56"
+    # svd: every 3x3 conv becomes a 3x1 and a 1x3 conv, tucker: a 1x1, a smaller 3x3 and a 1x1 conv
+    factorization_method = "svd"
+    # the ranks of every conv keep this fraction of the energy of its singular values
+    energy_thresholds = [0.95, 0.9, 0.8]
+    # the ranks of every conv are the largest for which it takes at most this fraction of the time of the 3x3 conv
+    latency_budgets = [0.75, 0.5]
+    # 0 only reports the factorized model, otherwise it's fine-tuned for this many epochs
+    num_finetune_epochs = 5
+
+    if use_Cifar10 is True:
+        print("Dataset is CIFAR10")
+        validation_loader, training_dataloader = ldu.load_CIFAR10_train_validation(
+            train_batch_size, train_transformations, validation_set_size
+        )
+        test_dataloader = ldu.load_CIFAR10_test(test_batch_size, test_transformations)
+        num_classes = 10
+    else:
+        print("Dataset is CIFAR100")
+        validation_loader, training_dataloader = ldu.load_CIFAR100_train_validation(
+            train_batch_size, train_transformations, validation_set_size
+        )
+        test_dataloader = ldu.load_CIFAR100_test(test_batch_size, test_transformations)
+        num_classes = 100
+
+    loss_fn = nn.CrossEntropyLoss()
+
+    resnet = getattr(model, model_name)(num_classes).to(device)
+    utils.load_model(resnet, f"{model_name}_cifar{num_classes}", device, required=True)
+    baseline_measurements = measure(resnet, test_dataloader, loss_fn)
+    report(
+        f"{model_name}", resnet, resnet, baseline_measurements, baseline_measurements
+    )
+
+    example_input = torch.randn(test_batch_size, 3, 32, 32, device=device)
+    settings = [(f"energy {energy}", energy, None) for energy in energy_thresholds]
+    settings += [
+        (f"latency budget {budget}", None, budget) for budget in latency_budgets
+    ]
+
+    os.makedirs("checkpoints", exist_ok=True)
+    for setting_name, energy, latency_budget in settings:
+        print(
+            f"------------- {factorization_method} factorization of {model_name} with {setting_name} -----------------"
+        )
+        factorized_resnet, ranks = factorization_util.factorize_resnet(
+            resnet, factorization_method, energy, latency_budget, example_input
+        )
+        print(f"ranks of the block convs (None is not factorized): {ranks}")
+        name = f"{model_name} {factorization_method} {setting_name}"
+        report(
+            name,
+            resnet,
+            factorized_resnet,
+            measure(factorized_resnet, test_dataloader, loss_fn),
+            baseline_measurements,
+        )
+
+        if num_finetune_epochs > 0:
+            optimizer = torch.optim.SGD(
+                factorized_resnet.parameters(),
+                lr=0.01,
+                momentum=0.9,
+                weight_decay=0.0001,
+            )
+            lr_scheduler = torch.optim.lr_scheduler.CosineAnnealingLR(
+                optimizer, num_finetune_epochs
+            )
+            train(
+                num_finetune_epochs,
+                training_dataloader,
+                validation_loader,
+                factorized_resnet,
+                loss_fn,
+                optimizer,
+                lr_scheduler,
+            )
+            utils.clear_histogram()
+            report(
+                f"{name} fine-tuned",
+                resnet,
+                factorized_resnet,
+                measure(factorized_resnet, test_dataloader, loss_fn),
+                baseline_measurements,
+            )
+
+        # the factorized model doesn't have the layers of model.py anymore so the whole module is saved
+        setting_suffix = setting_name.replace(" ", "_")
+        torch.save(
+            factorized_resnet,
+            f"checkpoints/{model_name}_cifar{num_classes}_{factorization_method}_{setting_suffix}.pt",
+        )
@@ -0,0 +1,174 @@
+import time
+
+import torch
+from torch import nn
+
+import model
+from ResNet import (
+    device,
+    he_initalization,
+    train,
+    train_transformations,
+    test_transformations,
+)
+
+import sys
+
+sys.path.append("../")
+from helpers import utils
+from helpers import load_data_util as ldu
+from helpers import benchmark_util
+from helpers import freezing_util
+
+# this is the same as the ResNet paper
+train_batch_size = 128
+
+# setting batch size at test time to be 100 have division since we have 10k images at test time
+test_batch_size = 100
+
+
+def train_and_time(resnet, num_epochs, training_dataloader, validation_loader, freezer):
+    loss_fn = nn.CrossEntropyLoss()
+    optimizer = torch.optim.SGD(
+        resnet.parameters(), lr=0.1, momentum=0.9, weight_decay=0.0001
+    )
+    lr_scheduler = torch.optim.lr_scheduler.MultiStepLR(
+        optimizer, [100, 150], gamma=0.1
+    )
+    start = time.perf_counter()
+    train(
+        num_epochs,
+        training_dataloader,
+        validation_loader,
+        resnet,
+        loss_fn,
+        optimizer,
+        lr_scheduler,
+        freezer=freezer,
+    )
+    seconds = time.perf_counter() - start
+    utils.plot_training_validation_loss_and_accuracy()
+    utils.clear_histogram()
+    return seconds
+
+
+if __name__ == "__main__":
+    print(f"Using {device} device")
+
+    validation_set_size = 5000
+
+    # if true use cifar 10 dataset otherwise cifar 100 data set is used
+    use_Cifar10 = True
+    model_name = "resnet56"
+    # the stages that can be frozen, in the order of the forward pass
+    stage_names = ["initial", "layer1"]
+    # "epoch": the stages are frozen at freeze_epochs, "weight_change": once their weights stop changing
+    freezing_criterion = "epoch"
+    freeze_epochs = [150, 175]
+    weight_change_threshold = 0.005
+    # if true the model is also trained without freezing for the wall clock, otherwise the checkpoint of ResNet.py is
+    # used for the accuracy and the time saved is estimated from the step times
+    train_baseline = False
+    num_epochs_to_train = 200
+
+    if use_Cifar10 is True:
+        print("Dataset is CIFAR10")
+        validation_loader, training_dataloader = ldu.load_CIFAR10_train_validation(
+            train_batch_size, train_transformations, validation_set_size
+        )
+        test_dataloader = ldu.load_CIFAR10_test(test_batch_size, test_transformations)
+        num_classes = 10
+    else:
+        print("Dataset is CIFAR100")
+        validation_loader, training_dataloader = ldu.load_CIFAR100_train_validation(
+            train_batch_size, train_transformations, validation_set_size
+        )
+        test_dataloader = ldu.load_CIFAR100_test(test_batch_size, test_transformations)
+        num_classes = 100
+
+    # the time of a training step with 0, 1, 2 ... frozen stages
+    step_model = getattr(model, model_name)(num_classes).to(device)
+    step_freezer = freezing_util.ProgressiveFreezer(
+        step_model, stage_names, freeze_epochs=range(1, len(stage_names) + 1)
+    )
+    step_seconds = [
+        benchmark_util.seconds_per_training_step(
+            step_model, device, train_batch_size, num_classes
+        )
+    ]
+    for num_frozen in range(len(stage_names)):
+        step_freezer.step(num_frozen)
+        step_seconds.append(
+            benchmark_util.seconds_per_training_step(
+                step_model, device, train_batch_size, num_classes
+            )
+        )
+    print(
+        "training step: "
+        + " -> ".join(
+            f"{1000*seconds:.1f} ms ({num_frozen} frozen)"
+            for num_frozen, seconds in enumerate(step_seconds)
+        )
+    )
+
+    loss_fn = nn.CrossEntropyLoss()
+
+    print(
+        f"------------- working on {model_name} with {freezing_criterion} freezing -----------------"
+    )
+    resnet = getattr(model, model_name)(num_classes).to(device)
+    resnet.apply(he_initalization)
+    freezer = freezing_util.ProgressiveFreezer(
+        resnet,
+        stage_names,
+        freezing_criterion,
+        freeze_epochs,
+        weight_change_threshold,
+    )
+    frozen_seconds = train_and_time(
+        resnet, num_epochs_to_train, training_dataloader, validation_loader, freezer
+    )
+    frozen_correct, _ = utils.evaluate(resnet, test_dataloader, loss_fn, device)
+    utils.save_model(
+        resnet, f"frozen_{freezing_criterion}_{model_name}_cifar{num_classes}"
+    )
+
+    # the time saved per epoch is the step time saved for every batch of the epoch
+    estimated_saved_seconds = 0
+    for num_frozen, name in enumerate(stage_names, start=1):
+        if name not in freezer.frozen_at_epoch:
+            continue
+        next_name = stage_names[num_frozen] if num_frozen < len(stage_names) else None
+        last_epoch = freezer.frozen_at_epoch.get(next_name, num_epochs_to_train - 1)
+        num_frozen_epochs = last_epoch - freezer.frozen_at_epoch[name]
+        estimated_saved_seconds += (
+            num_frozen_epochs
+            * len(training_dataloader)
+            * (step_seconds[0] - step_seconds[num_frozen])
+        )
+    print(f"frozen after the epochs: {freezer.frozen_at_epoch}")
+
+    baseline = getattr(model, model_name)(num_classes).to(device)
+    if train_baseline is True:
+        baseline.apply(he_initalization)
+        baseline_seconds = train_and_time(
+            baseline, num_epochs_to_train, training_dataloader, validation_loader, None
+        )
+        found = True
+        saved = f"{(baseline_seconds - frozen_seconds) / 60:.1f} minutes saved"
+    else:
+        found = utils.load_model(baseline, f"{model_name}_cifar{num_classes}", device)
+        saved = f"about {estimated_saved_seconds / 60:.1f} minutes saved (estimated from the step times)"
+
+    print(f"------------- freezing vs no freezing -----------------")
+    print(f"training with freezing took {frozen_seconds / 60:.1f} minutes, {saved}")
+    frozen_accuracy = frozen_correct / len(test_dataloader.dataset)
+    if found is True:
+        baseline_correct, _ = utils.evaluate(baseline, test_dataloader, loss_fn, device)
+        baseline_accuracy = baseline_correct / len(test_dataloader.dataset)
+        print(
+            f"accuracy {(100*baseline_accuracy):>0.2f}% -> {(100*frozen_accuracy):>0.2f}% "
+            f"({(100*(frozen_accuracy - baseline_accuracy)):+0.2f}%)"
+        )
+    else:
+        print(f"accuracy with freezing {(100*frozen_accuracy):>0.2f}%, no baseline")
@@ -0,0 +1,115 @@
+import copy
+
+import torch
+from torch import nn
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+
+import model
+from blocks.RevResNetBlock import ReversibleSequential
+
+import sys
+
+sys.path.append("../")
+from helpers import benchmark_util
+
+
+def _fuse_sequential(sequential):
+	# folds every conv -> bn pair inside of a sequential, everything else (ReLU etc.) is kept as it is
+	modules = list(sequential)
+	fused = []
+
+	i = 0
+	while i < len(modules):
+		if (
+			isinstance(modules[i], nn.Conv2d)
+			and i + 1 < len(modules)
+			and isinstance(modules[i + 1], nn.BatchNorm2d)
+		):
+			fused.append(fuse_conv_bn_eval(modules[i], modules[i + 1]))
+			i += 2
+		else:
+			fused.append(modules[i])
+			i += 1
+
+	# the empty sequential used as identity residual still has to be called, nn.Identity is the cheapest we can do
+	if len(fused) == 0:
+		return nn.Identity()
+	if len(fused) == 1:
+		return fused[0]
+	return nn.Sequential(*fused)
+
+
+def _fuse_block(block):
+	# the blocks name their layers conv_1, bn_1, conv_2, bn_2 ... so we fold each pair, the bn is replaced with identity
+	# so that the forward of the block can stay the same
+	index = 1
+	while hasattr(block, f"conv_{index}"):
+		conv = getattr(block, f"conv_{index}")
+		bn = getattr(block, f"bn_{index}")
+		setattr(block, f"conv_{index}", fuse_conv_bn_eval(conv, bn))
+		setattr(block, f"bn_{index}", nn.Identity())
+		index += 1
+
+	# this is both the 1x1 conv + bn shortcut of option B and the empty sequential identity, the zero padding shortcut of
+	# option A has nothing to fold
+	if isinstance(block.residual, nn.Sequential):
+		block.residual = _fuse_sequential(block.residual)
+
+
+def fuse_for_inference(resnet):
+	# the original model is not modified, the batch norm statistics have to be the running ones so eval mode is needed
+	fused_model = copy.deepcopy(resnet).eval()
+
+	fused_model.initial = _fuse_sequential(fused_model.initial)
+
+	for layer in (fused_model.layer1, fused_model.layer2, fused_model.layer3):
+		for block in layer:
+			if isinstance(block, ReversibleSequential):
+				# the residual functions F and G of a reversible block are conv -> bn -> relu -> conv -> bn sequentials, in
+				# eval mode the reversible stage is a normal sequential so they can be folded like any other
+				for reversible_block in block:
+					reversible_block.F = _fuse_sequential(reversible_block.F)
+					reversible_block.G = _fuse_sequential(reversible_block.G)
+			else:
+				_fuse_block(block)
+
+	return fused_model
+
+
+def _randomize_batch_norm(m):
+	# a freshly initialized bn is the identity function, so we give it some statistics otherwise the check is meaningless
+	for i in m.modules():
+		if isinstance(i, nn.BatchNorm2d):
+			nn.init.uniform_(i.weight, 0.5, 1.5)
+			nn.init.normal_(i.bias, std=0.1)
+			i.running_mean.normal_(std=0.1)
+			i.running_var.uniform_(0.5, 1.5)
+
+
+if __name__ == "__main__":
+	device = "cpu"
+	print(f"Using {device} device")
+
+	num_classes = 10
+	# same batch size that we use at test time
+	batch_size = 100
+
+	example_input = torch.randn(batch_size, 3, 32, 32, device=device)
+
+	for name in ["resnet20", "resnet56", "resnet110", "SE_resnet56", "rev_resnet56"]:
+		resnet = getattr(model, name)(num_classes).to(device)
+		_randomize_batch_norm(resnet)
+		resnet.eval()
+
+		fused_resnet = fuse_for_inference(resnet)
+
+		with torch.inference_mode():
+			max_abs_diff = (resnet(example_input) - fused_resnet(example_input)).abs().max().item()
+
+		latency = benchmark_util.measure_latency(resnet, example_input)
+		fused_latency = benchmark_util.measure_latency(fused_resnet, example_input)
+
+		print(
+			f"{name}: max abs diff {max_abs_diff:.2e}, latency {1000*latency:.2f} ms -> {1000*fused_latency:.2f} ms "
+			f"({latency / fused_latency:.2f}x speedup)"
+		)
@@ -3,20 +3,52 @@ from torch import nn
 from blocks.ResNetBlock import ResNetBlock
 from blocks.SE_ResNetBlock import SE_ResNetBlock
 from blocks.Patchify_Embed_Block import Patchify_EmbedBlock
+from blocks.CheckpointedSequential import CheckpointedSequential
+from blocks.RevResNetBlock import RevResNetBlock, ReversibleSequential
+from blocks.BottleneckBlock import BottleneckBlock
+from blocks.InvertedResidualBlock import InvertedResidualBlock
+from blocks.EarlyExitHead import EarlyExitHead
 
 
 class ResNet(nn.Module):
-	def __init__(self, block, num_blocks, num_classes, use_ViT):
+	def __init__(
+		self,
+		block,
+		num_blocks,
+		num_classes,
+		use_ViT,
+		checkpoint_policy=None,
+		option="B",
+		patch_size=2,
+		embed_channels=3,
+		patch_stride=None,
+		early_exits=False,
+		stochastic_depth=None,
+	):
 		super().__init__()
 		self.use_ViT = use_ViT
-		# taking performing patchify and embed with patch size 2, this will reduce the image size to 16x16
-		self.patchify_embed_block = Patchify_EmbedBlock(3, 3, 2)
+		# the shortcut used when the shape changes, "A": subsampling + zero padding without parameters, "B": 1x1 conv + bn
+		self.option = option
+		# None: all activations are kept (default), "stage": only the input of every stage is kept, an int k: the input of
+		# every k blocks is kept, the rest is recomputed in the backward pass (activation checkpointing)
+		self.checkpoint_policy = checkpoint_policy
+		# the patchify stem is only built for the ViT models. the default is patch size 2 with 3 channels which reduces the
+		# image size to 16x16, patch size 4 reduces it to 8x8 so every layer after it has 4 times less work than with
+		# patch size 2 (16 times less than without the stem). a patch_stride smaller than the patch size makes the patches
+		# overlap, the image size is then 32 / patch_stride
+		in_channels = 3
+		if self.use_ViT:
+			self.patchify_embed_block = Patchify_EmbedBlock(3, embed_channels, patch_size, patch_stride)
+			in_channels = embed_channels
+		else:
+			# checkpoints of the models without the stem that were saved when it was always built still contain its weights
+			self._register_load_state_dict_pre_hook(self._drop_patchify_weights)
 		
 		self.current_filter_size = 16
 
 		# inital operation to be applied
 		self.initial = nn.Sequential(
-			nn.Conv2d(3, 16, kernel_size=3, stride=1, padding=1, bias=False),
+			nn.Conv2d(in_channels, 16, kernel_size=3, stride=1, padding=1, bias=False),
 			nn.BatchNorm2d(16),
 			nn.ReLU(inplace=True),
 		)
@@ -24,11 +56,27 @@ class ResNet(nn.Module):
 		self.layer1 = self._make_layer(block, 16, num_blocks[0], stride=1)
 		self.layer2 = self._make_layer(block, 32, num_blocks[1], stride=2)
 		self.layer3 = self._make_layer(block, 64, num_blocks[2], stride=2)
+		# stochastic depth, the survival probability of the blocks decays linearly from 1 at the input to stochastic_depth
+		# for the last block (0.5 in the paper), so in every training step about (1 - stochastic_depth) / 2 of the
+		# residual branches are skipped. it isn't in the state dict, a model has to be built with the same value to load
+		if stochastic_depth is not None:
+			blocks = [b for layer in (self.layer1, self.layer2, self.layer3) for b in layer]
+			if not all(hasattr(b, "survival_prob") for b in blocks):
+				raise ValueError("stochastic depth is only supported for the ResNetBlock and SE_ResNetBlock")
+			for index, b in enumerate(blocks, start=1):
+				b.survival_prob = 1 - index / len(blocks) * (1 - stochastic_depth)
+		# a classifier after layer1 and layer2, they are only used by forward_exits and forward_early_exit so the normal
+		# forward (and with it the train and evaluation loops) only sees the final classifier
+		if early_exits:
+			self.exit_heads = nn.ModuleList(
+				[EarlyExitHead(16 * block.expansion, num_classes), EarlyExitHead(32 * block.expansion, num_classes)]
+			)
 		# using AdaptiveAvgPool2d instead of AvgPool2d since here we just have to define the target dimension we want in this case we want the
 		# to have width = 1, height = 1 so when we later flatten we get 64 as the size since we have so many channels/depth
 		self.avgpool = nn.AdaptiveAvgPool2d((1, 1))
 
-		self.classifier = nn.Linear(64, num_classes)
+		# the bottleneck block has 4 times as many output channels as the last stage has filters
+		self.classifier = nn.Linear(64 * block.expansion, num_classes)
 		# explicity setting the HE initalization for the classifier here instad of previous where did this the below but for all linear
 		# layers, now we don't want this since we using this class for SE ResNet and there the linear layers don't have any bias
 		torch.nn.init.kaiming_normal_(
@@ -36,14 +84,36 @@ class ResNet(nn.Module):
 		)
 		torch.nn.init.zeros_(self.classifier.bias)
 
+	def _drop_patchify_weights(self, state_dict, prefix, *args):
+		for key in [k for k in state_dict if k.startswith(f"{prefix}patchify_embed_block.")]:
+			del state_dict[key]
+
 	def _make_layer(self, block, out_channels, num_blocks, stride):
 		strides = [stride] + [1] * (num_blocks - 1)
 		layers = []
 		for stride in strides:
-			layers.append(block(self.current_filter_size, out_channels, stride))
+			if getattr(block, "reversible", False) and (
+				stride != 1 or self.current_filter_size != out_channels * block.expansion
+			):
+				# a reversible block can't change the shape, so the downsampling block is a normal block
+				layers.append(ResNetBlock(self.current_filter_size, out_channels, stride, self.option))
+			else:
+				layers.append(block(self.current_filter_size, out_channels, stride, self.option))
 			self.current_filter_size = out_channels * block.expansion
 
-		return nn.Sequential(*layers)
+		if getattr(block, "reversible", False):
+			# all the reversible blocks of the stage run in one autograd function so only the output of the stage is stored,
+			# this already keeps the memory constant in depth so the checkpoint policy is not used for these
+			num_normal_blocks = sum(1 for layer in layers if not getattr(layer, "reversible", False))
+			return nn.Sequential(*layers[:num_normal_blocks], ReversibleSequential(*layers[num_normal_blocks:]))
+
+		if self.checkpoint_policy is None:
+			return nn.Sequential(*layers)
+		if self.checkpoint_policy == "stage":
+			return CheckpointedSequential(*layers, segment_size=num_blocks)
+		if isinstance(self.checkpoint_policy, int) and self.checkpoint_policy > 0:
+			return CheckpointedSequential(*layers, segment_size=self.checkpoint_policy)
+		raise ValueError("uncorrect checkpoint policy choosen")
 
 	def forward(self, x):
 		if self.use_ViT:
@@ -61,60 +131,156 @@ class ResNet(nn.Module):
 		x = self.classifier(x)
 		return x
 
+	def _final_exit(self, x):
+		x = self.avgpool(x)
+		x = torch.flatten(x, 1)
+		return self.classifier(x)
+
+	def forward_exits(self, x):
+		# the logits of every exit, the two early exits first and the final classifier last, used to train the heads
+		if not hasattr(self, "exit_heads"):
+			raise ValueError("the model has to be built with early_exits=True")
+
+		if self.use_ViT:
+			x = self.patchify_embed_block(x)
+		x = self.initial(x)
+
+		exits = []
+		for stage, exit_head in zip([self.layer1, self.layer2], self.exit_heads):
+			x = stage(x)
+			exits.append(exit_head(x))
+		x = self.layer3(x)
+		exits.append(self._final_exit(x))
+		return exits
+
+	def forward_early_exit(self, x, threshold):
+		# every image stops at the first exit where the softmax confidence is at least threshold, only the images that are
+		# left go through the deeper stages, as one smaller batch. returns the logits and the exit index of every image
+		if not hasattr(self, "exit_heads"):
+			raise ValueError("the model has to be built with early_exits=True")
+
+		if self.use_ViT:
+			x = self.patchify_embed_block(x)
+		x = self.initial(x)
+
+		stages = [self.layer1, self.layer2, self.layer3]
+		exits = list(self.exit_heads) + [self._final_exit]
+
+		logits = None
+		exit_index = torch.full((x.size(0),), len(stages) - 1, dtype=torch.long, device=x.device)
+		# the position in the original batch of every image that is still running
+		remaining = torch.arange(x.size(0), device=x.device)
+		for index, (stage, classify) in enumerate(zip(stages, exits)):
+			x = stage(x)
+			exit_logits = classify(x)
+			if logits is None:
+				logits = exit_logits.new_empty(exit_index.size(0), exit_logits.size(1))
+
+			if index == len(stages) - 1:
+				logits[remaining] = exit_logits
+				break
+
+			done = exit_logits.softmax(dim=1).amax(dim=1) >= threshold
+			logits[remaining[done]] = exit_logits[done]
+			exit_index[remaining[done]] = index
+			remaining, x = remaining[~done], x[~done]
+			if remaining.numel() == 0:
+				break
+
+		return logits, exit_index
+
+
+def resnet20(num_classes, **kwargs):
+	return ResNet(ResNetBlock, [3, 3, 3], num_classes, False, **kwargs)
+
+
+def resnet32(num_classes, **kwargs):
+	return ResNet(ResNetBlock, [5, 5, 5], num_classes, False, **kwargs)
+
+
+def resnet44(num_classes, **kwargs):
+	return ResNet(ResNetBlock, [7, 7, 7], num_classes, False, **kwargs)
+
+
+def resnet56(num_classes, **kwargs):
+	return ResNet(ResNetBlock, [9, 9, 9], num_classes, False, **kwargs)
+
+
+def resnet110(num_classes, **kwargs):
+	return ResNet(ResNetBlock, [18, 18, 18], num_classes, False, **kwargs)
+
+
+def SE_resnet20(num_classes, **kwargs):
+	return ResNet(SE_ResNetBlock, [3, 3, 3], num_classes, False, **kwargs)
+
+
+def SE_resnet32(num_classes, **kwargs):
+	return ResNet(SE_ResNetBlock, [5, 5, 5], num_classes, False, **kwargs)
+
+
+def SE_resnet44(num_classes, **kwargs):
+	return ResNet(SE_ResNetBlock, [7, 7, 7], num_classes, False, **kwargs)
+
+
+def SE_resnet56(num_classes, **kwargs):
+	return ResNet(SE_ResNetBlock, [9, 9, 9], num_classes, False, **kwargs)
+
 
-def resnet20(num_classes):
-	return ResNet(ResNetBlock, [3, 3, 3], num_classes, False)
+def SE_resnet110(num_classes, **kwargs):
+	return ResNet(ResNetBlock, [18, 18, 18], num_classes, False, **kwargs)
 
+def ViT_resnet20(num_classes, **kwargs):
+	return ResNet(ResNetBlock, [3, 3, 3], num_classes, True, **kwargs)
 
-def resnet32(num_classes):
-	return ResNet(ResNetBlock, [5, 5, 5], num_classes, False)
 
+def ViT_resnet32(num_classes, **kwargs):
+	return ResNet(ResNetBlock, [5, 5, 5], num_classes, True, **kwargs)
 
-def resnet44(num_classes):
-	return ResNet(ResNetBlock, [7, 7, 7], num_classes, False)
 
+def ViT_resnet44(num_classes, **kwargs):
+	return ResNet(ResNetBlock, [7, 7, 7], num_classes, True, **kwargs)
 
-def resnet56(num_classes):
-	return ResNet(ResNetBlock, [9, 9, 9], num_classes, False)
 
+def ViT_resnet56(num_classes, **kwargs):
+	return ResNet(ResNetBlock, [9, 9, 9], num_classes, True, **kwargs)
 
-def resnet110(num_classes):
-	return ResNet(ResNetBlock, [18, 18, 18], num_classes, False)
+def ViT_resnet110(num_classes, **kwargs):
+	return ResNet(ResNetBlock, [18, 18, 18], num_classes, True, **kwargs)
 
 
-def SE_resnet20(num_classes):
-	return ResNet(SE_ResNetBlock, [3, 3, 3], num_classes, False)
+def rev_resnet20(num_classes, **kwargs):
+	return ResNet(RevResNetBlock, [3, 3, 3], num_classes, False, **kwargs)
 
 
-def SE_resnet32(num_classes):
-	return ResNet(SE_ResNetBlock, [5, 5, 5], num_classes, False)
+def rev_resnet56(num_classes, **kwargs):
+	return ResNet(RevResNetBlock, [9, 9, 9], num_classes, False, **kwargs)
 
 
-def SE_resnet44(num_classes):
-	return ResNet(SE_ResNetBlock, [7, 7, 7], num_classes, False)
+def rev_resnet110(num_classes, **kwargs):
+	return ResNet(RevResNetBlock, [18, 18, 18], num_classes, False, **kwargs)
 
 
-def SE_resnet56(num_classes):
-	return ResNet(SE_ResNetBlock, [9, 9, 9], num_classes, False)
+# the bottleneck and inverted residual networks have the depth chosen so that they need about as many MACs as
+# resnet20 (~41M), resnet56 (~126M) and resnet110 (~253M)
+def bottleneck_resnet29(num_classes, **kwargs):
+	return ResNet(BottleneckBlock, [3, 3, 3], num_classes, False, **kwargs)
 
 
-def SE_resnet110(num_classes):
-	return ResNet(ResNetBlock, [18, 18, 18], num_classes, False)
+def bottleneck_resnet83(num_classes, **kwargs):
+	return ResNet(BottleneckBlock, [9, 9, 9], num_classes, False, **kwargs)
 
-def ViT_resnet20(num_classes):
-	return ResNet(ResNetBlock, [3, 3, 3], num_classes, True)
 
+def bottleneck_resnet164(num_classes, **kwargs):
+	return ResNet(BottleneckBlock, [18, 18, 18], num_classes, False, **kwargs)
 
-def ViT_resnet32(num_classes):
-	return ResNet(ResNetBlock, [5, 5, 5], num_classes, True)
 
+def inverted_resnet38(num_classes, **kwargs):
+	return ResNet(InvertedResidualBlock, [4, 4, 4], num_classes, False, **kwargs)
 
-def ViT_resnet44(num_classes):
-	return ResNet(ResNetBlock, [7, 7, 7], num_classes, True)
 
+def inverted_resnet110(num_classes, **kwargs):
+	return ResNet(InvertedResidualBlock, [12, 12, 12], num_classes, False, **kwargs)
 
-def ViT_resnet56(num_classes):
-	return ResNet(ResNetBlock, [9, 9, 9], num_classes, True)
 
-def ViT_resnet110(num_classes):
-	return ResNet(ResNetBlock, [18, 18, 18], num_classes, True)
\ No newline at end of file
+def inverted_resnet209(num_classes, **kwargs):
+	return ResNet(InvertedResidualBlock, [23, 23, 23], num_classes, False, **kwargs)
@@ -0,0 +1,71 @@
+import time
+
+import torch
+from torch import nn
+
+import model
+from ResNet import test_transformations
+
+import sys
+
+sys.path.append("../")
+from helpers import utils
+from helpers import load_data_util as ldu
+from helpers import parallel_evaluate_util
+
+test_batch_size = 100
+
+
+if __name__ == "__main__":
+    # the sharded evaluation is only used on the cpu
+    device = "cpu"
+    print(f"Using {device} device, {torch.get_num_threads()} threads")
+
+    # if true use cifar 10 dataset otherwise cifar 100 data set is used
+    use_Cifar10 = True
+
+    if use_Cifar10 is True:
+        print("Dataset is CIFAR10")
+        test_dataloader = ldu.load_CIFAR10_test(test_batch_size, test_transformations)
+        num_classes = 10
+    else:
+        print("Dataset is CIFAR100")
+        test_dataloader = ldu.load_CIFAR100_test(test_batch_size, test_transformations)
+        num_classes = 100
+
+    loss_fn = nn.CrossEntropyLoss()
+
+    for name in ["resnet20", "resnet110"]:
+        print(f"------------- {name} -----------------")
+        resnet = getattr(model, name)(num_classes)
+        # the parity doesn't depend on the weights, without a checkpoint the untrained model is checked
+        utils.load_model(resnet, f"{name}_cifar{num_classes}", device)
+
+        start = time.perf_counter()
+        num_correct, total_loss = utils.evaluate(
+            resnet, test_dataloader, loss_fn, device
+        )
+        single_process_time = time.perf_counter() - start
+
+        for num_processes in [2, 4]:
+            start = time.perf_counter()
+            (
+                parallel_num_correct,
+                parallel_total_loss,
+            ) = parallel_evaluate_util.evaluate(
+                resnet, test_dataloader, loss_fn, device, num_processes
+            )
+            parallel_time = time.perf_counter() - start
+
+            # the correct counts have to be exactly the same, the mean loss is summed in a different order so it can
+            # only differ in the last bits
+            assert (
+                parallel_num_correct == num_correct
+            ), f"{num_processes} processes: {parallel_num_correct} correct, single process {num_correct}"
+            assert abs(parallel_total_loss - total_loss) <= 1e-12 * abs(total_loss)
+
+            print(
+                f"{num_processes} processes: {parallel_num_correct} correct (single process {num_correct}), "
+                f"loss difference {abs(parallel_total_loss - total_loss):.1e}, "
+                f"{single_process_time:.2f} s -> {parallel_time:.2f} s ({single_process_time / parallel_time:.2f}x)"
+            )
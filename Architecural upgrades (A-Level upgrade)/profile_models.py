@@ -0,0 +1,72 @@
+import torch
+
+import model
+
+import sys
+
+sys.path.append("../")
+sys.path.append(
+    "../part_E_further_exploration/different_order_batch_normalization_dropout/VGG_dropout_BN_models"
+)
+from baseline.VGG1 import VGG1
+from baseline.VGG2 import VGG2
+from baseline.VGG3 import VGG3
+from baseline_combined_reguralizations.VGG3_BN_dropout import VGG3_BN_Dropput
+from VGG3_BN_dropout import VGG3_BN_dropout
+from VGG3_dropout_BN import VGG3_dropout_BN
+from helpers import profiler_util
+
+
+if __name__ == "__main__":
+    device = (
+        "cuda"
+        if torch.cuda.is_available()
+        else "mps" if torch.backends.mps.is_available() else "cpu"
+    )
+    print(f"Using {device} device")
+
+    num_classes = 10
+    # same batch size that we use at test time
+    batch_size = 100
+    # if true every layer is printed, otherwise only the stages and the total
+    show_modules = False
+
+    models = [
+        ("resnet20", model.resnet20(num_classes)),
+        ("resnet56", model.resnet56(num_classes)),
+        ("resnet110", model.resnet110(num_classes)),
+        ("SE_resnet20", model.SE_resnet20(num_classes)),
+        ("SE_resnet56", model.SE_resnet56(num_classes)),
+        ("ViT_resnet20", model.ViT_resnet20(num_classes)),
+        ("ViT_resnet56", model.ViT_resnet56(num_classes)),
+        ("rev_resnet56", model.rev_resnet56(num_classes)),
+        ("VGG1", VGG1()),
+        ("VGG2", VGG2()),
+        ("VGG3", VGG3()),
+        ("VGG3_BN_Dropput", VGG3_BN_Dropput()),
+        ("VGG3_BN_dropout", VGG3_BN_dropout()),
+        ("VGG3_dropout_BN", VGG3_dropout_BN()),
+    ]
+
+    profiles = []
+    for name, profiled_model in models:
+        profile = profiler_util.profile_model(
+            profiled_model, (3, 32, 32), batch_size, device, name=name
+        )
+        profiler_util.print_profile(profile, show_modules)
+        # the json files can be loaded again to compare the architectures without profiling them again
+        profiler_util.save_profile(profile, f"profiles/{name}.json")
+        profiles.append(profile)
+
+    print(
+        f"------------- cost per image, latency for a batch of {batch_size} -----------------"
+    )
+    print(
+        f"{'':>16} {'MMACs':>9} {'params':>9} {'act MB':>8} {'fwd ms':>9} {'bwd ms':>9}"
+    )
+    for profile in sorted(profiles, key=lambda p: p["total"]["macs"]):
+        total = profile["total"]
+        print(
+            f"{profile['name']:>16} {total['macs'] / 1e6:>9.2f} {total['params']:>9} "
+            f"{total['activation_bytes'] / 2**20:>8.2f} {total['forward_ms']:>9.2f} {total['backward_ms']:>9.2f}"
+        )
@@ -0,0 +1,109 @@
+import os
+
+import torch
+from torch import nn
+
+import model
+from ResNet import device, train, train_transformations, test_transformations
+
+import sys
+
+sys.path.append("../")
+from helpers import utils
+from helpers import load_data_util as ldu
+from helpers import benchmark_util
+from helpers import pruning_util
+
+# this is the same as the ResNet paper
+train_batch_size = 128
+
+# setting batch size at test time to be 100 have division since we have 10k images at test time
+test_batch_size = 100
+
+
+def report(name, resnet, test_dataloader, loss_fn):
+    macs, num_params = benchmark_util.count_macs_and_params(resnet, (3, 32, 32), device)
+    latency = benchmark_util.measure_latency(
+        resnet, torch.randn(test_batch_size, 3, 32, 32, device=device)
+    )
+    num_correct, _ = utils.evaluate(resnet, test_dataloader, loss_fn, device)
+    accuracy = num_correct / len(test_dataloader.dataset)
+
+    print(
+        f"{name}: MACs: {macs / 1e6:.1f}M, params: {num_params / 1e3:.1f}K, "
+        f"latency: {1000*latency:.2f} ms, accuracy: {(100*accuracy):>0.3f}% \n"
+    )
+
+
+if __name__ == "__main__":
+    print(f"Using {device} device")
+
+    validation_set_size = 5000
+
+    # if true use cifar 10 dataset otherwise cifar 100 data set is used
+    use_Cifar10 = True
+    # bn uses the magnitude of the bn gamma and l1 the l1 norm of the conv filters to score the channels
+    pruning_criterion = "bn"
+    num_finetune_epochs = 20
+    sparsity_levels = [0.25, 0.5, 0.75]
+    model_name = "resnet110"
+
+    if use_Cifar10 is True:
+        print("Dataset is CIFAR10")
+        validation_loader, training_dataloader = ldu.load_CIFAR10_train_validation(
+            train_batch_size, train_transformations, validation_set_size
+        )
+        test_dataloader = ldu.load_CIFAR10_test(test_batch_size, test_transformations)
+        num_classes = 10
+    else:
+        print("Dataset is CIFAR100")
+        validation_loader, training_dataloader = ldu.load_CIFAR100_train_validation(
+            train_batch_size, train_transformations, validation_set_size
+        )
+        test_dataloader = ldu.load_CIFAR100_test(test_batch_size, test_transformations)
+        num_classes = 100
+
+    loss_fn = nn.CrossEntropyLoss()
+
+    resnet = getattr(model, model_name)(num_classes).to(device)
+    utils.load_model(resnet, f"{model_name}_cifar{num_classes}", device, required=True)
+    report(f"{model_name} unpruned", resnet, test_dataloader, loss_fn)
+
+    os.makedirs("checkpoints", exist_ok=True)
+    for sparsity in sparsity_levels:
+        print(
+            f"------------- pruning {model_name} with sparsity {sparsity} -----------------"
+        )
+        pruned_resnet = pruning_util.prune_resnet(resnet, sparsity, pruning_criterion)
+        report(
+            f"{model_name} pruned {sparsity}", pruned_resnet, test_dataloader, loss_fn
+        )
+
+        optimizer = torch.optim.SGD(
+            pruned_resnet.parameters(), lr=0.01, momentum=0.9, weight_decay=0.0001
+        )
+        lr_scheduler = torch.optim.lr_scheduler.CosineAnnealingLR(
+            optimizer, num_finetune_epochs
+        )
+        train(
+            num_finetune_epochs,
+            training_dataloader,
+            validation_loader,
+            pruned_resnet,
+            loss_fn,
+            optimizer,
+            lr_scheduler,
+        )
+        utils.clear_histogram()
+        report(
+            f"{model_name} pruned {sparsity} fine-tuned",
+            pruned_resnet,
+            test_dataloader,
+            loss_fn,
+        )
+
+        # the pruned model doesn't have the shapes of model.py anymore so the whole module is saved
+        torch.save(
+            pruned_resnet,
+            f"checkpoints/{model_name}_cifar{num_classes}_pruned_{sparsity}.pt",
+        )
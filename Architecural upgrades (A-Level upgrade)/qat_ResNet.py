@@ -0,0 +1,92 @@
+import torch
+from torch import nn
+
+import model
+from ResNet import device, train, train_transformations, test_transformations
+
+import sys
+
+sys.path.append("../")
+from helpers import utils
+from helpers import load_data_util as ldu
+from helpers import quantization_util
+
+# this is the same as the ResNet paper
+train_batch_size = 128
+
+# setting batch size at test time to be 100 have division since we have 10k images at test time
+test_batch_size = 100
+
+
+if __name__ == "__main__":
+    print(f"Using {device} device")
+
+    validation_set_size = 5000
+
+    # if true use cifar 10 dataset otherwise cifar 100 data set is used
+    use_Cifar10 = False
+    # only a few epochs are needed since we start from the trained float model
+    num_qat_epochs = 5
+
+    if use_Cifar10 is True:
+        print("Dataset is CIFAR10")
+        validation_loader, training_dataloader = ldu.load_CIFAR10_train_validation(
+            train_batch_size, train_transformations, validation_set_size
+        )
+        test_dataloader = ldu.load_CIFAR10_test(test_batch_size, test_transformations)
+        num_classes = 10
+    else:
+        print("Dataset is CIFAR100")
+        validation_loader, training_dataloader = ldu.load_CIFAR100_train_validation(
+            train_batch_size, train_transformations, validation_set_size
+        )
+        test_dataloader = ldu.load_CIFAR100_test(test_batch_size, test_transformations)
+        num_classes = 100
+
+    loss_fn = nn.CrossEntropyLoss()
+
+    for name in [
+        "resnet56",
+        "resnet110",
+        "SE_resnet56",
+        "SE_resnet110",
+        "ViT_resnet56",
+        "ViT_resnet110",
+    ]:
+        print(f"------------- quantization aware training of {name} -----------------")
+        float_model = getattr(model, name)(num_classes)
+        utils.load_model(
+            float_model, f"{name}_cifar{num_classes}", "cpu", required=True
+        )
+
+        qat_model = quantization_util.prepare_qat(
+            float_model, (torch.randn(train_batch_size, 3, 32, 32),), device
+        )
+
+        # small learning rate since we are only fine-tuning the trained weights to the quantization noise
+        optimizer = torch.optim.SGD(
+            qat_model.parameters(), lr=0.001, momentum=0.9, weight_decay=0.0001
+        )
+        lr_scheduler = torch.optim.lr_scheduler.CosineAnnealingLR(
+            optimizer, num_qat_epochs
+        )
+        train(
+            num_qat_epochs,
+            training_dataloader,
+            validation_loader,
+            qat_model,
+            loss_fn,
+            optimizer,
+            lr_scheduler,
+        )
+        utils.clear_histogram()
+
+        quantized_model = quantization_util.convert_qat(qat_model)
+        quantization_util.compare_float_quantized(
+            name, float_model, quantized_model, test_dataloader
+        )
+        quantization_util.export_quantized(
+            quantized_model,
+            torch.randn(test_batch_size, 3, 32, 32),
+            f"checkpoints/{name}_cifar{num_classes}_qat_int8.pt",
+        )
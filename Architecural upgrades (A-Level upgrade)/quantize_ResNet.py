@@ -0,0 +1,72 @@
+import torch
+
+import model
+from ResNet import test_transformations
+
+import sys
+
+sys.path.append("../")
+from helpers import utils
+from helpers import load_data_util as ldu
+from helpers import quantization_util
+
+# small batches for the calibration so that we get a few hundred batches out of the validation set
+calibration_batch_size = 16
+num_calibration_batches = 300
+
+test_batch_size = 100
+
+
+if __name__ == "__main__":
+    # the quantized kernels only run on the cpu
+    device = "cpu"
+    print(f"Using {device} device")
+
+    validation_set_size = 5000
+
+    # if true use cifar 10 dataset otherwise cifar 100 data set is used
+    use_Cifar10 = True
+
+    if use_Cifar10 is True:
+        print("Dataset is CIFAR10")
+        validation_loader, _ = ldu.load_CIFAR10_train_validation(
+            calibration_batch_size, test_transformations, validation_set_size
+        )
+        test_dataloader = ldu.load_CIFAR10_test(test_batch_size, test_transformations)
+        num_classes = 10
+    else:
+        print("Dataset is CIFAR100")
+        validation_loader, _ = ldu.load_CIFAR100_train_validation(
+            calibration_batch_size, test_transformations, validation_set_size
+        )
+        test_dataloader = ldu.load_CIFAR100_test(test_batch_size, test_transformations)
+        num_classes = 100
+
+    for name in [
+        "resnet20",
+        "resnet56",
+        "resnet110",
+        "SE_resnet20",
+        "SE_resnet56",
+        "SE_resnet110",
+        "ViT_resnet20",
+        "ViT_resnet56",
+        "ViT_resnet110",
+    ]:
+        print(f"------------- quantizing {name} -----------------")
+        float_model = getattr(model, name)(num_classes).to(device)
+        utils.load_model(
+            float_model, f"{name}_cifar{num_classes}", device, required=True
+        )
+
+        quantized_model = quantization_util.quantize_static(
+            float_model, validation_loader, num_calibration_batches
+        )
+        quantization_util.compare_float_quantized(
+            name, float_model, quantized_model, test_dataloader
+        )
+        quantization_util.export_quantized(
+            quantized_model,
+            torch.randn(test_batch_size, 3, 32, 32),
+            f"checkpoints/{name}_cifar{num_classes}_int8.pt",
+        )
@@ -0,0 +1,83 @@
+import copy
+import functools
+
+import torch
+from torch import nn
+
+import model
+from blocks.RevResNetBlock import ReversibleSequential
+
+import sys
+
+sys.path.append("../")
+from helpers import benchmark_util
+
+num_classes = 10
+
+
+def check_reversible_gradients(name, batch_size=16):
+    # the gradients computed by reconstructing the activations have to match the ones autograd computes when every
+    # activation is stored, the reference model is the same model with the reversible stages as plain Sequentials
+    torch.manual_seed(0)
+    rev_resnet = getattr(model, name)(num_classes)
+    reference_resnet = copy.deepcopy(rev_resnet)
+    for stage in (
+        reference_resnet.layer1,
+        reference_resnet.layer2,
+        reference_resnet.layer3,
+    ):
+        stage[-1] = nn.Sequential(*stage[-1])
+
+    X = torch.randn(batch_size, 3, 32, 32, dtype=torch.float64, requires_grad=True)
+    y = torch.randint(0, num_classes, (batch_size,))
+    input_grads = []
+    # double precision so the difference that is left is from the reconstruction and not from the rounding
+    for m in (rev_resnet, reference_resnet):
+        m.double().train()
+        X.grad = None
+        nn.functional.cross_entropy(m(X), y).backward()
+        input_grads.append(X.grad)
+
+    max_grad_difference = max(
+        (p.grad - q.grad).abs().max().item()
+        for p, q in zip(rev_resnet.parameters(), reference_resnet.parameters())
+        if p.grad is not None
+    )
+    max_grad_difference = max(
+        max_grad_difference, (input_grads[0] - input_grads[1]).abs().max().item()
+    )
+    max_buffer_difference = max(
+        (a.double() - b.double()).abs().max().item()
+        for a, b in zip(rev_resnet.buffers(), reference_resnet.buffers())
+    )
+    return max_grad_difference, max_buffer_difference
+
+
+if __name__ == "__main__":
+    device = "cpu"
+    print(f"Using {device} device")
+
+    batch_size = 128
+
+    for name in ["rev_resnet20", "rev_resnet56"]:
+        max_grad_difference, max_buffer_difference = check_reversible_gradients(name)
+        print(
+            f"{name}: max gradient difference to autograd {max_grad_difference:.2e}, "
+            f"max batch norm statistics difference {max_buffer_difference:.2e}"
+        )
+
+    # the memory is measured as the peak resident memory of a fresh process for every model
+    print(f"------------- training memory, batch size {batch_size} -----------------")
+    for depth in [20, 56, 110]:
+        for name in [f"resnet{depth}", f"rev_resnet{depth}"]:
+            memory, images_per_second = benchmark_util.measure_training_memory(
+                functools.partial(getattr(model, name), num_classes),
+                batch_size,
+                num_classes,
+            )
+            num_params = sum(
+                p.numel() for p in getattr(model, name)(num_classes).parameters()
+            )
+            print(
+                f"{name:>13}: training memory {memory:7.0f} MB, {images_per_second:6.1f} img/s, {num_params} parameters"
+            )
@@ -0,0 +1,125 @@
+import time
+import types
+
+import torch
+from torch import nn
+
+import model
+from blocks.SE_ResNetBlock import SE_ResNetBlock
+from fuse_inference import fuse_for_inference
+
+import sys
+
+sys.path.append("../")
+from helpers import benchmark_util
+
+num_classes = 10
+
+
+def _legacy_se_block_forward(self, x):
+    # the SE path as it was before, pooling + flatten, the scale is expanded to the size of x and multiplied, the
+    # residual is then added to this separate scaled copy in the block
+    y = torch.flatten(nn.functional.adaptive_avg_pool2d(x, (1, 1)), 1)
+    y = self.se_operations(y)[:, :, None, None]
+    return x * y.expand_as(x)
+
+
+def _legacy_block_forward(self, x):
+    identity = x
+
+    x = self.conv_1(x)
+    x = self.bn_1(x)
+    x = self.relu(x)
+
+    x = self.conv_2(x)
+    x = self.bn_2(x)
+
+    x = _legacy_se_block_forward(self.se_layer, x)
+    x = x + self.residual(identity)
+
+    x = self.relu(x)
+    return x
+
+
+def use_legacy_se(resnet):
+    for m in resnet.modules():
+        if isinstance(m, SE_ResNetBlock):
+            m.forward = types.MethodType(_legacy_block_forward, m)
+    return resnet
+
+
+def measure_training_step(resnet, batch_size, num_warmup=2, num_iterations=10):
+    optimizer = torch.optim.SGD(resnet.parameters(), lr=0.1, momentum=0.9)
+    X = torch.randn(batch_size, 3, 32, 32)
+    y = torch.randint(0, num_classes, (batch_size,))
+
+    resnet.train()
+    for iteration in range(num_warmup + num_iterations):
+        if iteration == num_warmup:
+            start = time.perf_counter()
+        loss = nn.functional.cross_entropy(resnet(X), y)
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+    return (time.perf_counter() - start) / num_iterations
+
+
+if __name__ == "__main__":
+    device = "cpu"
+    print(f"Using {device} device")
+
+    inference_batch_size = 100
+    train_batch_size = 128
+
+    torch.manual_seed(0)
+    se_resnet56 = model.SE_resnet56(num_classes)
+    legacy_se_resnet56 = use_legacy_se(model.SE_resnet56(num_classes))
+    legacy_se_resnet56.load_state_dict(se_resnet56.state_dict())
+
+    # both SE paths have to compute the same function
+    example_input = torch.randn(inference_batch_size, 3, 32, 32)
+    se_resnet56.eval()
+    legacy_se_resnet56.eval()
+    with torch.inference_mode():
+        max_difference = (
+            (se_resnet56(example_input) - legacy_se_resnet56(example_input))
+            .abs()
+            .max()
+            .item()
+        )
+    print(
+        f"max difference between the legacy and the new SE path: {max_difference:.2e}"
+    )
+
+    models = [
+        ("resnet56", model.resnet56(num_classes)),
+        ("SE_resnet56 legacy", legacy_se_resnet56),
+        ("SE_resnet56", se_resnet56),
+    ]
+
+    print(
+        f"------------- inference, batch size {inference_batch_size} -----------------"
+    )
+    baseline_latency = None
+    for name, resnet in models:
+        # the bn folded models as they would be served, the gate depends on the input so it stays a separate operation
+        latency = benchmark_util.measure_latency(
+            fuse_for_inference(resnet), example_input
+        )
+        if baseline_latency is None:
+            baseline_latency = latency
+        print(
+            f"{name:>18}: {1000*latency:.2f} ms, overhead over resnet56 {100*(latency / baseline_latency - 1):.1f}%"
+        )
+
+    print(
+        f"------------- training step, batch size {train_batch_size} -----------------"
+    )
+    baseline_step_time = None
+    for name, resnet in models:
+        step_time = measure_training_step(resnet, train_batch_size)
+        if baseline_step_time is None:
+            baseline_step_time = step_time
+        print(
+            f"{name:>18}: {1000*step_time:.1f} ms, overhead over resnet56 {100*(step_time / baseline_step_time - 1):.1f}%"
+        )
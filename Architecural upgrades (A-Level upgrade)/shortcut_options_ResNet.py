@@ -0,0 +1,62 @@
+import torch
+
+import model
+from ResNet import test_transformations
+
+import sys
+
+sys.path.append("../")
+from helpers import utils
+from helpers import load_data_util as ldu
+from helpers import benchmark_util
+
+test_batch_size = 100
+
+
+if __name__ == "__main__":
+    device = (
+        "cuda"
+        if torch.cuda.is_available()
+        else "mps" if torch.backends.mps.is_available() else "cpu"
+    )
+    print(f"Using {device} device")
+
+    # if true use cifar 10 dataset otherwise cifar 100 data set is used
+    use_Cifar10 = True
+
+    if use_Cifar10 is True:
+        print("Dataset is CIFAR10")
+        test_dataloader = ldu.load_CIFAR10_test(test_batch_size, test_transformations)
+        num_classes = 10
+    else:
+        print("Dataset is CIFAR100")
+        test_dataloader = ldu.load_CIFAR100_test(test_batch_size, test_transformations)
+        num_classes = 100
+
+    example_input = next(iter(test_dataloader))[0].to(device)
+
+    # the option A models are trained with shortcut_option = "A" in ResNet.py
+    for name in ["resnet20", "resnet56", "resnet110"]:
+        print(f"------------- {name} -----------------")
+        for option, suffix in [("A", "_optionA"), ("B", "")]:
+            resnet = getattr(model, name)(num_classes, option=option).to(device)
+            found = utils.load_model(
+                resnet, f"{name}{suffix}_cifar{num_classes}", device
+            )
+
+            macs, num_params = benchmark_util.count_macs_and_params(
+                resnet, (3, 32, 32), device
+            )
+            latency = benchmark_util.measure_latency(resnet, example_input)
+            if found is True:
+                accuracy = utils.compute_accuracy_on_whole_dataloader(
+                    resnet, test_dataloader, device
+                )
+                accuracy = f"{(100*accuracy):>0.2f}%"
+            else:
+                accuracy = "not trained"
+
+            print(
+                f"option {option}: {macs / 1e6:.2f} MMACs, {num_params} parameters, "
+                f"latency {1000*latency:.2f} ms ({test_batch_size / latency:.0f} img/s), accuracy {accuracy}"
+            )
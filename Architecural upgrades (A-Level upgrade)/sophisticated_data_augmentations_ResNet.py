@@ -2,14 +2,14 @@ import torch
 from torch import nn
 from torchvision.transforms import v2
 
-from torchsummary import summary
-
 import model
 
 import sys
 
 sys.path.append("../")
 from helpers import utils
+from helpers import profiler_util
+from helpers import autocast_util
 from helpers import load_data_util as ldu
 
 
@@ -19,6 +19,13 @@ def he_initalization(m):
             torch.nn.init.kaiming_normal_(i.weight, mode="fan_in", nonlinearity="relu")
 
 
+# selecting the device at module level so that the train function can also be used when this file is imported
+device = (
+    "cuda"
+    if torch.cuda.is_available()
+    else "mps" if torch.backends.mps.is_available() else "cpu"
+)
+
 # this is the same as the ResNet paper
 train_batch_size = 128
 
@@ -63,10 +70,13 @@ def train(
     loss_fn,
     optimizer,
     lr_scheduler,
+    autocast_dtype=None,
 ):
 
     loss = []
 
+    grad_scaler = autocast_util.make_grad_scaler(device, autocast_dtype)
+
     # set the model on training model
     for current_epoch in range(0, epochs):
         print(f"current epoch: {current_epoch}")
@@ -80,10 +90,11 @@ def train(
             # print(f"{X.shape = }, {y.shape = }")
 
             # compute prediction error
-            # here we are making the prediction
-            trainig_pred = model(X)
-            # computing the loss from our prediction and true val
-            training_loss = loss_fn(trainig_pred, y)
+            # here we are making the prediction, with autocast the convs and linear layers run in bf16 / fp16
+            with autocast_util.autocast(device, autocast_dtype):
+                trainig_pred = model(X)
+            # computing the loss from our prediction and true val, the loss is always computed in fp32
+            training_loss = autocast_util.compute_loss(loss_fn, trainig_pred, y)
             # print(f"(inside train) training_loss: {training_loss}")
 
             # there is something wrong with pytorch where the loss have to be used in someway to make it actually work cutmix or mixup
@@ -92,11 +103,12 @@ def train(
             # have to zero out the gradients, for each batch since they can be accumulated
             optimizer.zero_grad()
 
-            # backpropagation
-            training_loss.backward()
+            # backpropagation, the scaler only scales the loss for fp16 on cuda otherwise this is a normal backward
+            grad_scaler.scale(training_loss).backward()
 
             # Adjust learning weights
-            optimizer.step()
+            grad_scaler.step(optimizer)
+            grad_scaler.update()
 
         loss.append(running_loss / len(training_dataloader))
 
@@ -107,6 +119,7 @@ def train(
             device,
             unmodified_training_dataloader,
             ummodified_validation_dataloader,
+            autocast_dtype,
         )
         # we step the lr scheduler this happens after each epoch
         lr_scheduler.step()
@@ -115,11 +128,6 @@ def train(
 
 
 if __name__ == "__main__":
-    device = (
-        "cuda"
-        if torch.cuda.is_available()
-        else "mps" if torch.backends.mps.is_available() else "cpu"
-    )
     print(f"Using {device} device")
 
     validation_set_size = 5000
@@ -128,6 +136,9 @@ if __name__ == "__main__":
     use_Cifar10 = True
     use_her_parameters = False
     num_epochs_to_train = 400
+    # run the convs and linear layers in bf16 (torch.bfloat16, cpus with AMX / AVX512-BF16) or fp16 (torch.float16,
+    # cuda), None trains in fp32
+    autocast_dtype = None
 
     # cifar 10 dataset
     if use_Cifar10 is True:
@@ -181,10 +192,10 @@ if __name__ == "__main__":
     resnet110 = model.resnet110(num_classes).to(device)
     resnet110.apply(he_initalization)
 
-    # ! torch summary only works with cpu or cuda and not mps
-    # print(summary(resnet20.to("cpu"), input_size=(3, 32, 32)))
-    # print(summary(resnet56.to("cpu"), input_size=(3, 32, 32)))
-    # print(summary(resnet110.to("cpu"), input_size=(3, 32, 32)))
+    # MACs, parameters, activation memory and forward / backward latency of every layer, works on every device
+    # profiler_util.print_profile(profiler_util.profile_model(resnet20, (3, 32, 32), device=device))
+    # profiler_util.print_profile(profiler_util.profile_model(resnet56, (3, 32, 32), device=device))
+    # profiler_util.print_profile(profiler_util.profile_model(resnet110, (3, 32, 32), device=device))
 
     # for name, param in resnet20.named_parameters():
     #     if param.requires_grad:
@@ -224,8 +235,10 @@ if __name__ == "__main__":
         loss_fn,
         optimizer,
         lr_scheduler,
+        autocast_dtype=autocast_dtype,
     )
-    utils.evaluate(resnet20, test_dataloader, loss_fn, device)
+    utils.evaluate(resnet20, test_dataloader, loss_fn, device, autocast_dtype)
+    utils.save_model(resnet20, f"sophisticated_resnet20_cifar{num_classes}")
     utils.plot_training_validation_loss_and_accuracy()
     utils.clear_histogram()
 
@@ -255,8 +268,10 @@ if __name__ == "__main__":
         loss_fn,
         optimizer,
         lr_scheduler,
+        autocast_dtype=autocast_dtype,
     )
-    utils.evaluate(resnet56, test_dataloader, loss_fn, device)
+    utils.evaluate(resnet56, test_dataloader, loss_fn, device, autocast_dtype)
+    utils.save_model(resnet56, f"sophisticated_resnet56_cifar{num_classes}")
     utils.plot_training_validation_loss_and_accuracy()
     utils.clear_histogram()
 
@@ -295,7 +310,9 @@ if __name__ == "__main__":
         loss_fn,
         optimizer,
         lr_scheduler,
+        autocast_dtype=autocast_dtype,
     )
-    utils.evaluate(resnet110, test_dataloader, loss_fn, device)
+    utils.evaluate(resnet110, test_dataloader, loss_fn, device, autocast_dtype)
+    utils.save_model(resnet110, f"sophisticated_resnet110_cifar{num_classes}")
     utils.plot_training_validation_loss_and_accuracy()
     utils.clear_histogram()
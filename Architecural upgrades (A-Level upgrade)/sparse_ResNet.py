@@ -0,0 +1,116 @@
+import torch
+from torch import nn
+
+import model
+from ResNet import (
+    device,
+    he_initalization,
+    train,
+    train_transformations,
+    test_transformations,
+)
+
+import sys
+
+sys.path.append("../")
+from helpers import utils
+from helpers import load_data_util as ldu
+from helpers import sparsity_util
+
+# this is the same as the ResNet paper
+train_batch_size = 128
+
+# setting batch size at test time to be 100 have division since we have 10k images at test time
+test_batch_size = 100
+
+
+if __name__ == "__main__":
+    print(f"Using {device} device")
+
+    validation_set_size = 5000
+
+    # if true use cifar 10 dataset otherwise cifar 100 data set is used
+    use_Cifar10 = True
+    model_name = "resnet56"
+    # if true the model is trained with gradual magnitude pruning when there is no checkpoint
+    train_missing_models = True
+    num_epochs_to_train = 200
+    # the sparsity of every pruned layer at the end of training
+    final_sparsity = 0.8
+    # the sparsity follows the cubic schedule from begin_epoch to end_epoch, it ends before the last lr decay so the
+    # network can recover from the pruning
+    begin_epoch = 20
+    end_epoch = 130
+    # the masks are updated every this many steps
+    pruning_update_every = 100
+    # the latency is measured for these sparsities, on the cpu since the sparse kernel is a cpu kernel
+    sparsity_levels = [0.5, 0.7, 0.8, 0.9]
+
+    if use_Cifar10 is True:
+        print("Dataset is CIFAR10")
+        validation_loader, training_dataloader = ldu.load_CIFAR10_train_validation(
+            train_batch_size, train_transformations, validation_set_size
+        )
+        test_dataloader = ldu.load_CIFAR10_test(test_batch_size, test_transformations)
+        num_classes = 10
+    else:
+        print("Dataset is CIFAR100")
+        validation_loader, training_dataloader = ldu.load_CIFAR100_train_validation(
+            train_batch_size, train_transformations, validation_set_size
+        )
+        test_dataloader = ldu.load_CIFAR100_test(test_batch_size, test_transformations)
+        num_classes = 100
+
+    loss_fn = nn.CrossEntropyLoss()
+
+    checkpoint_name = f"sparse_{final_sparsity}_{model_name}_cifar{num_classes}"
+    resnet = getattr(model, model_name)(num_classes).to(device)
+    found = utils.load_model(resnet, checkpoint_name, device)
+    if found is False and train_missing_models is True:
+        print(
+            f"------------- training {model_name} with gradual magnitude pruning to {final_sparsity} -----------------"
+        )
+        resnet.apply(he_initalization)
+        optimizer = torch.optim.SGD(
+            resnet.parameters(), lr=0.1, momentum=0.9, weight_decay=0.0001
+        )
+        lr_scheduler = torch.optim.lr_scheduler.MultiStepLR(
+            optimizer, [100, 150], gamma=0.1
+        )
+        pruner = sparsity_util.GradualMagnitudePruner(
+            resnet,
+            optimizer,
+            final_sparsity,
+            begin_step=begin_epoch * len(training_dataloader),
+            end_step=end_epoch * len(training_dataloader),
+            update_every=pruning_update_every,
+        )
+        train(
+            num_epochs_to_train,
+            training_dataloader,
+            validation_loader,
+            resnet,
+            loss_fn,
+            optimizer,
+            lr_scheduler,
+        )
+        pruner.remove()
+        print(f"sparsity of the pruned layers: {pruner.sparsity():.3f}")
+        utils.save_model(resnet, checkpoint_name)
+        utils.plot_training_validation_loss_and_accuracy()
+        utils.clear_histogram()
+
+    print(f"------------- {model_name} dense vs sparse inference -----------------")
+    utils.evaluate(resnet, test_dataloader, loss_fn, device)
+    resnet = resnet.cpu().eval()
+    sparse_resnet = sparsity_util.to_sparse_inference(resnet)
+    utils.evaluate(sparse_resnet, test_dataloader, loss_fn, "cpu")
+
+    # the sparsities below final_sparsity can't be reached from the pruned model, so the latency is measured with the
+    # dense model of ResNet.py (without the checkpoint the random weights give the same timings)
+    dense_resnet = getattr(model, model_name)(num_classes)
+    utils.load_model(dense_resnet, f"{model_name}_cifar{num_classes}", "cpu")
+    example_batch = next(iter(test_dataloader))[0]
+    sparsity_util.report_sparse_latency(
+        dense_resnet.eval(), sparsity_levels, example_batch
+    )
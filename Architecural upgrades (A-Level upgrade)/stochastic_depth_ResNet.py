@@ -0,0 +1,147 @@
+import time
+
+import torch
+from torch import nn
+
+import model
+from ResNet import (
+    device,
+    he_initalization,
+    train,
+    train_transformations,
+    test_transformations,
+)
+
+import sys
+
+sys.path.append("../")
+from helpers import utils
+from helpers import load_data_util as ldu
+from helpers import benchmark_util
+
+# this is the same as the ResNet paper
+train_batch_size = 128
+
+# setting batch size at test time to be 100 have division since we have 10k images at test time
+test_batch_size = 100
+
+
+def expected_training_macs(resnet, input_size=(3, 32, 32)):
+    # the MACs per image of a training forward pass, a dropped block only runs the shortcut so the residual branch of
+    # every block only counts with its survival probability
+    skipped_macs = 0
+
+    def make_hook(block):
+        def hook(module, inputs, output):
+            nonlocal skipped_macs
+            skipped_macs += (1 - block.survival_prob) * benchmark_util.module_macs(
+                module, output
+            )
+
+        return hook
+
+    handles = [
+        m.register_forward_hook(make_hook(block))
+        for layer in (resnet.layer1, resnet.layer2, resnet.layer3)
+        for block in layer
+        for name, m in block.named_modules()
+        if isinstance(m, (nn.Conv2d, nn.Linear)) and not name.startswith("residual")
+    ]
+
+    total_macs, _ = benchmark_util.count_macs_and_params(resnet, input_size, device)
+    for handle in handles:
+        handle.remove()
+
+    return total_macs - skipped_macs, total_macs
+
+
+if __name__ == "__main__":
+    print(f"Using {device} device")
+
+    validation_set_size = 5000
+
+    # if true use cifar 10 dataset otherwise cifar 100 data set is used
+    use_Cifar10 = True
+    # resnet56, resnet110, SE_resnet56 ...
+    model_name = "resnet110"
+    # the survival probability of the last block, 0.5 as in the stochastic depth paper
+    final_survival_prob = 0.5
+    num_epochs_to_train = 200
+
+    if use_Cifar10 is True:
+        print("Dataset is CIFAR10")
+        validation_loader, training_dataloader = ldu.load_CIFAR10_train_validation(
+            train_batch_size, train_transformations, validation_set_size
+        )
+        test_dataloader = ldu.load_CIFAR10_test(test_batch_size, test_transformations)
+        num_classes = 10
+    else:
+        print("Dataset is CIFAR100")
+        validation_loader, training_dataloader = ldu.load_CIFAR100_train_validation(
+            train_batch_size, train_transformations, validation_set_size
+        )
+        test_dataloader = ldu.load_CIFAR100_test(test_batch_size, test_transformations)
+        num_classes = 100
+
+    resnet = getattr(model, model_name)(
+        num_classes, stochastic_depth=final_survival_prob
+    ).to(device)
+    resnet.apply(he_initalization)
+
+    expected_macs, total_macs = expected_training_macs(resnet)
+    print(
+        f"expected training forward MACs: {expected_macs / 1e6:.1f}M of {total_macs / 1e6:.1f}M "
+        f"({100 * (1 - expected_macs / total_macs):.1f}% less)"
+    )
+    # the same model without stochastic depth for the wall clock of a training step
+    plain_resnet = getattr(model, model_name)(num_classes).to(device)
+    plain_step = benchmark_util.seconds_per_training_step(
+        plain_resnet, device, train_batch_size, num_classes
+    )
+    stochastic_depth_step = benchmark_util.seconds_per_training_step(
+        getattr(model, model_name)(
+            num_classes, stochastic_depth=final_survival_prob
+        ).to(device),
+        device,
+        train_batch_size,
+        num_classes,
+    )
+    print(
+        f"training step: {1000*plain_step:.1f} ms -> {1000*stochastic_depth_step:.1f} ms "
+        f"({100 * (1 - stochastic_depth_step / plain_step):.1f}% less)"
+    )
+
+    loss_fn = nn.CrossEntropyLoss()
+
+    print(
+        f"------------- working on {model_name} with stochastic depth {final_survival_prob} -----------------"
+    )
+    # the same warm up as for resnet110 in ResNet.py, lr 0.01 for the first epoch and then 0.1
+    optimizer = torch.optim.SGD(
+        resnet.parameters(), lr=0.01, momentum=0.9, weight_decay=0.0001
+    )
+    lr_scheduler = torch.optim.lr_scheduler.ChainedScheduler(
+        [
+            torch.optim.lr_scheduler.MultiStepLR(optimizer, [1], gamma=10),
+            torch.optim.lr_scheduler.MultiStepLR(optimizer, [100, 150], gamma=0.1),
+        ]
+    )
+    start = time.perf_counter()
+    train(
+        num_epochs_to_train,
+        training_dataloader,
+        validation_loader,
+        resnet,
+        loss_fn,
+        optimizer,
+        lr_scheduler,
+    )
+    print(f"training took {(time.perf_counter() - start) / 60:.1f} minutes")
+    utils.evaluate(resnet, test_dataloader, loss_fn, device)
+    # the survival probabilities aren't in the state dict, the model has to be built with the same stochastic depth
+    utils.save_model(
+        resnet,
+        f"stochastic_depth_{final_survival_prob}_{model_name}_cifar{num_classes}",
+    )
+    utils.plot_training_validation_loss_and_accuracy()
+    utils.clear_histogram()
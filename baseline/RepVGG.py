@@ -0,0 +1,126 @@
+import torch
+from torch import nn
+
+from VGG import VGG, _bn_scale_shift
+
+
+class RepVGGBlock(nn.Module):
+    # the training time block of RepVGG, relu(bn(conv3x3(x)) + bn(conv1x1(x)) + bn(x)). the identity branch only exists
+    # when the number of channels doesn't change. all of the branches are linear in eval mode, so after training they
+    # are merged into a single 3x3 conv with bias, see fused_conv
+    def __init__(self, in_channels, out_channels):
+        super().__init__()
+        self.in_channels = in_channels
+        self.out_channels = out_channels
+        self.conv3x3 = nn.Sequential(
+            nn.Conv2d(in_channels, out_channels, kernel_size=3, padding=1, bias=False),
+            nn.BatchNorm2d(out_channels),
+        )
+        self.conv1x1 = nn.Sequential(
+            nn.Conv2d(in_channels, out_channels, kernel_size=1, bias=False),
+            nn.BatchNorm2d(out_channels),
+        )
+        self.identity = None
+        if in_channels == out_channels:
+            self.identity = nn.BatchNorm2d(out_channels)
+        self.relu = nn.ReLU(inplace=True)
+
+    def forward(self, x):
+        out = self.conv3x3(x) + self.conv1x1(x)
+        if self.identity is not None:
+            out = out + self.identity(x)
+        return self.relu(out)
+
+    def fused_conv(self):
+        # every branch as a 3x3 kernel followed by its bn: the 1x1 kernel is the center of a 3x3 kernel and the identity
+        # is a 3x3 kernel with a 1 in the center for its own channel. with padding 1 they all see the same zero padded
+        # input, so folding each bn into its kernel and summing the kernels and biases gives the exact same output
+        kernel_1x1 = nn.functional.pad(self.conv1x1[0].weight, [1, 1, 1, 1])
+        branches = [
+            (self.conv3x3[0].weight, self.conv3x3[1]),
+            (kernel_1x1, self.conv1x1[1]),
+        ]
+        if self.identity is not None:
+            kernel_identity = torch.zeros_like(self.conv3x3[0].weight)
+            channels = torch.arange(self.out_channels)
+            kernel_identity[channels, channels, 1, 1] = 1
+            branches.append((kernel_identity, self.identity))
+
+        conv = nn.Conv2d(self.in_channels, self.out_channels, kernel_size=3, padding=1)
+        conv = conv.to(self.conv3x3[0].weight.device)
+        with torch.no_grad():
+            conv.weight.zero_()
+            conv.bias.zero_()
+            for kernel, bn in branches:
+                scale, shift = _bn_scale_shift(bn)
+                conv.weight.add_(kernel * scale[:, None, None, None])
+                conv.bias.add_(shift)
+        return conv
+
+
+class RepVGG(nn.Module):
+    # the layout of VGG3 (or any VGG of VGG.py without bn) where every conv + relu is a RepVGGBlock during training.
+    # the dropout is at the same places as in VGG.py with dropout_position "block"
+    def __init__(
+        self,
+        widths=(32, 64, 128),
+        convs_per_block=2,
+        dropout_rates=None,
+        classifier_dropout=0.0,
+        hidden_features=128,
+        num_classes=10,
+        input_size=32,
+    ):
+        super().__init__()
+        # to build the plain VGG with the same layout in reparameterize
+        self.config = dict(
+            widths=widths,
+            convs_per_block=convs_per_block,
+            dropout_rates=dropout_rates,
+            classifier_dropout=classifier_dropout,
+            hidden_features=hidden_features,
+            num_classes=num_classes,
+            input_size=input_size,
+        )
+        dropout_rates = dropout_rates or [0.0] * len(widths)
+
+        layers = []
+        in_channels = 3
+        for width, dropout_rate in zip(widths, dropout_rates):
+            for _ in range(convs_per_block):
+                layers.append(RepVGGBlock(in_channels, width))
+                in_channels = width
+            layers.append(nn.MaxPool2d(kernel_size=(2, 2)))
+            if dropout_rate > 0:
+                layers.append(nn.Dropout(dropout_rate))
+        self.features = nn.Sequential(*layers)
+
+        # the same classifier as VGG without bn, so its state dict can be copied as it is
+        spatial_size = input_size // 2 ** len(widths)
+        layers = [
+            nn.Linear(in_channels * spatial_size**2, hidden_features),
+            nn.ReLU(inplace=True),
+        ]
+        if classifier_dropout > 0:
+            layers.append(nn.Dropout(classifier_dropout))
+        layers.append(nn.Linear(hidden_features, num_classes))
+        self.classifier = nn.Sequential(*layers)
+
+    def forward(self, x):
+        x = self.features(x)
+        x = torch.flatten(x, 1)
+        x = self.classifier(x)
+        return x
+
+
+def reparameterize(repvgg):
+    # returns a plain VGG (conv -> relu, no bn) that gives the same outputs as the repvgg in eval mode, for the VGG3
+    # layout this is the same network as VGG3 so it runs at the speed of VGG3 and works with fold_for_inference and
+    # export_for_inference
+    vgg = VGG(**repvgg.config).to(next(repvgg.parameters()).device)
+    blocks = [m for m in repvgg.features if isinstance(m, RepVGGBlock)]
+    convs = [m for m in vgg.features if isinstance(m, nn.Conv2d)]
+    for block, conv in zip(blocks, convs):
+        conv.load_state_dict(block.eval().fused_conv().state_dict())
+    vgg.classifier.load_state_dict(repvgg.classifier.state_dict())
+    return vgg.eval()
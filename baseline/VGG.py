@@ -0,0 +1,236 @@
+import copy
+
+import torch
+from torch import nn
+from torch.nn.utils.fusion import fuse_conv_bn_eval, fuse_linear_bn_eval
+
+
+class VGG(nn.Module):
+    # one class for all of the VGG variants of the project. a block is convs_per_block 3x3 convs (each followed by a relu)
+    # and a 2x2 max pool, the classifier is a hidden linear layer + relu and the output layer.
+    # bn_position: None, "before_relu" (conv -> bn -> relu) or "after_relu" (conv -> relu -> bn)
+    # dropout_position: "block" puts the dropout after the max pool of every block and after the hidden layer, "layer"
+    # puts it after every relu (before the bn when it's after the relu)
+    def __init__(
+        self,
+        widths=(32, 64, 128),
+        convs_per_block=2,
+        bn_position=None,
+        dropout_rates=None,
+        classifier_dropout=0.0,
+        dropout_position="block",
+        bn_momentum=0.1,
+        hidden_features=128,
+        num_classes=10,
+        input_size=32,
+    ):
+        super().__init__()
+        if bn_position not in (None, "before_relu", "after_relu"):
+            raise ValueError("uncorrect bn position choosen")
+        if dropout_position not in ("block", "layer"):
+            raise ValueError("uncorrect dropout position choosen")
+        self.bn_position = bn_position
+        self.dropout_position = dropout_position
+        self.bn_momentum = bn_momentum
+        dropout_rates = dropout_rates or [0.0] * len(widths)
+
+        layers = []
+        in_channels = 3
+        for width, dropout_rate in zip(widths, dropout_rates):
+            for _ in range(convs_per_block):
+                layers.append(nn.Conv2d(in_channels, width, kernel_size=3, padding=1))
+                layers += self._activation(width, nn.BatchNorm2d, dropout_rate)
+                in_channels = width
+            layers.append(nn.MaxPool2d(kernel_size=(2, 2)))
+            if dropout_position == "block" and dropout_rate > 0:
+                layers.append(nn.Dropout(dropout_rate))
+        self.features = nn.Sequential(*layers)
+
+        spatial_size = input_size // 2 ** len(widths)
+        layers = [nn.Linear(in_channels * spatial_size**2, hidden_features)]
+        layers += self._activation(hidden_features, nn.BatchNorm1d, classifier_dropout)
+        if dropout_position == "block" and classifier_dropout > 0:
+            layers.append(nn.Dropout(classifier_dropout))
+        layers.append(nn.Linear(hidden_features, num_classes))
+        self.classifier = nn.Sequential(*layers)
+
+    def _activation(self, num_features, batch_norm, dropout_rate):
+        # the layers after a conv or the hidden linear layer
+        bn = []
+        if self.bn_position is not None:
+            bn = [batch_norm(num_features, momentum=self.bn_momentum)]
+        dropout = []
+        if self.dropout_position == "layer" and dropout_rate > 0:
+            dropout = [nn.Dropout(dropout_rate)]
+
+        if self.bn_position == "before_relu":
+            return bn + [nn.ReLU(inplace=True)] + dropout
+        return [nn.ReLU(inplace=True)] + dropout + bn
+
+    def forward(self, x):
+        x = self.features(x)
+        x = torch.flatten(x, 1)
+        x = self.classifier(x)
+        return x
+
+    def load_from_legacy(self, legacy_model):
+        # the classes in baseline/, baseline_dropout/, baseline_combined_reguralizations/ and VGG_dropout_BN_models/
+        # register their layers in the order of the forward pass like this class, so the layers with weights are matched
+        # by position and their checkpoints can be used with the builder
+        weight_types = (nn.Conv2d, nn.Linear, nn.BatchNorm2d, nn.BatchNorm1d)
+        layers = [m for m in self.modules() if isinstance(m, weight_types)]
+        legacy_layers = [
+            m for m in legacy_model.modules() if isinstance(m, weight_types)
+        ]
+        if [type(m) for m in layers] != [type(m) for m in legacy_layers]:
+            raise ValueError("the legacy model has a different layout than this VGG")
+
+        for layer, legacy_layer in zip(layers, legacy_layers):
+            layer.load_state_dict(legacy_layer.state_dict())
+
+
+# the variants that already exist as separate classes, the name is the one their checkpoints are saved with
+vgg_configs = {
+    "VGG1": dict(widths=(32,)),
+    "VGG2": dict(widths=(32, 64)),
+    "VGG3": dict(widths=(32, 64, 128)),
+    "VGG3_dropout": dict(dropout_rates=[0.2, 0.2, 0.2], classifier_dropout=0.2),
+    # baseline_combined_reguralizations keeps the keras value for the momentum
+    "VGG3_BN_Dropput": dict(
+        bn_position="after_relu",
+        dropout_rates=[0.2, 0.3, 0.4],
+        classifier_dropout=0.5,
+        bn_momentum=0.99,
+    ),
+    "VGG3_BN_dropout": dict(
+        bn_position="after_relu",
+        dropout_rates=[0.2, 0.3, 0.4],
+        classifier_dropout=0.5,
+        bn_momentum=0.01,
+    ),
+    "VGG3_dropout_BN": dict(
+        bn_position="after_relu",
+        dropout_rates=[0.2, 0.3, 0.4],
+        classifier_dropout=0.5,
+        dropout_position="layer",
+        bn_momentum=0.01,
+    ),
+    "VGG1_BN": dict(widths=(32,), bn_position="before_relu", bn_momentum=0.01),
+    "VGG2_BN": dict(widths=(32, 64), bn_position="before_relu", bn_momentum=0.01),
+    "VGG3_BN": dict(bn_position="before_relu", bn_momentum=0.01),
+}
+
+
+def build_vgg(name, **kwargs):
+    return VGG(**{**vgg_configs[name], **kwargs})
+
+
+# ----------------------- inference folding ----------------------------------------------------
+
+
+class ChannelShift(nn.Module):
+    # adds a constant to every channel, what is left of a bn after a relu once its scale is folded into the next conv
+    def __init__(self, shift):
+        super().__init__()
+        self.register_buffer("shift", shift.view(1, -1, 1, 1))
+
+    def forward(self, x):
+        return x + self.shift
+
+
+def _bn_scale_shift(bn):
+    # the bn in eval mode is x * scale + shift
+    scale = bn.weight / torch.sqrt(bn.running_var + bn.eps)
+    return scale, bn.bias - bn.running_mean * scale
+
+
+def _fold_into_conv(conv, scale, shift):
+    # the shift can't be folded into the bias of the next conv, the conv pads its input with zeros and at the border the
+    # bias would then also include the shift of the padded pixels. instead the input is shifted by shift / scale so that
+    # the padded zeros are exactly the pixels the bn maps to zero, then only the scale is left to fold into the weights:
+    # conv(x * scale + shift) = conv((x + shift / scale) * scale)
+    folded_conv = copy.deepcopy(conv)
+    folded_conv.weight.copy_(conv.weight * scale[None, :, None, None])
+    if torch.all(shift == 0):
+        return [folded_conv]
+    return [ChannelShift(shift / scale), folded_conv]
+
+
+def _fold_into_linear(linear, scale, shift):
+    # a bn2d before the flatten scales every channel, the flatten puts each channel as height * width features
+    spatial_size = linear.in_features // scale.numel()
+    scale = scale.repeat_interleave(spatial_size)
+    shift = shift.repeat_interleave(spatial_size)
+
+    folded_linear = copy.deepcopy(linear)
+    folded_linear.weight.copy_(linear.weight * scale[None, :])
+    folded_linear.bias.add_(linear.weight @ shift)
+    return folded_linear
+
+
+def fold_for_inference(vgg):
+    # returns a nn.Sequential that gives the same outputs as the vgg in eval mode:
+    # - dropout is removed
+    # - a bn right after a conv / linear is folded into it
+    # - a bn after a relu is folded into the next linear, or its scale into the next conv and its shift becomes a single
+    #   add right before that conv. a max pool in between commutes with it as long as every scale is positive (otherwise
+    #   the max would become the min and the bn is kept), the add then runs on the 4 times smaller pooled output
+    # after this every conv / linear is directly followed by its relu, torch.jit.optimize_for_inference then runs them
+    # as one fused kernel, see export_for_inference. the add stays in the oneDNN layout while the bn forced a conversion
+    # to the normal layout and back around every bn
+    vgg = copy.deepcopy(vgg).eval()
+    layers = [
+        m
+        for m in list(vgg.features) + [nn.Flatten()] + list(vgg.classifier)
+        if not isinstance(m, nn.Dropout)
+    ]
+
+    folded = []
+    # a bn after a relu that is waiting for the next conv / linear
+    pending_bn = None
+    with torch.no_grad():
+        for layer in layers:
+            if isinstance(layer, (nn.BatchNorm2d, nn.BatchNorm1d)):
+                if isinstance(folded[-1], nn.Conv2d):
+                    folded[-1] = fuse_conv_bn_eval(folded[-1], layer)
+                elif isinstance(folded[-1], nn.Linear):
+                    folded[-1] = fuse_linear_bn_eval(folded[-1], layer)
+                else:
+                    pending_bn = layer
+                continue
+
+            if pending_bn is not None:
+                scale, shift = _bn_scale_shift(pending_bn)
+                if (
+                    isinstance(layer, nn.Conv2d)
+                    and layer.groups == 1
+                    and torch.all(scale != 0)
+                ):
+                    folded += _fold_into_conv(layer, scale, shift)
+                    pending_bn = None
+                    continue
+                if isinstance(layer, nn.Linear):
+                    folded.append(_fold_into_linear(layer, scale, shift))
+                    pending_bn = None
+                    continue
+                if isinstance(layer, nn.Flatten) or (
+                    isinstance(layer, nn.MaxPool2d) and torch.all(scale > 0)
+                ):
+                    folded.append(layer)
+                    continue
+                # can't be moved past this layer
+                folded.append(pending_bn)
+                pending_bn = None
+
+            folded.append(layer)
+
+    if pending_bn is not None:
+        folded.append(pending_bn)
+    return nn.Sequential(*folded).eval()
+
+
+def export_for_inference(vgg):
+    # the folded model as a frozen TorchScript program, optimize_for_inference fuses every conv with its relu (oneDNN)
+    with torch.no_grad():
+        scripted = torch.jit.script(fold_for_inference(vgg).to("cpu"))
+        return torch.jit.optimize_for_inference(torch.jit.freeze(scripted))
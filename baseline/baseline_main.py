@@ -7,6 +7,10 @@ import sys
 sys.path.append("../")
 
 from baseline_combined_reguralizations.VGG3_BN_dropout import VGG3_BN_Dropput
+from helpers import autocast_util
+from helpers import compile_util
+from helpers import utils
+from helpers import profiler_util
 
 import torch
 from torch import nn
@@ -16,7 +20,6 @@ from torch.utils.data import DataLoader
 
 import matplotlib.pyplot as plt
 
-from torchsummary import summary
 
 train_model_training_loss_ls = []
 train_model_training_accuracy_ls = []
@@ -114,7 +117,7 @@ def he_initalization(m):
             nn.init.zeros_(i.bias)
 
 
-def evaluate(model, dataloader, loss_fn):
+def evaluate(model, dataloader, loss_fn, device, autocast_dtype=None):
     model.eval()
 
     dataset_size = len(dataloader.dataset)
@@ -128,10 +131,11 @@ def evaluate(model, dataloader, loss_fn):
             X, y = X.to(device), y.to(device)
 
             # making predictions
-            pred = model(X)
+            with autocast_util.autocast(device, autocast_dtype):
+                pred = model(X)
 
             # getting total loss
-            total_loss += loss_fn(pred, y).item()
+            total_loss += autocast_util.compute_loss(loss_fn, pred, y).item()
 
             num_correct += (pred.argmax(1) == y).type(torch.float).sum().item()
 
@@ -142,23 +146,30 @@ def evaluate(model, dataloader, loss_fn):
     )
 
 
-def compute_loss_on_whole_dataloader(model, dataloader):
+def compute_loss_on_whole_dataloader(
+    model, dataloader, loss_fn, device, autocast_dtype=None
+):
     running_loss = 0.0
 
     for valX, valy in dataloader:
         valX, valy = valX.to(device), valy.to(device)
 
         # make predictions
-        validation_pred = model(valX.to(device))
+        with autocast_util.autocast(device, autocast_dtype):
+            validation_pred = model(valX.to(device))
         # compute loss
-        validation_loss = loss_fn(validation_pred, valy.to(device))
+        validation_loss = autocast_util.compute_loss(
+            loss_fn, validation_pred, valy.to(device)
+        )
         # update running loss
         running_loss += validation_loss.item()
         
     return running_loss / len(dataloader)
 
 
-def compute_accuracy_on_whole_dataloader(model, dataloader):
+def compute_accuracy_on_whole_dataloader(
+    model, dataloader, device, autocast_dtype=None
+):
     dataset_size = len(dataloader.dataset)
 
     num_correct = 0
@@ -167,7 +178,8 @@ def compute_accuracy_on_whole_dataloader(model, dataloader):
             X, y = X.to(device), y.to(device)
 
             # making predictions
-            pred = model(X)
+            with autocast_util.autocast(device, autocast_dtype):
+                pred = model(X)
 
     num_correct = 0
     with torch.no_grad():
@@ -175,7 +187,8 @@ def compute_accuracy_on_whole_dataloader(model, dataloader):
             X, y = X.to(device), y.to(device)
 
             # making predictions
-            pred = model(X)
+            with autocast_util.autocast(device, autocast_dtype):
+                pred = model(X)
 
             num_correct += (pred.argmax(1) == y).type(torch.float).sum().item()
 
@@ -183,8 +196,26 @@ def compute_accuracy_on_whole_dataloader(model, dataloader):
 
 
 def train(
-    epochs, training_dataloader, validation_dataloader, model, loss_fn, optimizer
+    epochs,
+    training_dataloader,
+    validation_dataloader,
+    model,
+    loss_fn,
+    optimizer,
+    device,
+    use_compile=False,
+    autocast_dtype=None,
 ):
+    metrics_model = model
+    if use_compile is True:
+        # forward, loss, backward and optimizer step are compiled, the metrics are computed with a separate compiled model
+        train_step = compile_util.CompiledTrainStep(
+            model, loss_fn, optimizer, autocast_dtype
+        )
+        metrics_model = compile_util.CompiledEvalModel(model)
+
+    grad_scaler = autocast_util.make_grad_scaler(device, autocast_dtype)
+
     # set the model on training model
     for current_epoch in range(0, epochs):
         print(f"current epoch: {current_epoch}")
@@ -194,41 +225,55 @@ def train(
 
             X, y = X.to(device), y.to(device)
 
+            if use_compile is True:
+                train_step(X, y)
+                continue
+
             # compute prediction error
-            # here we are making the prediction
-            trainig_pred = model(X)
-            # computing the loss from our prediction and true val
-            loss = loss_fn(trainig_pred, y)
+            # here we are making the prediction, with autocast the convs and linear layers run in bf16 / fp16
+            with autocast_util.autocast(device, autocast_dtype):
+                trainig_pred = model(X)
+            # computing the loss from our prediction and true val, the loss is always computed in fp32
+            loss = autocast_util.compute_loss(loss_fn, trainig_pred, y)
 
             # have to zero out the gradients, for each batch since they can be accumulated
             optimizer.zero_grad()
 
-            # backpropagation
-            loss.backward()
+            # backpropagation, the scaler only scales the loss for fp16 on cuda otherwise this is a normal backward
+            grad_scaler.scale(loss).backward()
 
             # Adjust learning weights
-            optimizer.step()
+            grad_scaler.step(optimizer)
+            grad_scaler.update()
 
         # getting valiation loss now
-        model.eval()
+        metrics_model.eval()
 
-        training_loss = compute_loss_on_whole_dataloader(model, training_dataloader)
-        validation_loss = compute_loss_on_whole_dataloader(model, validation_dataloader)
+        training_loss = compute_loss_on_whole_dataloader(
+            metrics_model, training_dataloader, loss_fn, device, autocast_dtype
+        )
+        validation_loss = compute_loss_on_whole_dataloader(
+            metrics_model, validation_dataloader, loss_fn, device, autocast_dtype
+        )
 
         train_model_training_loss_ls.append(training_loss)
         validation_model_training_loss_ls.append(validation_loss)
 
-        training_acc = compute_accuracy_on_whole_dataloader(model, training_dataloader)
+        training_acc = compute_accuracy_on_whole_dataloader(
+            metrics_model, training_dataloader, device, autocast_dtype
+        )
         validation_acc = compute_accuracy_on_whole_dataloader(
-            model, validation_dataloader
+            metrics_model, validation_dataloader, device, autocast_dtype
         )
 
         train_model_training_accuracy_ls.append(training_acc)
         validation_model_training_accuracy_ls.append(validation_acc)
 
-        training_acc = compute_accuracy_on_whole_dataloader(model, training_dataloader)
+        training_acc = compute_accuracy_on_whole_dataloader(
+            model, training_dataloader, device, autocast_dtype
+        )
         validation_acc = compute_accuracy_on_whole_dataloader(
-            model, validation_dataloader
+            model, validation_dataloader, device, autocast_dtype
         )
 
         train_model_training_accuracy_ls.append(training_acc)
@@ -249,6 +294,13 @@ if __name__ == "__main__":
     print(f"Using {device} device")
 
     batch_size = 64
+    # torch.compile the training step, the compiled graphs are cached on disk so a rerun doesn't compile again
+    use_compile = False
+    # run the convs and linear layers in bf16 (torch.bfloat16, cpus with AMX / AVX512-BF16) or fp16 (torch.float16,
+    # cuda), None trains in fp32
+    autocast_dtype = None
+    if use_compile is True:
+        compile_util.enable_compile_cache()
 
     trainig_data, test_data = load_dataset()
     train_dataloader, test_dataloader = create_dataloaders(
@@ -269,16 +321,31 @@ if __name__ == "__main__":
     VGG3_BN_Dropput = VGG3_BN_Dropput().to(device)
     VGG3_BN_Dropput.apply(he_initalization)
 
-    # print(summary(VGG1.to("cpu"), input_size=(3, 32, 32)))
-    # print(summary(VGG2.to("cpu"), input_size=(3, 32, 32)))
-    # print(summary(VGG3.to("cpu"), input_size=(3, 32, 32)))
-    # print(summary(VGG3_BN_Dropput.to("cpu"), input_size=(3, 32, 32)))
+    # profiler_util.print_profile(profiler_util.profile_model(VGG1, (3, 32, 32), device=device))
+    # profiler_util.print_profile(profiler_util.profile_model(VGG2, (3, 32, 32), device=device))
+    # profiler_util.print_profile(profiler_util.profile_model(VGG3, (3, 32, 32), device=device))
+    # profiler_util.print_profile(profiler_util.profile_model(VGG3_BN_Dropput, (3, 32, 32), device=device))
 
 
     # defining loss function and optimizer
     loss_fn = nn.CrossEntropyLoss()
     optimize = torch.optim.SGD(VGG3_BN_Dropput.parameters(), lr=0.001, momentum=0.9)
 
-    train(100, train_dataloader, test_dataloader, VGG3_BN_Dropput, loss_fn, optimize)  # training
-    evaluate(VGG3_BN_Dropput, test_dataloader, loss_fn)  # evaluating
+    train(
+        100,
+        train_dataloader,
+        test_dataloader,
+        VGG3_BN_Dropput,
+        loss_fn,
+        optimize,
+        device,
+        use_compile,
+        autocast_dtype=autocast_dtype,
+    )  # training
+    evaluate(
+        VGG3_BN_Dropput, test_dataloader, loss_fn, device, autocast_dtype
+    )  # evaluating
+    # quantize_VGG.py, prune_VGG.py, export_VGG.py and fold_VGG.py load this checkpoint by the name of the model, it's
+    # the only VGG that is trained here so they only run on VGG3_BN_Dropput
+    utils.save_model(VGG3_BN_Dropput, "VGG3_BN_Dropput")
     plot_training_validation_loss_and_accuracy()
@@ -0,0 +1,37 @@
+import sys
+
+sys.path.append("../")
+
+from baseline_combined_reguralizations.VGG3_BN_dropout import VGG3_BN_Dropput
+from helpers import utils
+from helpers import benchmark_util
+from helpers import export_util
+
+
+if __name__ == "__main__":
+    # the exported programs are meant for the cpu inference workers
+    device = "cpu"
+    print(f"Using {device} device")
+
+    # if true the time from launching a new process to the first prediction is measured for the exported program
+    measure_cold_start = True
+
+    # baseline_main.py only saves the checkpoint of VGG3_BN_Dropput
+    for name, vgg in [("VGG3_BN_Dropput", VGG3_BN_Dropput())]:
+        print(f"------------- exporting {name} -----------------")
+        utils.load_model(vgg, name, device, required=True)
+
+        # the VGG models are trained on the images scaled to [0, 1] without any normalization, so only the scaling is
+        # baked into the exported program
+        path = f"checkpoints/{name}_torchscript.pt"
+        exported_vgg = export_util.export_torchscript(vgg, path)
+        max_difference, same_predictions = export_util.check_export(vgg, exported_vgg)
+        print(
+            f"saved to {path}, max logit difference: {max_difference:.2e}, same predictions: {(100*same_predictions):>0.1f}%"
+        )
+
+        if measure_cold_start is True:
+            loader_cold_start = benchmark_util.measure_cold_start(
+                [sys.executable, "../helpers/torchscript_loader.py", path]
+            )
+            print(f"cold start to first prediction: {1000*loader_cold_start:.0f} ms")
@@ -0,0 +1,88 @@
+from VGG import build_vgg, fold_for_inference, export_for_inference
+
+import sys
+
+sys.path.append("../")
+part_E_dir = "../part_E_further_exploration/different_order_batch_normalization_dropout/VGG_dropout_BN_models"
+sys.path.append(part_E_dir)
+
+from baseline_combined_reguralizations.VGG3_BN_dropout import VGG3_BN_Dropput
+from VGG3_BN_dropout import VGG3_BN_dropout
+from VGG3_dropout_BN import VGG3_dropout_BN
+from helpers import utils
+from helpers import load_data_util as ldu
+from helpers import benchmark_util
+
+import torch
+from torchvision.transforms import v2
+
+test_batch_size = 100
+
+# the VGG models are trained on the images scaled to [0, 1] without any normalization
+test_transformations = v2.Compose(
+    [
+        v2.ToImage(),
+        v2.ToDtype(torch.float32, scale=True),
+    ]
+)
+
+
+def compare_predictions(vgg, folded_vgg, dataloader):
+    max_difference, num_same = 0.0, 0
+    device = next(vgg.parameters()).device
+    with torch.inference_mode():
+        for X, _ in dataloader:
+            X = X.to(device)
+            expected = vgg(X)
+            folded = folded_vgg(X)
+            max_difference = max(max_difference, (expected - folded).abs().max().item())
+            num_same += (expected.argmax(1) == folded.argmax(1)).sum().item()
+    return max_difference, num_same / len(dataloader.dataset)
+
+
+if __name__ == "__main__":
+    # the folding is for the cpu inference workers
+    device = "cpu"
+    print(f"Using {device} device")
+
+    test_dataloader = ldu.load_CIFAR10_test(test_batch_size, test_transformations)
+    example_batch = next(iter(test_dataloader))[0]
+
+    # the checkpoints are saved with the legacy classes, baseline_main.py only saves VGG3_BN_Dropput and the part E
+    # models are saved next to their main.py
+    for name, legacy_vgg, checkpoint_dir in [
+        ("VGG3_BN_Dropput", VGG3_BN_Dropput(), "checkpoints"),
+        ("VGG3_BN_dropout", VGG3_BN_dropout(), f"{part_E_dir}/checkpoints"),
+        ("VGG3_dropout_BN", VGG3_dropout_BN(), f"{part_E_dir}/checkpoints"),
+    ]:
+        print(f"------------- folding {name} -----------------")
+        utils.load_model(legacy_vgg, name, device, checkpoint_dir, required=True)
+        vgg = build_vgg(name)
+        vgg.load_from_legacy(legacy_vgg)
+        vgg.eval()
+
+        folded_vgg = fold_for_inference(vgg)
+        exported_vgg = export_for_inference(vgg)
+        # the same export without the folding, freezing only folds the bns that come right after a conv
+        with torch.no_grad():
+            exported_unfolded_vgg = torch.jit.optimize_for_inference(
+                torch.jit.freeze(torch.jit.script(vgg))
+            )
+
+        max_difference, same_predictions = compare_predictions(
+            vgg, exported_vgg, test_dataloader
+        )
+        print(
+            f"max logit difference: {max_difference:.2e}, same predictions: {(100*same_predictions):>0.2f}%"
+        )
+
+        for batch in [example_batch, example_batch[:1]]:
+            latencies = [
+                benchmark_util.measure_latency(m, batch)
+                for m in (vgg, folded_vgg, exported_unfolded_vgg, exported_vgg)
+            ]
+            print(
+                f"batch of {len(batch)}: eager {1000*latencies[0]:.2f} ms, folded {1000*latencies[1]:.2f} ms, "
+                f"exported {1000*latencies[2]:.2f} ms, folded + exported {1000*latencies[3]:.2f} ms "
+                f"({latencies[0] / latencies[3]:.2f}x speedup)"
+            )
@@ -0,0 +1,84 @@
+import sys
+
+sys.path.append("../")
+
+from baseline_combined_reguralizations.VGG3_BN_dropout import VGG3_BN_Dropput
+from helpers import utils
+from helpers import benchmark_util
+from helpers import pruning_util
+import baseline_main
+
+import os
+
+import torch
+from torch import nn
+
+batch_size = 64
+
+
+def report(name, vgg, test_dataloader, loss_fn):
+    macs, num_params = benchmark_util.count_macs_and_params(vgg, (3, 32, 32), device)
+    latency = benchmark_util.measure_latency(
+        vgg, torch.randn(batch_size, 3, 32, 32, device=device)
+    )
+    num_correct, _ = utils.evaluate(vgg, test_dataloader, loss_fn, device)
+    accuracy = num_correct / len(test_dataloader.dataset)
+
+    print(
+        f"{name}: MACs: {macs / 1e6:.1f}M, params: {num_params / 1e3:.1f}K, "
+        f"latency: {1000*latency:.2f} ms, accuracy: {(100*accuracy):>0.3f}% \n"
+    )
+
+
+if __name__ == "__main__":
+    device = (
+        "cuda"
+        if torch.cuda.is_available()
+        else "mps" if torch.backends.mps.is_available() else "cpu"
+    )
+    print(f"Using {device} device")
+
+    # bn uses the magnitude of the bn gamma and l1 the l1 norm of the conv filters to score the channels
+    pruning_criterion = "bn"
+    num_finetune_epochs = 20
+    sparsity_levels = [0.25, 0.5, 0.75]
+
+    trainig_data, test_data = baseline_main.load_dataset()
+    train_dataloader, test_dataloader = baseline_main.create_dataloaders(
+        batch_size, trainig_data, test_data
+    )
+
+    loss_fn = nn.CrossEntropyLoss()
+
+    os.makedirs("checkpoints", exist_ok=True)
+    # baseline_main.py only saves the checkpoint of VGG3_BN_Dropput
+    for name, vgg in [("VGG3_BN_Dropput", VGG3_BN_Dropput())]:
+        vgg = vgg.to(device)
+        utils.load_model(vgg, name, device, required=True)
+        report(f"{name} unpruned", vgg, test_dataloader, loss_fn)
+
+        for sparsity in sparsity_levels:
+            print(
+                f"------------- pruning {name} with sparsity {sparsity} -----------------"
+            )
+            pruned_vgg = pruning_util.prune_vgg(vgg, sparsity, pruning_criterion)
+            report(f"{name} pruned {sparsity}", pruned_vgg, test_dataloader, loss_fn)
+
+            optimizer = torch.optim.SGD(pruned_vgg.parameters(), lr=0.001, momentum=0.9)
+            baseline_main.train(
+                num_finetune_epochs,
+                train_dataloader,
+                test_dataloader,
+                pruned_vgg,
+                loss_fn,
+                optimizer,
+                device,
+            )
+            report(
+                f"{name} pruned {sparsity} fine-tuned",
+                pruned_vgg,
+                test_dataloader,
+                loss_fn,
+            )
+
+            torch.save(pruned_vgg, f"checkpoints/{name}_pruned_{sparsity}.pt")
@@ -0,0 +1,55 @@
+import sys
+
+sys.path.append("../")
+
+from baseline_combined_reguralizations.VGG3_BN_dropout import VGG3_BN_Dropput
+from helpers import utils
+from helpers import load_data_util as ldu
+from helpers import quantization_util
+
+import torch
+from torchvision.transforms import v2
+
+# small batches for the calibration so that we get a few hundred batches out of the validation set
+calibration_batch_size = 16
+num_calibration_batches = 300
+
+test_batch_size = 64
+
+# the VGG models are trained on the images scaled to [0, 1] without any normalization
+test_transformations = v2.Compose(
+    [
+        v2.ToImage(),
+        v2.ToDtype(torch.float32, scale=True),
+    ]
+)
+
+
+if __name__ == "__main__":
+    # the quantized kernels only run on the cpu
+    device = "cpu"
+    print(f"Using {device} device")
+
+    validation_set_size = 5000
+
+    validation_loader, _ = ldu.load_CIFAR10_train_validation(
+        calibration_batch_size, test_transformations, validation_set_size
+    )
+    test_dataloader = ldu.load_CIFAR10_test(test_batch_size, test_transformations)
+
+    # baseline_main.py only saves the checkpoint of VGG3_BN_Dropput
+    for name, vgg in [("VGG3_BN_Dropput", VGG3_BN_Dropput())]:
+        print(f"------------- quantizing {name} -----------------")
+        utils.load_model(vgg, name, device, required=True)
+
+        quantized_vgg = quantization_util.quantize_static(
+            vgg, validation_loader, num_calibration_batches
+        )
+        quantization_util.compare_float_quantized(
+            name, vgg, quantized_vgg, test_dataloader
+        )
+        quantization_util.export_quantized(
+            quantized_vgg,
+            torch.randn(test_batch_size, 3, 32, 32),
+            f"checkpoints/{name}_int8.pt",
+        )
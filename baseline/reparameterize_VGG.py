@@ -0,0 +1,129 @@
+from RepVGG import RepVGG, reparameterize
+from VGG import build_vgg, export_for_inference
+from fold_VGG import compare_predictions
+
+import sys
+
+sys.path.append("../")
+
+from baseline_combined_reguralizations.VGG3_BN_dropout import VGG3_BN_Dropput
+from helpers import utils
+from helpers import benchmark_util
+import baseline_main
+
+import copy
+
+import torch
+from torch import nn
+
+batch_size = 64
+
+
+def check_random_statistics(repvgg, num_checks=5):
+    # a freshly initialized bn is the identity, so the conversion is also checked with random bn statistics and weights
+    max_difference = 0.0
+    for _ in range(num_checks):
+        random_repvgg = copy.deepcopy(repvgg).cpu().eval()
+        for m in random_repvgg.modules():
+            if isinstance(m, nn.BatchNorm2d):
+                m.running_mean.uniform_(-1, 1)
+                m.running_var.uniform_(0.5, 2)
+                nn.init.uniform_(m.weight, -1.5, 1.5)
+                nn.init.uniform_(m.bias, -1, 1)
+        X = torch.randn(batch_size, 3, 32, 32)
+        with torch.inference_mode():
+            difference = random_repvgg(X) - reparameterize(random_repvgg)(X)
+        max_difference = max(max_difference, difference.abs().max().item())
+    return max_difference
+
+
+if __name__ == "__main__":
+    device = (
+        "cuda"
+        if torch.cuda.is_available()
+        else "mps" if torch.backends.mps.is_available() else "cpu"
+    )
+    print(f"Using {device} device")
+
+    # if true RepVGG3 is trained when there is no checkpoint, otherwise the conversion and latency use random weights
+    train_missing_models = True
+    num_epochs_to_train = 100
+    # the same regularization as VGG3_BN_Dropput so the accuracy can be compared
+    dropout_rates = [0.2, 0.3, 0.4]
+    classifier_dropout = 0.5
+
+    trainig_data, test_data = baseline_main.load_dataset()
+    train_dataloader, test_dataloader = baseline_main.create_dataloaders(
+        batch_size, trainig_data, test_data
+    )
+
+    loss_fn = nn.CrossEntropyLoss()
+
+    repvgg = RepVGG(
+        dropout_rates=dropout_rates, classifier_dropout=classifier_dropout
+    ).to(device)
+    found = utils.load_model(repvgg, "RepVGG3", device)
+    if found is False and train_missing_models is True:
+        # the default initialization, the convs don't have a bias for he_initalization of baseline_main
+        optimizer = torch.optim.SGD(repvgg.parameters(), lr=0.001, momentum=0.9)
+        baseline_main.train(
+            num_epochs_to_train,
+            train_dataloader,
+            test_dataloader,
+            repvgg,
+            loss_fn,
+            optimizer,
+            device,
+        )
+        utils.save_model(repvgg, "RepVGG3")
+
+    print(f"------------- reparameterizing RepVGG3 -----------------")
+    print(
+        f"max logit difference with random bn statistics: {check_random_statistics(repvgg):.2e}"
+    )
+    vgg = reparameterize(repvgg)
+    max_difference, same_predictions = compare_predictions(
+        repvgg.eval(), vgg, test_dataloader
+    )
+    print(
+        f"max logit difference on the test set: {max_difference:.2e}, same predictions: {(100*same_predictions):>0.2f}%"
+    )
+
+    baseline = VGG3_BN_Dropput().to(device)
+    baseline_found = utils.load_model(baseline, "VGG3_BN_Dropput", device)
+    for name, model in [
+        ("RepVGG3", repvgg),
+        ("RepVGG3 reparameterized", vgg),
+        ("VGG3_BN_Dropput", baseline),
+    ]:
+        if name == "VGG3_BN_Dropput" and baseline_found is False:
+            continue
+        print(name)
+        utils.evaluate(model, test_dataloader, loss_fn, device)
+
+    # the latency on the cpu inference workers, the exported programs fold the bns of VGG3_BN_Dropput and fuse every
+    # conv with its relu
+    legacy_baseline = baseline
+    baseline = build_vgg("VGG3_BN_Dropput")
+    baseline.load_from_legacy(legacy_baseline)
+    repvgg, vgg, baseline = repvgg.cpu(), vgg.cpu(), baseline.cpu().eval()
+    example_batch = next(iter(test_dataloader))[0].cpu()
+    for batch in [example_batch, example_batch[:1]]:
+        print(f"------------- latency with a batch of {len(batch)} -----------------")
+        for name, model in [
+            ("RepVGG3", repvgg),
+            ("RepVGG3 reparameterized", vgg),
+            ("VGG3_BN_Dropput", baseline),
+            ("RepVGG3 reparameterized exported", export_for_inference(vgg)),
+            ("VGG3_BN_Dropput exported", export_for_inference(baseline)),
+        ]:
+            latency = benchmark_util.measure_latency(model, batch)
+            print(f"{name}: {1000*latency:.2f} ms")
+
+    for name, model in [
+        ("RepVGG3", repvgg),
+        ("RepVGG3 reparameterized", vgg),
+        ("VGG3_BN_Dropput", baseline),
+    ]:
+        macs, num_params = benchmark_util.count_macs_and_params(model, (3, 32, 32))
+        print(f"{name}: MACs: {macs / 1e6:.1f}M, params: {num_params / 1e3:.1f}K")
@@ -0,0 +1,91 @@
+from VGG import build_vgg
+
+import sys
+
+sys.path.append("../")
+
+from baseline_combined_reguralizations.VGG3_BN_dropout import VGG3_BN_Dropput
+from helpers import utils
+from helpers import sparsity_util
+import baseline_main
+
+import torch
+from torch import nn
+
+batch_size = 64
+
+
+if __name__ == "__main__":
+    device = (
+        "cuda"
+        if torch.cuda.is_available()
+        else "mps" if torch.backends.mps.is_available() else "cpu"
+    )
+    print(f"Using {device} device")
+
+    # if true the model is trained with gradual magnitude pruning when there is no checkpoint
+    train_missing_models = True
+    num_epochs_to_train = 100
+    # the sparsity of every pruned layer at the end of training
+    final_sparsity = 0.8
+    # the sparsity follows the cubic schedule from begin_epoch to end_epoch, the last epochs recover from the pruning
+    begin_epoch = 10
+    end_epoch = 70
+    # the masks are updated every this many steps
+    pruning_update_every = 100
+    # the latency is measured for these sparsities, on the cpu since the sparse kernel is a cpu kernel
+    sparsity_levels = [0.5, 0.7, 0.8, 0.9]
+
+    trainig_data, test_data = baseline_main.load_dataset()
+    train_dataloader, test_dataloader = baseline_main.create_dataloaders(
+        batch_size, trainig_data, test_data
+    )
+
+    loss_fn = nn.CrossEntropyLoss()
+
+    checkpoint_name = f"sparse_{final_sparsity}_VGG3_BN_Dropput"
+    vgg = build_vgg("VGG3_BN_Dropput").to(device)
+    found = utils.load_model(vgg, checkpoint_name, device)
+    if found is False and train_missing_models is True:
+        print(
+            f"------------- training VGG3_BN_Dropput with gradual magnitude pruning to {final_sparsity} -----------------"
+        )
+        vgg.apply(baseline_main.he_initalization)
+        optimizer = torch.optim.SGD(vgg.parameters(), lr=0.001, momentum=0.9)
+        pruner = sparsity_util.GradualMagnitudePruner(
+            vgg,
+            optimizer,
+            final_sparsity,
+            begin_step=begin_epoch * len(train_dataloader),
+            end_step=end_epoch * len(train_dataloader),
+            update_every=pruning_update_every,
+        )
+        baseline_main.train(
+            num_epochs_to_train,
+            train_dataloader,
+            test_dataloader,
+            vgg,
+            loss_fn,
+            optimizer,
+            device,
+        )
+        pruner.remove()
+        print(f"sparsity of the pruned layers: {pruner.sparsity():.3f}")
+        utils.save_model(vgg, checkpoint_name)
+
+    print(f"------------- VGG3_BN_Dropput dense vs sparse inference -----------------")
+    utils.evaluate(vgg, test_dataloader, loss_fn, device)
+    vgg = vgg.cpu().eval()
+    sparse_vgg = sparsity_util.to_sparse_inference(vgg)
+    utils.evaluate(sparse_vgg, test_dataloader, loss_fn, "cpu")
+
+    # the sparsities below final_sparsity can't be reached from the pruned model, so the latency is measured with the
+    # dense model of baseline_main.py (without the checkpoint the random weights give the same timings)
+    legacy_vgg = VGG3_BN_Dropput()
+    utils.load_model(legacy_vgg, "VGG3_BN_Dropput", "cpu")
+    dense_vgg = build_vgg("VGG3_BN_Dropput")
+    dense_vgg.load_from_legacy(legacy_vgg)
+    example_batch = next(iter(test_dataloader))[0]
+    sparsity_util.report_sparse_latency(
+        dense_vgg.eval(), sparsity_levels, example_batch
+    )
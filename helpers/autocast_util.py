@@ -0,0 +1,28 @@
+import contextlib
+
+import torch
+
+
+def autocast(device, autocast_dtype):
+	# autocast_dtype None is normal fp32, torch.bfloat16 is the mode for cpus with AMX / AVX512-BF16, torch.float16
+	# is mainly for cuda (on the cpu only a few operations have fp16 kernels).
+	# only the operations that profit from it (conv, linear, matmul) run in the lower precision, the parameters and the
+	# batch norm statistics are kept in fp32 and the batch norm accumulates in fp32
+	if autocast_dtype is None:
+		return contextlib.nullcontext()
+	return torch.autocast(device_type=torch.device(device).type, dtype=autocast_dtype)
+
+
+def compute_loss(loss_fn, pred, y):
+	# the loss is always computed in fp32 from the (possibly bf16 / fp16) logits, the softmax, log and the clamping
+	# in label smoothing and SymmetricCrossEntropyLearning are not precise enough in 16 bits
+	with torch.autocast(device_type=pred.device.type, enabled=False):
+		return loss_fn(pred.float(), y)
+
+
+def make_grad_scaler(device, autocast_dtype):
+	# fp16 has a small range so the small gradients underflow to zero, the loss is scaled up before the backward and
+	# the gradients are scaled back before the step. bf16 has the same range as fp32 and doesn't need this, and the
+	# scaler of this torch version only exists for cuda. when disabled the scaler just calls backward and step
+	enabled = autocast_dtype == torch.float16 and torch.device(device).type == "cuda"
+	return torch.cuda.amp.GradScaler(enabled=enabled)
@@ -0,0 +1,183 @@
+import os
+import subprocess
+import time
+
+import torch
+import torch.multiprocessing as mp
+from torch import nn
+
+
+def synchronize(device):
+	# kernels on the gpu are launched asynchronously so we have to wait for them to finish before reading the clock
+	if torch.device(device).type == "cuda":
+		torch.cuda.synchronize()
+	elif torch.device(device).type == "mps":
+		torch.mps.synchronize()
+
+
+def measure_latency(model, example_input, num_warmup=10, num_iterations=50):
+	model.eval()
+
+	with torch.inference_mode():
+		# the first calls are slower since memory has to be allocated and kernels are selected
+		for _ in range(num_warmup):
+			model(example_input)
+		synchronize(example_input.device)
+
+		start = time.perf_counter()
+		for _ in range(num_iterations):
+			model(example_input)
+		synchronize(example_input.device)
+
+	# average seconds for a single forward pass
+	return (time.perf_counter() - start) / num_iterations
+
+
+def module_macs(module, output):
+	# only the conv and linear layers are counted since they are where almost all of the compute is
+	if isinstance(module, nn.Conv2d):
+		# every output value needs (in_channels / groups) * kernel_height * kernel_width multiply accumulates
+		return output.numel() * module.weight[0].numel()
+	if isinstance(module, nn.Linear):
+		return output.numel() * module.in_features
+	return 0
+
+
+def count_macs_and_params(model, input_size, device="cpu"):
+	macs = 0
+
+	def count_hook(module, inputs, output):
+		nonlocal macs
+		macs += module_macs(module, output)
+
+	handles = [
+		m.register_forward_hook(count_hook)
+		for m in model.modules()
+		if isinstance(m, (nn.Conv2d, nn.Linear))
+	]
+
+	model.eval()
+	with torch.inference_mode():
+		# a batch of a single image so the count is per image
+		model(torch.zeros(1, *input_size, device=device))
+
+	for handle in handles:
+		handle.remove()
+
+	num_params = sum(p.numel() for p in model.parameters())
+	return macs, num_params
+
+
+def seconds_per_training_step(model, device, batch_size=128, num_classes=10, num_steps=20, num_warmup_steps=3):
+	# the average wall clock of forward, backward and optimizer step on a random batch, in the same process unlike
+	# measure_training_memory so the model can be changed in between (e.g. freezing stages)
+	optimizer = torch.optim.SGD(model.parameters(), lr=0.1, momentum=0.9)
+	loss_fn = nn.CrossEntropyLoss()
+	X = torch.randn(batch_size, 3, 32, 32, device=device)
+	y = torch.randint(0, num_classes, (batch_size,), device=device)
+
+	model.train()
+	for step in range(num_warmup_steps + num_steps):
+		if step == num_warmup_steps:
+			synchronize(device)
+			start = time.perf_counter()
+		loss = loss_fn(model(X), y)
+		optimizer.zero_grad()
+		loss.backward()
+		optimizer.step()
+	synchronize(device)
+	return (time.perf_counter() - start) / num_steps
+
+
+def measure_cold_start(command, cwd=None, num_runs=5):
+	# time from launching a new python process until it prints its first prediction, so the interpreter start, the
+	# imports and building / loading the model are all included, the command has to print a line starting with
+	# "prediction" once the first prediction is done
+	times = []
+	for _ in range(num_runs):
+		start = time.perf_counter()
+		process = subprocess.Popen(command, cwd=cwd, stdout=subprocess.PIPE, text=True)
+		for line in process.stdout:
+			if line.startswith("prediction"):
+				times.append(time.perf_counter() - start)
+				break
+		process.stdout.close()
+		process.wait()
+		if process.returncode != 0:
+			raise RuntimeError(f"{' '.join(command)} exited with code {process.returncode}")
+
+	# the median since the first run also has to load the files from disk into the page cache
+	return sorted(times)[len(times) // 2]
+
+
+def _peak_rss_mb():
+	# VmHWM is the peak resident memory of the process, unlike ru_maxrss it is not inherited from the parent process
+	# (linux only, the value is in kilobytes)
+	with open("/proc/self/status") as status:
+		for line in status:
+			if line.startswith("VmHWM:"):
+				return int(line.split()[1]) / 1024
+
+
+def _train_in_process(build_model, batch_size, num_classes, num_warmup_steps, num_steps, result_queue):
+	torch.manual_seed(0)
+	model = build_model()
+	optimizer = torch.optim.SGD(model.parameters(), lr=0.1, momentum=0.9)
+	loss_fn = nn.CrossEntropyLoss()
+	X = torch.randn(batch_size, 3, 32, 32)
+	y = torch.randint(0, num_classes, (batch_size,))
+
+	peak_before = _peak_rss_mb()
+
+	model.train()
+	for step in range(num_warmup_steps + num_steps):
+		if step == num_warmup_steps:
+			start = time.perf_counter()
+		loss = loss_fn(model(X), y)
+		optimizer.zero_grad()
+		loss.backward()
+		optimizer.step()
+	images_per_second = num_steps * batch_size / (time.perf_counter() - start)
+
+	result_queue.put((_peak_rss_mb() - peak_before, images_per_second))
+
+
+def _run_training_in_fresh_process(build_model, batch_size, num_classes, num_warmup_steps, num_steps, environment):
+	context = mp.get_context("spawn")
+	result_queue = context.SimpleQueue()
+	process = context.Process(
+		target=_train_in_process,
+		args=(build_model, batch_size, num_classes, num_warmup_steps, num_steps, result_queue),
+	)
+
+	# the child process copies the environment when it is started
+	original_environment = dict(os.environ)
+	os.environ.update(environment)
+	try:
+		process.start()
+	finally:
+		os.environ.clear()
+		os.environ.update(original_environment)
+
+	memory, images_per_second = result_queue.get()
+	process.join()
+	return memory, images_per_second
+
+
+def measure_training_memory(build_model, batch_size, num_classes=10, num_warmup_steps=2, num_steps=10):
+	# the training runs in a fresh process since the peak memory of a process can't be reset, the difference between
+	# the peak before and after training is the memory used by the training steps (activations, gradients and optimizer
+	# state), this is the resident memory which is what limits the number of jobs on the cpu nodes.
+	# build_model has to be picklable (e.g. functools.partial of a model factory)
+
+	# glibc raises its mmap threshold every time a large block is freed, after that the freed activations are kept in
+	# the heap instead of going back to the os and the peak shows the allocator cache and not the tensors that were
+	# alive, so for the memory the threshold is fixed. this makes the training slower, the throughput is measured in a
+	# second process with the normal allocator
+	memory, _ = _run_training_in_fresh_process(
+		build_model, batch_size, num_classes, 0, 1 + num_warmup_steps, {"MALLOC_MMAP_THRESHOLD_": "131072"}
+	)
+	_, images_per_second = _run_training_in_fresh_process(
+		build_model, batch_size, num_classes, num_warmup_steps, num_steps, {}
+	)
+	return memory, images_per_second
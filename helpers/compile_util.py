@@ -0,0 +1,103 @@
+import os
+
+import torch
+import torch._inductor.config
+from torch import nn
+
+from helpers import autocast_util
+
+
+def enable_compile_cache(cache_dir="../compile_cache"):
+	# inductor writes the generated kernels into this directory and with the fx graph cache turned on a rerun of the
+	# script finds the already compiled graphs there instead of compiling them again
+	os.environ["TORCHINDUCTOR_CACHE_DIR"] = os.path.abspath(cache_dir)
+	torch._inductor.config.fx_graph_cache = True
+
+
+class CompiledTrainStep:
+	def __init__(self, model, loss_fn, optimizer, autocast_dtype=None):
+		self.model = model
+		self.loss_fn = loss_fn
+		self.optimizer = optimizer
+		self.autocast_dtype = autocast_dtype
+
+		# forward and loss are compiled as one graph, AOTAutograd then also generates a compiled graph for the backward
+		self.compiled_forward_loss = torch.compile(self._forward_loss, dynamic=False)
+		self.compiled_optimizer_step = torch.compile(self._optimizer_step)
+
+		self.batch_size = None
+		# one lr tensor per param group that is updated in place, see _use_lr_tensors
+		self.lr_tensors = [
+			torch.tensor(float(group["lr"]), dtype=torch.float64) for group in optimizer.param_groups
+		]
+
+	def _forward_loss(self, X, y):
+		with autocast_util.autocast(X.device, self.autocast_dtype):
+			pred = self.model(X)
+		return autocast_util.compute_loss(self.loss_fn, pred, y)
+
+	def _optimizer_step(self):
+		# dynamo can't compile the bound optimizer.step directly, it has to be called from inside a function
+		self.optimizer.step()
+
+	def _use_lr_tensors(self):
+		# dynamo guards on python floats, so with the lr as a float every new value of the lr scheduler compiles the
+		# optimizer step again until the cache limit is hit and it falls back to eager. the schedulers write a new value
+		# (float or tensor) into the param group, it is copied into the same tensor every step so the guard never changes
+		for group, lr_tensor in zip(self.optimizer.param_groups, self.lr_tensors):
+			if group["lr"] is not lr_tensor:
+				lr_tensor.fill_(float(group["lr"]))
+				group["lr"] = lr_tensor
+
+	def __call__(self, X, y):
+		# the graphs are compiled for the shape of the first batch, the smaller last batch of an epoch would trigger
+		# a recompilation so that single batch runs eagerly instead
+		if self.batch_size is None:
+			self.batch_size = X.size(0)
+			self.grad_scaler = autocast_util.make_grad_scaler(X.device, self.autocast_dtype)
+
+		if X.size(0) == self.batch_size:
+			training_loss = self.compiled_forward_loss(X, y)
+		else:
+			training_loss = self._forward_loss(X, y)
+
+		# the very first step creates the optimizer state (momentum buffers etc.), dynamo in torch 2.2 fails to trace
+		# that so it is done eagerly and the compiled step is used from the second step on
+		if len(self.optimizer.state) > 0:
+			self._use_lr_tensors()
+			optimizer_step = self.compiled_optimizer_step
+		else:
+			optimizer_step = self.optimizer.step
+
+		self.optimizer.zero_grad()
+		self.grad_scaler.scale(training_loss).backward()
+		if self.grad_scaler.is_enabled():
+			# fp16 on cuda, the scaler has to check the gradients for inf / nan before stepping which runs eagerly
+			self.grad_scaler.step(self.optimizer)
+			self.grad_scaler.update()
+		else:
+			optimizer_step()
+
+		return training_loss
+
+
+class CompiledEvalModel(nn.Module):
+	# separate compiled model for evaluation, the train step never sees the model in eval mode and this never sees it
+	# in train mode, so switching between training and computing the metrics doesn't recompile anything
+	def __init__(self, model):
+		super().__init__()
+		self.model = model
+		self.compiled_model = torch.compile(model, dynamic=False)
+		self.batch_size = 0
+
+	def forward(self, x):
+		num_samples = x.size(0)
+		self.batch_size = max(self.batch_size, num_samples)
+
+		# the last batch is padded with zeros to the shape that is already compiled, in eval mode every sample is
+		# computed independently so the padding doesn't change the predictions of the real samples
+		if num_samples < self.batch_size:
+			padding = x.new_zeros(self.batch_size - num_samples, *x.shape[1:])
+			x = torch.cat([x, padding])
+
+		return self.compiled_model(x)[:num_samples]
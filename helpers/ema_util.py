@@ -0,0 +1,66 @@
+import contextlib
+
+import torch
+
+
+class ModelEMA:
+	# exponential moving average of the weights, ema = decay * ema + (1 - decay) * weights. the model keeps training
+	# with its own weights, the average is only swapped in for evaluating and saving.
+	#
+	# the update runs every update_every steps with decay ** update_every, so the average covers the same number of
+	# steps as updating every step, and all tensors are updated with one multi-tensor lerp instead of a loop over them.
+	# the only extra memory is the average itself.
+	#
+	# bn_buffers "average": the running mean / var of the bns are averaged like the weights (the statistics of the raw
+	# model belong to the raw weights), "raw": the ema weights are evaluated with the running statistics of the model.
+	# recompute_bn_statistics computes the exact statistics of the ema weights with a pass over the training data
+	def __init__(self, model, decay=0.999, update_every=1, bn_buffers="average"):
+		if bn_buffers not in ("average", "raw"):
+			raise ValueError("uncorrect bn buffer handling choosen")
+		self.model = model
+		self.decay = decay
+		self.update_every = update_every
+		self.bn_buffers = bn_buffers
+		self.num_steps = 0
+
+		# num_batches_tracked is an integer and only used when the bn has no momentum, it stays the one of the model
+		self.tensors = list(model.parameters())
+		if bn_buffers == "average":
+			self.tensors += [b for b in model.buffers() if b.is_floating_point()]
+		self.ema_tensors = [t.detach().clone() for t in self.tensors]
+
+	@torch.no_grad()
+	def step(self):
+		# called after every optimizer step
+		self.num_steps += 1
+		if self.num_steps % self.update_every != 0:
+			return
+		torch._foreach_lerp_(self.ema_tensors, [t.detach() for t in self.tensors], 1 - self.decay**self.update_every)
+
+	def _exchange(self):
+		# the model tensors and the ema tensors trade their storage, nothing is copied. the parameters stay the same
+		# objects so the optimizer state and the autograd graph of the next step aren't affected
+		for i, tensor in enumerate(self.tensors):
+			raw = tensor.data
+			tensor.data = self.ema_tensors[i]
+			self.ema_tensors[i] = raw
+
+	@contextlib.contextmanager
+	def swap(self):
+		# with ema.swap(): the model has the ema weights, afterwards it has its own weights again
+		self._exchange()
+		try:
+			yield self.model
+		finally:
+			self._exchange()
+
+	def recompute_bn_statistics(self, dataloader, device):
+		# the statistics of the ema weights from a pass over the data, they are stored in the ema bn buffers
+		if self.bn_buffers != "average":
+			raise ValueError("the bn statistics can only be recomputed when the ema keeps its own bn buffers")
+		with self.swap():
+			torch.optim.swa_utils.update_bn(dataloader, self.model, device)
+
+	def num_bytes(self):
+		return sum(t.numel() * t.element_size() for t in self.ema_tensors)
+
@@ -0,0 +1,54 @@
+import copy
+import os
+
+import torch
+from torch import nn
+
+# the normalization used by the ResNet scripts, the VGG models are trained without normalization
+cifar_mean = [0.4914, 0.4822, 0.4465]
+cifar_std = [0.2023, 0.1994, 0.2010]
+
+
+class Uint8InputModel(nn.Module):
+	# takes the raw uint8 images (N, 3, 32, 32) and does what ToDtype(scale=True) + Normalize do in the test
+	# transformations, so the exported program doesn't need torchvision to preprocess the images
+	def __init__(self, model, mean=None, std=None):
+		super().__init__()
+		self.model = model
+		mean = mean if mean is not None else [0.0, 0.0, 0.0]
+		std = std if std is not None else [1.0, 1.0, 1.0]
+		# the 1 / 255 scaling is merged with the std so only a single multiply and subtract is needed
+		self.register_buffer("scale", 1 / (255 * torch.tensor(std).view(1, -1, 1, 1)))
+		self.register_buffer("shift", (torch.tensor(mean) / torch.tensor(std)).view(1, -1, 1, 1))
+
+	def forward(self, x):
+		return self.model(x.float() * self.scale - self.shift)
+
+
+def export_torchscript(model, path, mean=None, std=None, example_batch_size=1):
+	wrapped_model = Uint8InputModel(copy.deepcopy(model).to("cpu").eval(), mean, std).eval()
+	example_input = torch.randint(0, 256, (example_batch_size, 3, 32, 32), dtype=torch.uint8)
+
+	with torch.no_grad():
+		traced_model = torch.jit.trace(wrapped_model, example_input)
+	# freezing inlines the weights as constants and folds the batch norms into the convs, the saved file then contains
+	# the whole program and can be loaded with torch.jit.load without any of the python classes
+	frozen_model = torch.jit.freeze(traced_model)
+
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	torch.jit.save(frozen_model, path)
+	return frozen_model
+
+
+def check_export(model, exported_model, mean=None, std=None, batch_size=100):
+	# the exported program should give the same logits as the python model given the same images
+	wrapped_model = Uint8InputModel(copy.deepcopy(model).to("cpu").eval(), mean, std).eval()
+	images = torch.randint(0, 256, (batch_size, 3, 32, 32), dtype=torch.uint8)
+
+	with torch.inference_mode():
+		expected = wrapped_model(images)
+		exported = exported_model(images)
+
+	max_difference = (expected - exported).abs().max().item()
+	same_predictions = (expected.argmax(1) == exported.argmax(1)).float().mean().item()
+	return max_difference, same_predictions
@@ -0,0 +1,208 @@
+import copy
+
+import torch
+from torch import nn
+
+from helpers import benchmark_util
+
+
+# ----------------------- factorizing a single conv ----------------------------------------------------
+#
+# svd: the spatially separable factorization of Jaderberg et al., a 3x1 conv to rank channels followed by a 1x3 conv.
+# the kernel W[o, c, h, w] is reshaped to the matrix A[(c, h), (o, w)], since the output is
+# sum_(c, h, w) W[o, c, h, w] x[c, y + h, x + w] the truncated svd A = U S V^T gives the 3x1 kernel from U and the 1x3
+# kernel from S V^T. with the full rank (min(3c, 3o)) the two convs give exactly the same output as the 3x3 conv, the
+# zero padding of the 1x3 conv pads the output of the 3x1 conv with zeros just like the padded input would give.
+#
+# tucker: the tucker-2 decomposition of Kim et al., a 1x1 conv to in_rank channels, a 3x3 conv from in_rank to
+# out_rank channels and a 1x1 conv back to the output channels. the 1x1 kernels are the leading singular vectors of
+# the kernel unfolded along the input and the output channels (HOSVD) and the 3x3 core is the kernel projected on them
+
+
+def _unfold(weight, mode):
+	# the kernel as a matrix with the channels of the mode as rows
+	return weight.transpose(0, mode).reshape(weight.size(mode), -1)
+
+
+def _singular_values(conv, method):
+	weight = conv.weight.detach().float()
+	if method == "svd":
+		out_channels, in_channels, kernel_height, kernel_width = weight.shape
+		matrix = weight.permute(1, 2, 0, 3).reshape(in_channels * kernel_height, out_channels * kernel_width)
+		return [torch.linalg.svdvals(matrix)]
+	if method == "tucker":
+		return [torch.linalg.svdvals(_unfold(weight, 1)), torch.linalg.svdvals(_unfold(weight, 0))]
+	raise ValueError("uncorrect factorization method choosen")
+
+
+def full_ranks(conv, method):
+	# the ranks that give the exact same conv, svd: one rank, tucker: (in_rank, out_rank)
+	return [s.numel() for s in _singular_values(conv, method)]
+
+
+def energy_ranks(conv, method, energy):
+	# the smallest ranks that keep the fraction energy of the squared singular values
+	ranks = []
+	for singular_values in _singular_values(conv, method):
+		cumulative_energy = torch.cumsum(singular_values**2, 0) / (singular_values**2).sum()
+		ranks.append(int(torch.searchsorted(cumulative_energy, torch.tensor(energy)).item()) + 1)
+	return [min(rank, s.numel()) for rank, s in zip(ranks, _singular_values(conv, method))]
+
+
+def factorized_num_params(conv, method, ranks):
+	out_channels, in_channels, kernel_height, kernel_width = conv.weight.shape
+	if method == "svd":
+		return ranks[0] * (in_channels * kernel_height + out_channels * kernel_width)
+	in_rank, out_rank = ranks
+	return in_channels * in_rank + in_rank * out_rank * kernel_height * kernel_width + out_rank * out_channels
+
+
+def factorize_conv(conv, method, ranks):
+	# returns a nn.Sequential of the factor convs, the conv has to be a 3x3 conv without groups and dilation
+	weight = conv.weight.detach().float()
+	out_channels, in_channels, kernel_height, kernel_width = weight.shape
+	(stride_height, stride_width), (padding_height, padding_width) = conv.stride, conv.padding
+
+	if method == "svd":
+		rank = ranks[0]
+		matrix = weight.permute(1, 2, 0, 3).reshape(in_channels * kernel_height, out_channels * kernel_width)
+		U, S, Vh = torch.linalg.svd(matrix, full_matrices=False)
+		# the singular values are split evenly between the two factors so they have the same scale
+		root_S = torch.sqrt(S[:rank])
+		vertical_weight = (U[:, :rank] * root_S).T.reshape(rank, in_channels, kernel_height, 1)
+		horizontal_weight = (root_S[:, None] * Vh[:rank]).reshape(rank, out_channels, kernel_width)
+		horizontal_weight = horizontal_weight.permute(1, 0, 2).unsqueeze(2)
+
+		factors = [
+			nn.Conv2d(
+				in_channels,
+				rank,
+				kernel_size=(kernel_height, 1),
+				stride=(stride_height, 1),
+				padding=(padding_height, 0),
+				bias=False,
+			),
+			nn.Conv2d(
+				rank,
+				out_channels,
+				kernel_size=(1, kernel_width),
+				stride=(1, stride_width),
+				padding=(0, padding_width),
+				bias=conv.bias is not None,
+			),
+		]
+		factor_weights = [vertical_weight, horizontal_weight]
+	elif method == "tucker":
+		in_rank, out_rank = ranks
+		U_in = torch.linalg.svd(_unfold(weight, 1), full_matrices=False)[0][:, :in_rank]
+		U_out = torch.linalg.svd(_unfold(weight, 0), full_matrices=False)[0][:, :out_rank]
+		# core[r_out, r_in, h, w] = sum_(o, c) U_out[o, r_out] U_in[c, r_in] W[o, c, h, w]
+		core = torch.einsum("ochw,or,cs->rshw", weight, U_out, U_in)
+
+		factors = [
+			nn.Conv2d(in_channels, in_rank, kernel_size=1, bias=False),
+			nn.Conv2d(
+				in_rank,
+				out_rank,
+				kernel_size=(kernel_height, kernel_width),
+				stride=conv.stride,
+				padding=conv.padding,
+				bias=False,
+			),
+			nn.Conv2d(out_rank, out_channels, kernel_size=1, bias=conv.bias is not None),
+		]
+		factor_weights = [U_in.T[:, :, None, None], core, U_out[:, :, None, None]]
+	else:
+		raise ValueError("uncorrect factorization method choosen")
+
+	with torch.no_grad():
+		for factor, factor_weight in zip(factors, factor_weights):
+			factor.weight.copy_(factor_weight)
+		if conv.bias is not None:
+			factors[-1].bias.copy_(conv.bias)
+	return nn.Sequential(*factors).to(device=conv.weight.device, dtype=conv.weight.dtype)
+
+
+def _candidate_ranks(conv, method, num_candidates):
+	# evenly spaced ranks from 1 / num_candidates of the full ranks up to the full ranks, largest first
+	ranks = full_ranks(conv, method)
+	return [
+		[max(1, round(rank * i / num_candidates)) for rank in ranks] for i in range(num_candidates, 0, -1)
+	]
+
+
+# ----------------------- ResNet factorization ----------------------------------------------------
+
+
+def _block_convs(resnet):
+	if any(getattr(m, "reversible", False) for m in resnet.modules()) or any(
+		hasattr(m, "conv_3") for m in resnet.modules()
+	):
+		# only the two 3x3 convs of the basic (or SE) block are factorized
+		raise ValueError("only ResNets with the basic (or SE) block can be factorized")
+	return [
+		(block, name)
+		for stage in (resnet.layer1, resnet.layer2, resnet.layer3)
+		for block in stage
+		for name in ("conv_1", "conv_2")
+	]
+
+
+def _conv_inputs(resnet, block_convs, example_input):
+	# the input of every conv for the example batch, to time the conv on its own
+	inputs = {}
+
+	def make_hook(key):
+		def hook(module, args):
+			inputs[key] = args[0].detach()
+
+		return hook
+
+	handles = [
+		getattr(block, name).register_forward_pre_hook(make_hook((id(block), name))) for block, name in block_convs
+	]
+	resnet.eval()
+	with torch.no_grad():
+		resnet(example_input)
+	for handle in handles:
+		handle.remove()
+	return inputs
+
+
+def factorize_resnet(resnet, method="svd", energy=0.9, latency_budget=None, example_input=None, num_candidates=8):
+	# returns a new model where the 3x3 convs of every block are factorized, the original is not modified.
+	# the ranks of every conv are chosen on their own:
+	# - latency_budget None: the smallest ranks that keep the fraction energy of the singular values
+	# - latency_budget: the largest of num_candidates ranks for which the factorized conv takes at most
+	#   latency_budget times the time of the 3x3 conv on the example_input batch
+	# a conv is kept as it is when the factorization has at least as many parameters (and so MACs) as the conv or no
+	# rank fits the latency budget. returns the model and the ranks of every factorized conv (None when kept)
+	factorized_resnet = copy.deepcopy(resnet)
+	block_convs = _block_convs(factorized_resnet)
+	if latency_budget is not None:
+		if example_input is None:
+			raise ValueError("choosing the ranks by a latency budget needs an example input")
+		inputs = _conv_inputs(factorized_resnet, block_convs, example_input)
+
+	chosen_ranks = []
+	for block, name in block_convs:
+		conv = getattr(block, name)
+		if latency_budget is None:
+			ranks = energy_ranks(conv, method, energy)
+		else:
+			conv_input = inputs[(id(block), name)]
+			budget = latency_budget * benchmark_util.measure_latency(conv, conv_input, num_iterations=20)
+			ranks = None
+			for candidate in _candidate_ranks(conv, method, num_candidates):
+				factors = factorize_conv(conv, method, candidate)
+				if benchmark_util.measure_latency(factors, conv_input, num_iterations=20) <= budget:
+					ranks = candidate
+					break
+
+		if ranks is None or factorized_num_params(conv, method, ranks) >= conv.weight.numel():
+			chosen_ranks.append(None)
+			continue
+		setattr(block, name, factorize_conv(conv, method, ranks))
+		chosen_ranks.append(ranks)
+
+	return factorized_resnet, chosen_ranks
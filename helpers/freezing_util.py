@@ -0,0 +1,100 @@
+import torch
+
+
+def _keep_eval_mode(module, inputs):
+	# the train loops call model.train() before every batch, this puts a frozen stage (and its bn) back into eval mode
+	# right before it runs so the running statistics stay the ones it was frozen with
+	if module.training:
+		module.eval()
+
+
+def _flat_weights(module):
+	return torch.cat([p.detach().flatten().float().cpu() for p in module.parameters()])
+
+
+class ProgressiveFreezer:
+	# freezes the early stages of a model one after the other during training. a frozen stage has requires_grad=False
+	# on all of its parameters and its bn in eval mode, since it is at the start of the model nothing before it needs a
+	# gradient either, so autograd doesn't record anything for it and the backward stops at the first trainable stage.
+	# the stages are always frozen in order, the next one can only be frozen once all of the ones before it are.
+	#
+	# criterion "epoch": stage i is frozen after the epoch freeze_epochs[i] - 1, so it doesn't train from freeze_epochs[i]
+	# criterion "weight_change": a stage is frozen once the relative change of its weights over an epoch,
+	# ||w_epoch - w_previous_epoch|| / ||w_previous_epoch||, stayed below threshold for patience epochs in a row. the
+	# weight change over an epoch is the sum of the (lr scaled) gradient steps, so it measures the same as the gradient
+	# norm without having to look at every step
+	def __init__(
+		self,
+		model,
+		stage_names=("initial", "layer1"),
+		criterion="epoch",
+		freeze_epochs=(150, 175),
+		threshold=0.005,
+		patience=2,
+	):
+		if criterion not in ("epoch", "weight_change"):
+			raise ValueError("uncorrect freezing criterion choosen")
+		if criterion == "epoch" and len(freeze_epochs) != len(stage_names):
+			raise ValueError("every stage needs a freeze epoch")
+
+		self.stages = [(name, getattr(model, name)) for name in stage_names]
+		self.criterion = criterion
+		self.freeze_epochs = freeze_epochs
+		self.threshold = threshold
+		self.patience = patience
+
+		self.num_frozen = 0
+		self.frozen_at_epoch = {}
+		self.handles = []
+		self.epochs_below_threshold = 0
+		self.previous_weights = None
+		if criterion == "weight_change":
+			self.previous_weights = _flat_weights(self.stages[0][1])
+
+	def _freeze_next_stage(self, epoch):
+		name, stage = self.stages[self.num_frozen]
+		for param in stage.parameters():
+			param.requires_grad = False
+			# the optimizer skips parameters without a gradient, so no momentum or weight decay is applied anymore
+			param.grad = None
+		stage.eval()
+		self.handles.append(stage.register_forward_pre_hook(_keep_eval_mode))
+
+		print(f"freezing {name} after epoch {epoch}")
+		self.frozen_at_epoch[name] = epoch
+		self.num_frozen += 1
+		self.epochs_below_threshold = 0
+		if self.num_frozen < len(self.stages) and self.criterion == "weight_change":
+			self.previous_weights = _flat_weights(self.stages[self.num_frozen][1])
+
+	def step(self, epoch):
+		# called at the end of every epoch
+		if self.num_frozen == len(self.stages):
+			return
+
+		if self.criterion == "epoch":
+			while self.num_frozen < len(self.stages) and epoch + 1 >= self.freeze_epochs[self.num_frozen]:
+				self._freeze_next_stage(epoch)
+			return
+
+		name, stage = self.stages[self.num_frozen]
+		weights = _flat_weights(stage)
+		relative_change = ((weights - self.previous_weights).norm() / self.previous_weights.norm()).item()
+		self.previous_weights = weights
+		print(f"relative weight change of {name}: {relative_change:.2e}")
+
+		if relative_change < self.threshold:
+			self.epochs_below_threshold += 1
+		else:
+			self.epochs_below_threshold = 0
+		if self.epochs_below_threshold >= self.patience:
+			self._freeze_next_stage(epoch)
+
+	def unfreeze(self):
+		for handle in self.handles:
+			handle.remove()
+		for _, stage in self.stages[: self.num_frozen]:
+			for param in stage.parameters():
+				param.requires_grad = True
+		self.handles = []
+		self.num_frozen = 0
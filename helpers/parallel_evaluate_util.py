@@ -0,0 +1,106 @@
+import math
+
+import torch
+import torch.multiprocessing as mp
+from torch.utils.data import DataLoader, Subset
+
+from helpers import autocast_util
+from helpers import utils
+
+
+def _evaluate_shard(
+	rank, model, dataset, batch_size, loss_fn, num_threads, autocast_dtype, result_queue
+):
+	# every process gets its own share of the cores, otherwise K processes each using all threads will just fight
+	# each other and be slower than a single process
+	torch.set_num_threads(num_threads)
+
+	# shuffle is off so the batches of this shard are exactly the same batches as in a single process evaluation
+	dataloader = DataLoader(dataset, batch_size, shuffle=False, num_workers=0)
+
+	num_correct = 0
+	total_loss = 0.0
+	with torch.no_grad():
+		for X, y in dataloader:
+			with autocast_util.autocast("cpu", autocast_dtype):
+				pred = model(X)
+
+			total_loss += autocast_util.compute_loss(loss_fn, pred, y).item()
+			num_correct += (pred.argmax(1) == y).sum().item()
+
+	# sending back python numbers instead of tensors, the child is gone once it has put its result and shared memory
+	# tensors would need the producer to stay alive
+	result_queue.put((rank, num_correct, total_loss, len(dataloader)))
+
+
+def evaluate(
+	model,
+	dataloader,
+	loss_fn,
+	device,
+	num_processes=4,
+	num_threads_per_process=None,
+	autocast_dtype=None,
+):
+	# sharding is only useful when we evaluate on the cpu, on a gpu a single process is already saturating the device
+	if device != "cpu" or num_processes <= 1:
+		return utils.evaluate(model, dataloader, loss_fn, device, autocast_dtype)
+
+	model.eval()
+	# the weights are put in shared memory so the processes don't each get their own copy of the model
+	model.share_memory()
+
+	dataset = dataloader.dataset
+	batch_size = dataloader.batch_size
+	dataset_size = len(dataset)
+	num_batches = math.ceil(dataset_size / batch_size)
+	num_processes = min(num_processes, num_batches)
+
+	if num_threads_per_process is None:
+		num_threads_per_process = max(1, torch.get_num_threads() // num_processes)
+
+	ctx = mp.get_context("spawn")
+	result_queue = ctx.SimpleQueue()
+
+	processes = []
+	for rank in range(num_processes):
+		# splitting on whole batches so that the mean loss is computed over the same batches as utils.evaluate does
+		first_batch = rank * num_batches // num_processes
+		last_batch = (rank + 1) * num_batches // num_processes
+		shard = Subset(
+			dataset,
+			range(first_batch * batch_size, min(last_batch * batch_size, dataset_size)),
+		)
+
+		process = ctx.Process(
+			target=_evaluate_shard,
+			args=(
+				rank,
+				model,
+				shard,
+				batch_size,
+				loss_fn,
+				num_threads_per_process,
+				autocast_dtype,
+				result_queue,
+			),
+		)
+		process.start()
+		processes.append(process)
+
+	results = sorted(result_queue.get() for _ in processes)
+	for process in processes:
+		process.join()
+
+	# reducing in rank order, the counts are integers so the sum is exact no matter how the data was sharded
+	num_correct = torch.tensor([r[1] for r in results], dtype=torch.int64).sum().item()
+	total_loss = torch.tensor([r[2] for r in results], dtype=torch.float64).sum().item()
+	assert sum(r[3] for r in results) == num_batches
+
+	total_loss /= num_batches
+	accuracy = num_correct / dataset_size
+	print(
+		f"Test Data ({num_processes} processes, {num_threads_per_process} threads each): \n Accuracy: {(100*accuracy):>0.3f}%, Avg loss: {total_loss:>8f} \n"
+	)
+
+	return num_correct, total_loss
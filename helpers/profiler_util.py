@@ -0,0 +1,241 @@
+import copy
+import json
+import os
+import time
+
+import torch
+from torch import nn
+
+from helpers.benchmark_util import module_macs, synchronize
+
+
+def _leaf_modules(model):
+	# the layers that do the work, the containers (Sequential, blocks, ...) are only used to roll the numbers up
+	return [(name, m) for name, m in model.named_modules() if len(list(m.children())) == 0]
+
+
+def _new_entry(name, module):
+	return {
+		"name": name,
+		"type": type(module).__name__,
+		"output_shape": None,
+		"calls": 0,
+		"macs": 0,
+		"params": sum(p.numel() for p in module.parameters(recurse=False)),
+		"activation_bytes": 0,
+		"forward_ms": 0.0,
+		"backward_ms": 0.0,
+	}
+
+
+def _forward_pass_statistics(model, entries, X, num_warmup, num_iterations):
+	# MACs, activation size and forward latency of every leaf module in eval mode (inference)
+	modules = dict(_leaf_modules(model))
+	starts = {}
+	counting, timing = True, False
+	device = X.device
+
+	def pre_hook(module, inputs):
+		if timing:
+			synchronize(device)
+			starts.setdefault(module, []).append(time.perf_counter())
+
+	def hook(module, inputs, output):
+		entry = entries[module_names[module]]
+		if timing:
+			synchronize(device)
+			entry["forward_ms"] += 1000 * (time.perf_counter() - starts[module].pop())
+		if not counting:
+			return
+
+		# a module can be called more than once in a forward pass (e.g. the relu of a block), all calls are counted.
+		# the numbers are per image so that models profiled with different batch sizes can be compared
+		entry["calls"] += 1
+		entry["output_shape"] = list(output.shape[1:])
+		entry["macs"] += module_macs(module, output) // X.size(0)
+		# an in-place operation (ReLU(inplace=True)) writes into its input and doesn't need new memory
+		if not (inputs and isinstance(inputs[0], torch.Tensor) and inputs[0].data_ptr() == output.data_ptr()):
+			entry["activation_bytes"] += output.numel() * output.element_size() // X.size(0)
+
+	module_names = {m: name for name, m in modules.items()}
+	handles = []
+	for m in modules.values():
+		handles.append(m.register_forward_pre_hook(pre_hook))
+		handles.append(m.register_forward_hook(hook))
+
+	model.eval()
+	with torch.inference_mode():
+		# the first call counts the MACs and the activations, the following ones are the warmup and then the timing
+		model(X)
+		counting = False
+		for _ in range(num_warmup):
+			model(X)
+		timing = True
+		for _ in range(num_iterations):
+			model(X)
+
+	for handle in handles:
+		handle.remove()
+
+	for entry in entries.values():
+		entry["forward_ms"] /= num_iterations
+
+	# the forward of the whole model without the hooks, the time of the modules includes the overhead of the hooks and
+	# doesn't include the operations that are not modules (residual add, flatten, ...)
+	with torch.inference_mode():
+		synchronize(device)
+		start = time.perf_counter()
+		for _ in range(num_iterations):
+			model(X)
+		synchronize(device)
+	return 1000 * (time.perf_counter() - start) / num_iterations
+
+
+def _backward_pass_statistics(model, entries, X, num_warmup, num_iterations):
+	# backward latency of every leaf module in train mode, the time between the gradient of the output arriving at the
+	# module and the gradient of its input being computed
+	modules = dict(_leaf_modules(model))
+	module_names = {m: name for name, m in modules.items()}
+	starts = {}
+	timing = False
+	device = X.device
+
+	# the full backward hooks wrap the output of the module, modifying it in place afterwards is not allowed, the
+	# in-place relus are turned off on this copy of the model
+	for m in modules.values():
+		if hasattr(m, "inplace"):
+			m.inplace = False
+
+	def pre_hook(module, grad_output):
+		if timing:
+			synchronize(device)
+			starts.setdefault(module, []).append(time.perf_counter())
+
+	def hook(module, grad_input, grad_output):
+		if timing and starts.get(module):
+			synchronize(device)
+			entries[module_names[module]]["backward_ms"] += 1000 * (time.perf_counter() - starts[module].pop())
+
+	handles = []
+	for m in modules.values():
+		handles.append(m.register_full_backward_pre_hook(pre_hook))
+		handles.append(m.register_full_backward_hook(hook))
+
+	model.train()
+	# the input requires grad so that the hooks of the first layer are also called
+	X = X.clone().requires_grad_()
+
+	def backward():
+		model.zero_grad(set_to_none=True)
+		model(X).sum().backward()
+
+	for _ in range(num_warmup):
+		backward()
+	timing = True
+	for _ in range(num_iterations):
+		backward()
+
+	for handle in handles:
+		handle.remove()
+
+	for entry in entries.values():
+		entry["backward_ms"] /= num_iterations
+
+	# the backward of the whole model without the hooks, the forward in train mode (batch statistics, the graph is
+	# recorded) is timed on its own and subtracted from the time of forward + backward
+	synchronize(device)
+	start = time.perf_counter()
+	for _ in range(num_iterations):
+		model(X)
+	synchronize(device)
+	train_forward_time = time.perf_counter() - start
+
+	start = time.perf_counter()
+	for _ in range(num_iterations):
+		backward()
+	synchronize(device)
+	return 1000 * (time.perf_counter() - start - train_forward_time) / num_iterations
+
+
+def _roll_up(name, module_entries):
+	return {
+		"name": name,
+		"macs": sum(e["macs"] for e in module_entries),
+		"params": sum(e["params"] for e in module_entries),
+		"activation_bytes": sum(e["activation_bytes"] for e in module_entries),
+		"forward_ms": sum(e["forward_ms"] for e in module_entries),
+		"backward_ms": sum(e["backward_ms"] for e in module_entries),
+	}
+
+
+def profile_model(
+	model, input_size=(3, 32, 32), batch_size=1, device="cpu", num_warmup=3, num_iterations=10, name=None
+):
+	# profiles any nn.Module (the ResNets of model.py and the VGGs), the model itself is not modified since the hooks
+	# and the train mode of the backward pass are applied to copies. MACs, params and activation bytes are per image,
+	# the latencies are for a batch of batch_size images
+	model = copy.deepcopy(model).to(device)
+	X = torch.randn(batch_size, *input_size, device=device)
+
+	entries = {n: _new_entry(n, m) for n, m in _leaf_modules(model)}
+	forward_ms = _forward_pass_statistics(model, entries, X, num_warmup, num_iterations)
+	backward_ms = _backward_pass_statistics(
+		copy.deepcopy(model), entries, X, num_warmup, num_iterations
+	)
+
+	# layers that were never called (e.g. an unused block) are left out, the order is the order of the modules
+	modules = [e for e in entries.values() if e["calls"] > 0]
+
+	# the top level children are the stages of a ResNet (initial, layer1, layer2, layer3, classifier) or the blocks of
+	# a VGG
+	stages = {}
+	for entry in modules:
+		stages.setdefault(entry["name"].split(".")[0], []).append(entry)
+
+	return {
+		"name": name or type(model).__name__,
+		"input_size": list(input_size),
+		"batch_size": batch_size,
+		"device": str(device),
+		"total": {
+			"macs": sum(e["macs"] for e in modules),
+			"params": sum(p.numel() for p in model.parameters()),
+			"activation_bytes": sum(e["activation_bytes"] for e in modules),
+			"forward_ms": forward_ms,
+			"backward_ms": backward_ms,
+		},
+		"stages": [_roll_up(stage_name, stage_entries) for stage_name, stage_entries in stages.items()],
+		"modules": modules,
+	}
+
+
+def print_profile(profile, show_modules=True):
+	# a table like the one of torchsummary, but with the compute cost and the latency
+	print(
+		f"{profile['name']}: input {profile['input_size']}, batch size {profile['batch_size']} on {profile['device']}"
+	)
+	header = f"{'':<40} {'output':>16} {'MMACs':>9} {'params':>9} {'act KB':>9} {'fwd ms':>8} {'bwd ms':>8}"
+	print(header)
+	print("-" * len(header))
+
+	def row(name, entry, output_shape=""):
+		print(
+			f"{name:<40} {output_shape:>16} {entry['macs'] / 1e6:>9.3f} {entry['params']:>9} "
+			f"{entry['activation_bytes'] / 1024:>9.1f} {entry['forward_ms']:>8.3f} {entry['backward_ms']:>8.3f}"
+		)
+
+	if show_modules is True:
+		for entry in profile["modules"]:
+			row(f"{entry['name']} ({entry['type']})", entry, str(tuple(entry["output_shape"])))
+		print("-" * len(header))
+
+	for stage in profile["stages"]:
+		row(stage["name"], stage)
+	print("-" * len(header))
+	row("total", profile["total"])
+
+
+def save_profile(profile, path):
+	os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+	with open(path, "w") as f:
+		json.dump(profile, f, indent=2)
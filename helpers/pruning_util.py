@@ -0,0 +1,242 @@
+import copy
+
+import torch
+from torch import nn
+
+
+# ----------------------- functions to physically remove channels from layers ----------------------------------------
+
+
+def _prune_conv(conv, out_keep=None, in_keep=None):
+	weight = conv.weight.data
+	bias = conv.bias.data if conv.bias is not None else None
+	if out_keep is not None:
+		weight = weight[out_keep]
+		bias = bias[out_keep] if bias is not None else None
+	if in_keep is not None:
+		weight = weight[:, in_keep]
+
+	pruned_conv = nn.Conv2d(
+		weight.size(1),
+		weight.size(0),
+		kernel_size=conv.kernel_size,
+		stride=conv.stride,
+		padding=conv.padding,
+		bias=bias is not None,
+	).to(weight.device)
+	pruned_conv.weight.data.copy_(weight)
+	if bias is not None:
+		pruned_conv.bias.data.copy_(bias)
+	return pruned_conv
+
+
+def _prune_batch_norm(bn, keep):
+	pruned_bn = type(bn)(len(keep), eps=bn.eps, momentum=bn.momentum).to(bn.weight.device)
+	pruned_bn.weight.data.copy_(bn.weight.data[keep])
+	pruned_bn.bias.data.copy_(bn.bias.data[keep])
+	pruned_bn.running_mean.copy_(bn.running_mean[keep])
+	pruned_bn.running_var.copy_(bn.running_var[keep])
+	pruned_bn.num_batches_tracked.copy_(bn.num_batches_tracked)
+	return pruned_bn
+
+
+def _prune_linear(linear, out_keep=None, in_keep=None):
+	weight = linear.weight.data
+	bias = linear.bias.data if linear.bias is not None else None
+	if out_keep is not None:
+		weight = weight[out_keep]
+		bias = bias[out_keep] if bias is not None else None
+	if in_keep is not None:
+		weight = weight[:, in_keep]
+
+	pruned_linear = nn.Linear(weight.size(1), weight.size(0), bias=bias is not None).to(
+		weight.device
+	)
+	pruned_linear.weight.data.copy_(weight)
+	if bias is not None:
+		pruned_linear.bias.data.copy_(bias)
+	return pruned_linear
+
+
+def _keep_top(scores, sparsity):
+	# always keeping at least one channel, the indices are sorted so the order of the channels stays the same
+	num_keep = max(1, int(round(scores.numel() * (1 - sparsity))))
+	return torch.sort(torch.topk(scores, num_keep).indices).values
+
+
+def _conv_bn_scores(conv, bn, criterion):
+	# bn: the magnitude of gamma decides how much the channel contributes after normalization
+	# l1: the l1 norm of the filter as in "Pruning Filters for Efficient ConvNets"
+	# (a conv without a bn after it is scored with the l1 norm even when bn is choosen)
+	if criterion == "bn" and bn is not None:
+		return bn.weight.data.abs()
+	if criterion == "bn" or criterion == "l1":
+		return conv.weight.data.abs().sum(dim=(1, 2, 3))
+	raise ValueError("uncorrect criterion choosen")
+
+
+# ----------------------- ResNet pruning ----------------------------------------------------
+
+
+def _prune_resnet_inner_channels(stage, sparsity, criterion):
+	# the channels between conv_1 and conv_2 of a block are not part of the residual so they can be removed freely,
+	# the scores are normalized per block so that one threshold can be used for the whole stage
+	block_scores = []
+	for block in stage:
+		scores = _conv_bn_scores(block.conv_1, block.bn_1, criterion)
+		block_scores.append(scores / scores.mean())
+
+	all_scores = torch.cat(block_scores)
+	num_prune = int(round(all_scores.numel() * sparsity))
+	if num_prune == 0:
+		return
+	# exactly num_prune channels are removed from the stage, with a threshold all the channels tied at the threshold
+	# would be removed together (e.g. the gammas of a model that is not trained yet are all 1)
+	stage_keep = torch.topk(all_scores, all_scores.numel() - num_prune).indices
+
+	offset = 0
+	for block, scores in zip(stage, block_scores):
+		in_block = (stage_keep >= offset) & (stage_keep < offset + scores.numel())
+		keep = torch.sort(stage_keep[in_block] - offset).values
+		offset += scores.numel()
+		if keep.numel() == 0:
+			keep = torch.argmax(scores).view(1)
+
+		block.conv_1 = _prune_conv(block.conv_1, out_keep=keep)
+		block.bn_1 = _prune_batch_norm(block.bn_1, keep)
+		block.conv_2 = _prune_conv(block.conv_2, in_keep=keep)
+
+
+def _prune_resnet_residual_channels(resnet, sparsity, criterion):
+	stages = [resnet.layer1, resnet.layer2, resnet.layer3]
+
+	# the residual channels of a stage are shared by every block in the stage, so the score of a channel is summed over
+	# all the layers writing into it: conv_2 of every block, the shortcut of the first block and the stem for layer1
+	stage_keeps = []
+	for stage_index, stage in enumerate(stages):
+		scores = 0
+		for block in stage:
+			scores = scores + _conv_bn_scores(block.conv_2, block.bn_2, criterion)
+		if isinstance(stage[0].residual, nn.Sequential) and len(stage[0].residual) > 0:
+			scores = scores + _conv_bn_scores(
+				stage[0].residual[0], stage[0].residual[1], criterion
+			)
+		if stage_index == 0:
+			scores = scores + _conv_bn_scores(resnet.initial[0], resnet.initial[1], criterion)
+		stage_keeps.append(_keep_top(scores, sparsity))
+
+	resnet.initial[0] = _prune_conv(resnet.initial[0], out_keep=stage_keeps[0])
+	resnet.initial[1] = _prune_batch_norm(resnet.initial[1], stage_keeps[0])
+
+	# the input of layer1 is the output of the stem which uses the same channels as layer1
+	in_keep = stage_keeps[0]
+	for stage, keep in zip(stages, stage_keeps):
+		for block in stage:
+			block.conv_1 = _prune_conv(block.conv_1, in_keep=in_keep)
+			block.conv_2 = _prune_conv(block.conv_2, out_keep=keep)
+			block.bn_2 = _prune_batch_norm(block.bn_2, keep)
+
+			if hasattr(block, "se_layer"):
+				squeeze, _, excite, _ = block.se_layer.se_operations
+				block.se_layer.se_operations[0] = _prune_linear(squeeze, in_keep=keep)
+				block.se_layer.se_operations[2] = _prune_linear(excite, out_keep=keep)
+
+			if isinstance(block.residual, nn.Sequential) and len(block.residual) > 0:
+				block.residual[0] = _prune_conv(block.residual[0], out_keep=keep, in_keep=in_keep)
+				block.residual[1] = _prune_batch_norm(block.residual[1], keep)
+
+			in_keep = keep
+
+	resnet.classifier = _prune_linear(resnet.classifier, in_keep=stage_keeps[-1])
+
+	# the early exit heads classify the output of layer1 and layer2, so they keep the same channels as those stages
+	if hasattr(resnet, "exit_heads"):
+		for exit_head, keep in zip(resnet.exit_heads, stage_keeps):
+			exit_head.classifier = _prune_linear(exit_head.classifier, in_keep=keep)
+
+
+def prune_resnet(resnet, sparsity, criterion="bn", prune_residual=True):
+	# returns a new smaller dense model, the original is not modified
+	if any(getattr(m, "reversible", False) for m in resnet.modules()):
+		# the two halves of the channels of a reversible block are added to each other, they can't be pruned separately
+		raise ValueError("reversible ResNets can't be pruned")
+	if any(hasattr(m, "conv_3") for m in resnet.modules()):
+		# the channels are only traced through the conv_1 -> conv_2 of the basic block, not through the 1x1 convs of the
+		# bottleneck or the depthwise conv of the inverted residual block
+		raise ValueError("only ResNets with the basic (or SE) block can be pruned")
+	pruned_resnet = copy.deepcopy(resnet)
+
+	with torch.no_grad():
+		for stage in (pruned_resnet.layer1, pruned_resnet.layer2, pruned_resnet.layer3):
+			_prune_resnet_inner_channels(stage, sparsity, criterion)
+
+		if prune_residual is True:
+			# the zero padding shortcut of option A puts the input channels at a fixed offset in the output, that can't be
+			# kept when different channels are removed from the input and the output of a stage
+			if any(
+				not isinstance(block.residual, nn.Sequential)
+				for stage in (pruned_resnet.layer1, pruned_resnet.layer2, pruned_resnet.layer3)
+				for block in stage
+			):
+				raise ValueError("the residual channels can only be pruned with option B shortcuts, use prune_residual=False")
+			_prune_resnet_residual_channels(pruned_resnet, sparsity, criterion)
+
+	return pruned_resnet
+
+
+# ----------------------- VGG pruning ----------------------------------------------------
+
+
+def _set_module(model, name, module):
+	parent_name, _, child_name = name.rpartition(".")
+	parent = model.get_submodule(parent_name) if parent_name else model
+	setattr(parent, child_name, module)
+
+
+def prune_vgg(vgg, sparsity, criterion="bn"):
+	pruned_vgg = copy.deepcopy(vgg)
+
+	# the VGG models register their layers in the same order as they are used in forward, so we can walk the
+	# leaf modules in order and every conv is followed by its BNs and then the next conv or the first linear layer
+	layers = [
+		(name, module)
+		for name, module in pruned_vgg.named_modules()
+		if isinstance(module, (nn.Conv2d, nn.BatchNorm2d, nn.Linear))
+	]
+
+	with torch.no_grad():
+		in_keep = None
+		for i, (name, module) in enumerate(layers):
+			if not isinstance(module, nn.Conv2d):
+				continue
+
+			following_bns = []
+			next_layer = None
+			for next_name, next_module in layers[i + 1 :]:
+				if isinstance(next_module, nn.BatchNorm2d):
+					following_bns.append((next_name, next_module))
+				else:
+					next_layer = (next_name, next_module)
+					break
+
+			bn = following_bns[0][1] if following_bns else None
+			keep = _keep_top(_conv_bn_scores(module, bn, criterion), sparsity)
+
+			_set_module(pruned_vgg, name, _prune_conv(module, out_keep=keep, in_keep=in_keep))
+			for bn_name, bn_module in following_bns:
+				_set_module(pruned_vgg, bn_name, _prune_batch_norm(bn_module, keep))
+
+			next_name, next_module = next_layer
+			if isinstance(next_module, nn.Linear):
+				# the flatten puts every channel as a contiguous block of height * width features
+				spatial_size = next_module.in_features // module.out_channels
+				features_keep = (
+					keep[:, None] * spatial_size + torch.arange(spatial_size, device=keep.device)
+				).flatten()
+				_set_module(pruned_vgg, next_name, _prune_linear(next_module, in_keep=features_keep))
+				break
+
+			# the next conv still refers to the unpruned module in layers, its input channels are removed when we get to it
+			in_keep = keep
+
+	return pruned_vgg
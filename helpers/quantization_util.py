@@ -0,0 +1,101 @@
+import copy
+import os
+
+import torch
+from torch.ao.quantization import (
+	get_default_qat_qconfig_mapping,
+	get_default_qconfig_mapping,
+)
+from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx, prepare_qat_fx
+
+from helpers import benchmark_util
+from helpers import utils
+
+# x86 is the backend for the cpu hosts we serve on, it picks fbgemm or onednn depending on the operation
+quantization_backend = "x86"
+
+
+def _unfuse_se_residual(model):
+	# the SE blocks add the residual with one addcmul, that has no quantized kernel and would run in float between a
+	# dequantize and a quantize, so the copy that is traced uses a separate multiply and add
+	for m in model.modules():
+		if hasattr(m, "fuse_residual"):
+			m.fuse_residual = False
+
+
+def quantize_static(model, calibration_dataloader, num_calibration_batches=300):
+	torch.backends.quantized.engine = quantization_backend
+
+	# quantized kernels only exist for the cpu, the original float model is kept untouched
+	float_model = copy.deepcopy(model).to("cpu").eval()
+	_unfuse_se_residual(float_model)
+
+	example_inputs = (next(iter(calibration_dataloader))[0],)
+
+	# FX graph mode traces the forward, so the residual add in the blocks and the multiply in the SE block are quantized
+	# as well without having to put quant stubs and FloatFunctional into every block, conv + bn (+ relu) are fused here too
+	prepared_model = prepare_fx(
+		float_model, get_default_qconfig_mapping(quantization_backend), example_inputs
+	)
+
+	# calibration, the observers record the range of the activations to compute the scale and zero point
+	with torch.no_grad():
+		for batch_index, (X, _) in enumerate(calibration_dataloader):
+			if batch_index >= num_calibration_batches:
+				break
+			prepared_model(X)
+
+	return convert_fx(prepared_model)
+
+
+def prepare_qat(model, example_inputs, device):
+	torch.backends.quantized.engine = quantization_backend
+
+	# preparing on the cpu copy, afterwards the model with the fake quant modules is moved to the training device
+	qat_model = copy.deepcopy(model).to("cpu").train()
+	_unfuse_se_residual(qat_model)
+
+	# fake quantization is inserted after every conv / linear and on the residual add and SE multiply, the conv + bn
+	# pairs become ConvBn modules which keep updating the bn statistics while the weights are fake quantized
+	qat_model = prepare_qat_fx(
+		qat_model, get_default_qat_qconfig_mapping(quantization_backend), example_inputs
+	)
+	return qat_model.to(device)
+
+
+def convert_qat(qat_model):
+	# after the fine-tuning the fake quant modules are replaced with real int8 operations
+	qat_model = copy.deepcopy(qat_model).to("cpu").eval()
+	return convert_fx(qat_model)
+
+
+def export_quantized(quantized_model, example_input, path):
+	# torchscript so the int8 model can be loaded without the python class definitions
+	with torch.no_grad():
+		traced_model = torch.jit.trace(quantized_model, example_input)
+
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	torch.jit.save(traced_model, path)
+
+
+def compare_float_quantized(name, float_model, quantized_model, test_dataloader):
+	float_model = float_model.to("cpu").eval()
+	quantized_model.eval()
+
+	float_acc = utils.compute_accuracy_on_whole_dataloader(float_model, test_dataloader, "cpu")
+	quantized_acc = utils.compute_accuracy_on_whole_dataloader(
+		quantized_model, test_dataloader, "cpu"
+	)
+
+	example_input = next(iter(test_dataloader))[0]
+	float_latency = benchmark_util.measure_latency(float_model, example_input)
+	quantized_latency = benchmark_util.measure_latency(quantized_model, example_input)
+
+	batch_size = example_input.size(0)
+	print(
+		f"{name}: \n"
+		f" fp32 accuracy: {(100*float_acc):>0.3f}%, int8 accuracy: {(100*quantized_acc):>0.3f}%, delta: {(100*(quantized_acc - float_acc)):>0.3f}% \n"
+		f" fp32 latency: {1000*float_latency:.2f} ms ({batch_size / float_latency:.0f} img/s), "
+		f"int8 latency: {1000*quantized_latency:.2f} ms ({batch_size / quantized_latency:.0f} img/s), "
+		f"speedup: {float_latency / quantized_latency:.2f}x \n"
+	)
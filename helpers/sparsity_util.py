@@ -0,0 +1,221 @@
+import copy
+
+import torch
+from torch import nn
+import torch.nn.functional as F
+
+from helpers.pruning_util import _set_module
+from helpers import benchmark_util
+
+
+# ----------------------- gradual magnitude pruning ----------------------------------------------------
+
+
+def cubic_sparsity(step, final_sparsity, begin_step, end_step, initial_sparsity=0.0):
+	# the schedule of Zhu & Gupta ("To prune, or not to prune"), the sparsity rises fast at the start when there are
+	# many redundant weights and slower towards the end so the network can recover from the pruning
+	if step <= begin_step:
+		return initial_sparsity
+	if step >= end_step:
+		return final_sparsity
+	progress = (step - begin_step) / (end_step - begin_step)
+	return final_sparsity + (initial_sparsity - final_sparsity) * (1 - progress) ** 3
+
+
+def prunable_layers(model):
+	# every conv and linear layer except the first conv and the last linear layer, the stem only has 3 input channels
+	# and the classifier maps to the classes, they are small and the accuracy is the most sensitive to them
+	layers = [(name, m) for name, m in model.named_modules() if isinstance(m, (nn.Conv2d, nn.Linear))]
+	first_conv = next(name for name, m in layers if isinstance(m, nn.Conv2d))
+	last_linear = [name for name, m in layers if isinstance(m, nn.Linear)][-1]
+	return [(name, m) for name, m in layers if name not in (first_conv, last_linear)]
+
+
+def magnitude_mask(weight, sparsity):
+	# keeps the weights with the largest magnitude, exactly round(sparsity * numel) are removed even when some are tied
+	num_keep = weight.numel() - int(round(weight.numel() * sparsity))
+	mask = torch.zeros(weight.numel(), dtype=torch.bool, device=weight.device)
+	mask[torch.topk(weight.detach().abs().flatten(), num_keep).indices] = True
+	return mask.view_as(weight)
+
+
+class GradualMagnitudePruner:
+	# prunes the weights with the smallest magnitude of every prunable layer during training. it is a step hook of the
+	# optimizer so it works with any of the train loops: every update_every steps between begin_step and end_step the
+	# masks are recomputed for the sparsity of the cubic schedule, and after every step the masks are applied again
+	# since the momentum and the weight decay would otherwise move the pruned weights away from zero.
+	# the sparsity is per layer, every layer ends with final_sparsity
+	def __init__(
+		self,
+		model,
+		optimizer,
+		final_sparsity=0.8,
+		begin_step=0,
+		end_step=10000,
+		update_every=100,
+		initial_sparsity=0.0,
+	):
+		self.final_sparsity = final_sparsity
+		self.begin_step = begin_step
+		self.end_step = end_step
+		self.update_every = update_every
+		self.initial_sparsity = initial_sparsity
+
+		self.weights = [m.weight for _, m in prunable_layers(model)]
+		self.masks = [torch.ones_like(w, dtype=torch.bool) for w in self.weights]
+		self.num_steps = 0
+		self.current_sparsity = 0.0
+		self.handle = optimizer.register_step_post_hook(self._after_step)
+
+	@torch.no_grad()
+	def _after_step(self, optimizer, args, kwargs):
+		self.num_steps += 1
+		if self.num_steps == self.end_step or (
+			self.begin_step <= self.num_steps < self.end_step
+			and (self.num_steps - self.begin_step) % self.update_every == 0
+		):
+			self.current_sparsity = cubic_sparsity(
+				self.num_steps, self.final_sparsity, self.begin_step, self.end_step, self.initial_sparsity
+			)
+			# the weights that were pruned before are zero so they stay pruned
+			self.masks = [magnitude_mask(w, self.current_sparsity) for w in self.weights]
+		torch._foreach_mul_(self.weights, self.masks)
+
+	def sparsity(self):
+		# the measured fraction of zeros over all the prunable layers
+		num_zeros = sum((w == 0).sum().item() for w in self.weights)
+		return num_zeros / sum(w.numel() for w in self.weights)
+
+	def remove(self):
+		self.handle.remove()
+
+
+def magnitude_prune(model, sparsity):
+	# one shot magnitude pruning of every prunable layer, returns a new model
+	pruned_model = copy.deepcopy(model)
+	with torch.no_grad():
+		for _, m in prunable_layers(pruned_model):
+			m.weight.mul_(magnitude_mask(m.weight, sparsity))
+	return pruned_model
+
+
+# ----------------------- sparse inference ----------------------------------------------------
+
+
+def _to_csr(matrix):
+	# the indices are stored in int32 instead of the default int64, the matmul supports both and it halves their size
+	csr = matrix.detach().to_sparse_csr()
+	return torch.sparse_csr_tensor(
+		csr.crow_indices().int(), csr.col_indices().int(), csr.values(), csr.shape
+	)
+
+
+class SparseConv2d(nn.Module):
+	# a conv with its weight stored as a compressed sparse row matrix of shape (out_channels, in_channels * kh * kw).
+	# the input is unfolded to the columns of the image (im2col) and multiplied with the sparse matrix, so only the
+	# non zero weights are multiplied
+	def __init__(self, conv):
+		super().__init__()
+		if conv.groups != 1:
+			raise ValueError("only convs without groups can be made sparse")
+		self.out_channels = conv.out_channels
+		self.kernel_size = conv.kernel_size
+		self.stride = conv.stride
+		self.padding = conv.padding
+		self.dilation = conv.dilation
+		self.register_buffer("weight", _to_csr(conv.weight.reshape(conv.out_channels, -1)))
+		self.register_buffer("bias", None if conv.bias is None else conv.bias.detach().clone())
+
+	def _columns(self, x, out_height, out_width):
+		# im2col as kh * kw shifted views of the padded input that are stacked with a single copy, directly in the
+		# (in * kh * kw, batch * out_height * out_width) layout of the matmul. F.unfold gives (batch, in * kh * kw, ...)
+		# which needs another copy to transpose and was about 2x slower
+		(kernel_height, kernel_width), (stride_height, stride_width) = self.kernel_size, self.stride
+		(dilation_height, dilation_width) = self.dilation
+		x = F.pad(x, (self.padding[1], self.padding[1], self.padding[0], self.padding[0])).transpose(0, 1)
+		views = [
+			x[
+				:,
+				:,
+				i * dilation_height : i * dilation_height + stride_height * (out_height - 1) + 1 : stride_height,
+				j * dilation_width : j * dilation_width + stride_width * (out_width - 1) + 1 : stride_width,
+			]
+			for i in range(kernel_height)
+			for j in range(kernel_width)
+		]
+		return torch.stack(views, 1).reshape(-1, x.size(1) * out_height * out_width)
+
+	def forward(self, x):
+		batch_size = x.size(0)
+		out_height, out_width = [
+			(x.size(i + 2) + 2 * self.padding[i] - self.dilation[i] * (self.kernel_size[i] - 1) - 1) // self.stride[i] + 1
+			for i in range(2)
+		]
+		out = self.weight @ self._columns(x, out_height, out_width)
+		if self.bias is not None:
+			out = out + self.bias[:, None]
+		return out.reshape(self.out_channels, batch_size, out_height, out_width).transpose(0, 1)
+
+
+class SparseLinear(nn.Module):
+	def __init__(self, linear):
+		super().__init__()
+		self.register_buffer("weight", _to_csr(linear.weight))
+		self.register_buffer("bias", None if linear.bias is None else linear.bias.detach().clone())
+
+	def forward(self, x):
+		out = (self.weight @ x.T).T
+		if self.bias is not None:
+			out = out + self.bias
+		return out
+
+
+def to_sparse_inference(model, min_sparsity=0.5):
+	# returns a new model where every prunable layer with at least min_sparsity zeros stores its weight in the sparse
+	# format and runs the sparse kernel, below that the dense kernel is used since the sparse format has to store an
+	# index for every value
+	sparse_model = copy.deepcopy(model).cpu().eval()
+	for name, m in prunable_layers(sparse_model):
+		if (m.weight == 0).float().mean().item() < min_sparsity:
+			continue
+		if isinstance(m, nn.Conv2d) and m.groups == 1:
+			_set_module(sparse_model, name, SparseConv2d(m))
+		elif isinstance(m, nn.Linear):
+			_set_module(sparse_model, name, SparseLinear(m))
+	return sparse_model
+
+
+def weight_bytes(model):
+	# the storage of the conv and linear weights, a sparse weight stores its values, column indices and row offsets
+	num_bytes = 0
+	for m in model.modules():
+		if isinstance(m, (SparseConv2d, SparseLinear)):
+			num_bytes += sum(
+				t.numel() * t.element_size()
+				for t in (m.weight.values(), m.weight.col_indices(), m.weight.crow_indices())
+			)
+		elif isinstance(m, (nn.Conv2d, nn.Linear)):
+			num_bytes += m.weight.numel() * m.weight.element_size()
+	return num_bytes
+
+
+def report_sparse_latency(dense_model, sparsity_levels, example_batch):
+	# the latency only depends on the number of non zero weights, so the dense model is pruned to every level in one
+	# shot. the dense model is measured again before every level, the cpu timings drift over a long run
+	for sparsity in sparsity_levels:
+		pruned_model = magnitude_prune(dense_model, sparsity).eval()
+		sparse_model = to_sparse_inference(pruned_model)
+		with torch.inference_mode():
+			max_difference = (pruned_model(example_batch) - sparse_model(example_batch)).abs().max()
+
+		print(f"------------- sparsity {sparsity} (max logit difference {max_difference:.2e}) -----------------")
+		print(
+			f"weights: {weight_bytes(pruned_model) / 2**20:.2f} MB dense, {weight_bytes(sparse_model) / 2**20:.2f} MB sparse"
+		)
+		for batch in [example_batch, example_batch[:1]]:
+			dense_latency = benchmark_util.measure_latency(pruned_model, batch)
+			sparse_latency = benchmark_util.measure_latency(sparse_model, batch)
+			print(
+				f"batch of {len(batch)}: dense {1000*dense_latency:.2f} ms, sparse {1000*sparse_latency:.2f} ms "
+				f"({dense_latency / sparse_latency:.2f}x speedup)"
+			)
@@ -0,0 +1,28 @@
+import sys
+import time
+
+# only torch is imported here, this file is what the inference workers run so anything else we import (torchvision,
+# matplotlib, the model definitions) would be paid for on every cold start
+import torch
+
+
+def load(path):
+	program = torch.jit.load(path, map_location="cpu")
+	program.eval()
+	return program
+
+
+def predict(program, images):
+	# images are uint8 with shape (N, 3, 32, 32), the normalization is part of the exported program
+	with torch.inference_mode():
+		return program(images).argmax(dim=1)
+
+
+if __name__ == "__main__":
+	start = time.perf_counter()
+
+	program = load(sys.argv[1])
+	predictions = predict(program, torch.zeros(1, 3, 32, 32, dtype=torch.uint8))
+
+	# the line starting with "prediction" is what benchmark_util.measure_cold_start waits for
+	print(f"prediction {predictions.item()} ({1000 * (time.perf_counter() - start):.1f} ms after torch was imported)", flush=True)
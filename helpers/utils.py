@@ -1,7 +1,10 @@
 
 import torch
 
+from helpers import autocast_util
+
 import matplotlib.pyplot as plt
+import os
 import time
 
 train_model_training_loss_ls = []
@@ -47,16 +50,17 @@ def plot_training_validation_loss_and_accuracy(name=""):
 	plt.savefig(fname)
 	plt.close()
  
-def compute_loss_on_whole_dataloader(model, dataloader, loss_fn, device):
+def compute_loss_on_whole_dataloader(model, dataloader, loss_fn, device, autocast_dtype=None):
 	running_loss = 0.0
 
 	for valX, valy in dataloader:
 		valX, valy = valX.to(device), valy.to(device)
 
 		# make predictions
-		validation_pred = model(valX.to(device))
+		with autocast_util.autocast(device, autocast_dtype):
+			validation_pred = model(valX.to(device))
 		# compute loss
-		validation_loss = loss_fn(validation_pred, valy.to(device))
+		validation_loss = autocast_util.compute_loss(loss_fn, validation_pred, valy.to(device))
 		# update running loss
 		running_loss += validation_loss.item()
 
@@ -64,7 +68,7 @@ def compute_loss_on_whole_dataloader(model, dataloader, loss_fn, device):
 	return running_loss / len(dataloader)
 
 
-def compute_accuracy_on_whole_dataloader(model, dataloader, device):
+def compute_accuracy_on_whole_dataloader(model, dataloader, device, autocast_dtype=None):
 	dataset_size = len(dataloader.dataset)
 
 	num_correct = 0
@@ -73,26 +77,36 @@ def compute_accuracy_on_whole_dataloader(model, dataloader, device):
 			X, y = X.to(device), y.to(device)
 
 			# making predictions
-			pred = model(X)
+			with autocast_util.autocast(device, autocast_dtype):
+				pred = model(X)
 
 			num_correct += (pred.argmax(1) == y).type(torch.float).sum().item()
 
 	return num_correct / dataset_size
  
  
-def compute_train_validation_loss_accuracy(current_epoch, model, loss_fn, device, training_dataloader, validation_dataloader):
+def compute_train_validation_loss_accuracy(
+	current_epoch, model, loss_fn, device, training_dataloader, validation_dataloader, autocast_dtype=None, ema=None
+):
+	# with an ema (ema_util.ModelEMA of the model) the metrics are the ones of the averaged weights
+	if ema is not None:
+		with ema.swap():
+			return compute_train_validation_loss_accuracy(
+				current_epoch, model, loss_fn, device, training_dataloader, validation_dataloader, autocast_dtype
+			)
+
 	# getting valiation loss now
 	model.eval()
 
-	training_loss = compute_loss_on_whole_dataloader(model, training_dataloader, loss_fn, device)
-	validation_loss = compute_loss_on_whole_dataloader(model, validation_dataloader, loss_fn, device)
+	training_loss = compute_loss_on_whole_dataloader(model, training_dataloader, loss_fn, device, autocast_dtype)
+	validation_loss = compute_loss_on_whole_dataloader(model, validation_dataloader, loss_fn, device, autocast_dtype)
 
 	train_model_training_loss_ls.append(training_loss)
 	validation_model_training_loss_ls.append(validation_loss)
 
-	training_acc = compute_accuracy_on_whole_dataloader(model, training_dataloader, device)
+	training_acc = compute_accuracy_on_whole_dataloader(model, training_dataloader, device, autocast_dtype)
 	validation_acc = compute_accuracy_on_whole_dataloader(
-		model, validation_dataloader, device
+		model, validation_dataloader, device, autocast_dtype
 	)
 
 	train_model_training_accuracy_ls.append(training_acc)
@@ -101,7 +115,11 @@ def compute_train_validation_loss_accuracy(current_epoch, model, loss_fn, device
 	# Print information out
 	print(f"Epoch: {current_epoch}, Loss: {training_loss:.4f}")
  
-def evaluate(model, dataloader, loss_fn, device):
+def evaluate(model, dataloader, loss_fn, device, autocast_dtype=None, ema=None):
+	if ema is not None:
+		with ema.swap():
+			return evaluate(model, dataloader, loss_fn, device, autocast_dtype)
+
 	model.eval()
 
 	dataset_size = len(dataloader.dataset)
@@ -115,15 +133,37 @@ def evaluate(model, dataloader, loss_fn, device):
 			X, y = X.to(device), y.to(device)
 
 			# making predictions
-			pred = model(X)
+			with autocast_util.autocast(device, autocast_dtype):
+				pred = model(X)
 
 			# getting total loss
-			total_loss += loss_fn(pred, y).item()
+			total_loss += autocast_util.compute_loss(loss_fn, pred, y).item()
 
 			num_correct += (pred.argmax(1) == y).type(torch.float).sum().item()
 
 	total_loss /= num_batches
-	num_correct /= dataset_size
+	accuracy = num_correct / dataset_size
 	print(
-		f"Test Data: \n Accuracy: {(100*num_correct):>0.3f}%, Avg loss: {total_loss:>8f} \n"
-	)
\ No newline at end of file
+		f"Test Data: \n Accuracy: {(100*accuracy):>0.3f}%, Avg loss: {total_loss:>8f} \n"
+	)
+
+	return int(num_correct), total_loss
+
+
+def save_model(model, name, checkpoint_dir="checkpoints"):
+	os.makedirs(checkpoint_dir, exist_ok=True)
+	# only saving the weights, the model is rebuilt from model.py when loading
+	torch.save(model.state_dict(), f"{checkpoint_dir}/{name}.pt")
+
+
+def load_model(model, name, device, checkpoint_dir="checkpoints", required=False):
+	path = f"{checkpoint_dir}/{name}.pt"
+	if not os.path.exists(path):
+		# quantizing, pruning or exporting random weights gives meaningless results, those tools require the checkpoint
+		if required is True:
+			raise FileNotFoundError(f"no checkpoint found at {path}, the model has to be trained first")
+		print(f"no checkpoint found at {path}, keeping the randomly initialized weights")
+		return False
+
+	model.load_state_dict(torch.load(path, map_location=device))
+	return True
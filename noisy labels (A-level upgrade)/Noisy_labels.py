@@ -11,6 +11,11 @@ import time
 import numpy as np
 import copy
 
+import sys
+
+sys.path.append("../")
+from helpers import autocast_util
+
 train_model_training_loss_ls = []
 train_model_training_accuracy_ls = []
 validation_model_training_loss_ls = []
@@ -100,7 +105,7 @@ def he_initalization(m):
 			nn.init.zeros_(i.bias)
 
 
-def evaluate(model, dataloader, loss_fn):
+def evaluate(model, dataloader, loss_fn, autocast_dtype=None):
 	model.eval()
 
 	dataset_size = len(dataloader.dataset)
@@ -114,10 +119,11 @@ def evaluate(model, dataloader, loss_fn):
 			X, y = X.to(device), y.to(device)
 
 			# making predictions
-			pred = model(X)
+			with autocast_util.autocast(device, autocast_dtype):
+				pred = model(X)
 
 			# getting total loss
-			total_loss += loss_fn(pred, y.long()).item()
+			total_loss += autocast_util.compute_loss(loss_fn, pred, y.long()).item()
 
 			num_correct += (pred.argmax(1) == y).type(torch.float).sum().item()
 
@@ -128,23 +134,24 @@ def evaluate(model, dataloader, loss_fn):
 	)
 
 
-def compute_loss_on_whole_dataloader(model, dataloader, loss_fn, device):
+def compute_loss_on_whole_dataloader(model, dataloader, loss_fn, device, autocast_dtype=None):
 	running_loss = 0.0
 
 	for valX, valy in dataloader:
 		valX, valy = valX.to(device), valy.to(device)
 
 		# make predictions
-		validation_pred = model(valX.to(device))
+		with autocast_util.autocast(device, autocast_dtype):
+			validation_pred = model(valX.to(device))
 		# compute loss
-		validation_loss = loss_fn(validation_pred, valy.to(device).long())
+		validation_loss = autocast_util.compute_loss(loss_fn, validation_pred, valy.to(device).long())
 		# update running loss
 		running_loss += validation_loss.item()
 
 	# dividing running loss with number total batches made on the data
 	return running_loss / len(dataloader)
 
-def compute_accuracy_on_whole_dataloader(model, dataloader, device):
+def compute_accuracy_on_whole_dataloader(model, dataloader, device, autocast_dtype=None):
 	dataset_size = len(dataloader.dataset)
 
 	num_correct = 0
@@ -153,18 +160,21 @@ def compute_accuracy_on_whole_dataloader(model, dataloader, device):
 			X, y = X.to(device), y.to(device)
 
 			# making predictions
-			pred = model(X)
+			with autocast_util.autocast(device, autocast_dtype):
+				pred = model(X)
 
 			num_correct += (pred.argmax(1) == y).type(torch.float).sum().item()
 
 	return num_correct / dataset_size
 
 def train(
-	epochs, training_dataloader, validation_dataloader, model, loss_fn, optimizer
+	epochs, training_dataloader, validation_dataloader, model, loss_fn, optimizer, autocast_dtype=None
 ):
 	device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 	model.to(device)
 
+	grad_scaler = autocast_util.make_grad_scaler(device, autocast_dtype)
+
 	# set the model on training model
 	for current_epoch in range(0, epochs):
 		print(f"current epoch: {current_epoch}")
@@ -180,28 +190,30 @@ def train(
 			X, y = X.to(device), y.to(device)
 
 			# compute prediction error
-			# here we are making the prediction
-			trainig_pred = model(X)
-			# computing the loss from our prediction and true val
-			training_loss = loss_fn(trainig_pred, y.long())
+			# here we are making the prediction, with autocast the convs and linear layers run in bf16 / fp16
+			with autocast_util.autocast(device, autocast_dtype):
+				trainig_pred = model(X)
+			# computing the loss from our prediction and true val, the loss is always computed in fp32
+			training_loss = autocast_util.compute_loss(loss_fn, trainig_pred, y.long())
 
 			# have to zero out the gradients, for each batch since they can be accumulated
 			optimizer.zero_grad()
 
-			# backpropagation
-			training_loss.backward()
+			# backpropagation, the scaler only scales the loss for fp16 on cuda otherwise this is a normal backward
+			grad_scaler.scale(training_loss).backward()
 
 			# Adjust learning weights
-			optimizer.step()
+			grad_scaler.step(optimizer)
+			grad_scaler.update()
 
 		# getting valiation loss now
 		model.eval()
 
-		training_loss = compute_loss_on_whole_dataloader(model, training_dataloader, loss_fn, device)
-		validation_loss = compute_loss_on_whole_dataloader(model, validation_dataloader, loss_fn, device)
+		training_loss = compute_loss_on_whole_dataloader(model, training_dataloader, loss_fn, device, autocast_dtype)
+		validation_loss = compute_loss_on_whole_dataloader(model, validation_dataloader, loss_fn, device, autocast_dtype)
 
-		training_acc = compute_accuracy_on_whole_dataloader(model, training_dataloader, device)
-		validation_acc = compute_accuracy_on_whole_dataloader(model, validation_dataloader, device)
+		training_acc = compute_accuracy_on_whole_dataloader(model, training_dataloader, device, autocast_dtype)
+		validation_acc = compute_accuracy_on_whole_dataloader(model, validation_dataloader, device, autocast_dtype)
 
 		train_model_training_loss_ls.append(training_loss)
 		validation_model_training_loss_ls.append(validation_loss)
@@ -227,6 +239,9 @@ if __name__ == "__main__":
 	print(f"Using {device} device")
 
 	batch_size = 64
+	# run the convs and linear layers in bf16 (torch.bfloat16, cpus with AMX / AVX512-BF16) or fp16 (torch.float16,
+	# cuda), None trains in fp32
+	autocast_dtype = None
 
 	train_vali_data, test_data = load_dataset()
 
@@ -253,13 +268,13 @@ if __name__ == "__main__":
 
 	start_total_time = time.time()
 
-	train(120, training_dataloader, validation_loader, VGG3, loss_fn, optimize)  # training
+	train(120, training_dataloader, validation_loader, VGG3, loss_fn, optimize, autocast_dtype)  # training
 	train_time = time.time() - start_total_time
 	print(f"Training Time: {train_time}")
 
 	start_evaluation_time = time.time()
 
-	evaluate(VGG3, test_dataloader, loss_fn)  # evaluating
+	evaluate(VGG3, test_dataloader, loss_fn, autocast_dtype)  # evaluating
 
 	evaluate_time = time.time() - start_evaluation_time
 	print(f"Evaluation Time: {evaluate_time}")
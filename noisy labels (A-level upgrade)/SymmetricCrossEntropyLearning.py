@@ -10,6 +10,9 @@ class SymmetricCrossEntropyLearning(nn.Module):
         self.beta = beta
     
     def forward(self, pred, y):
+        # always in fp32, with bf16 / fp16 logits the softmax and the clamp to 1e-7 lose most of their precision
+        pred = pred.float()
+
         # Cross Entropy (CE)
         ce_loss = F.cross_entropy(pred, y)
 
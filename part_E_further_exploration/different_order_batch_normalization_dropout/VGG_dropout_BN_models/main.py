@@ -9,12 +9,19 @@ from VGG3_BN import VGG3_BN
 from VGG3_BN_dropout import VGG3_BN_dropout
 from VGG3_dropout_BN import VGG3_dropout_BN
 
+import sys
+
+sys.path.append("../../../")
+from helpers import autocast_util
+from helpers import compile_util
+from helpers import utils
+from helpers import profiler_util
+
 import torch
 from torch import nn
 from torchvision import datasets
 from torchvision.transforms import v2
 from torch.utils.data import DataLoader
-from torchsummary import summary
 
 import matplotlib.pyplot as plt
 import time
@@ -115,7 +122,7 @@ def he_initalization(m):
             nn.init.zeros_(i.bias)
 
 
-def evaluate(model, dataloader, loss_fn):
+def evaluate(model, dataloader, loss_fn, autocast_dtype=None):
     model.eval()
 
     dataset_size = len(dataloader.dataset)
@@ -129,10 +136,11 @@ def evaluate(model, dataloader, loss_fn):
             X, y = X.to(device), y.to(device)
 
             # making predictions
-            pred = model(X)
+            with autocast_util.autocast(device, autocast_dtype):
+                pred = model(X)
 
             # getting total loss
-            total_loss += loss_fn(pred, y).item()
+            total_loss += autocast_util.compute_loss(loss_fn, pred, y).item()
 
             num_correct += (pred.argmax(1) == y).type(torch.float).sum().item()
 
@@ -143,16 +151,19 @@ def evaluate(model, dataloader, loss_fn):
     )
 
 
-def compute_loss_on_whole_dataloader(model, dataloader):
+def compute_loss_on_whole_dataloader(model, dataloader, autocast_dtype=None):
     running_loss = 0.0
 
     for valX, valy in dataloader:
         valX, valy = valX.to(device), valy.to(device)
 
         # make predictions
-        validation_pred = model(valX.to(device))
+        with autocast_util.autocast(device, autocast_dtype):
+            validation_pred = model(valX.to(device))
         # compute loss
-        validation_loss = loss_fn(validation_pred, valy.to(device))
+        validation_loss = autocast_util.compute_loss(
+            loss_fn, validation_pred, valy.to(device)
+        )
         # update running loss
         running_loss += validation_loss.item()
 
@@ -160,7 +171,7 @@ def compute_loss_on_whole_dataloader(model, dataloader):
     return running_loss / len(dataloader)
 
 
-def compute_accuracy_on_whole_dataloader(model, dataloader):
+def compute_accuracy_on_whole_dataloader(model, dataloader, autocast_dtype=None):
     dataset_size = len(dataloader.dataset)
 
     num_correct = 0
@@ -169,7 +180,8 @@ def compute_accuracy_on_whole_dataloader(model, dataloader):
             X, y = X.to(device), y.to(device)
 
             # making predictions
-            pred = model(X)
+            with autocast_util.autocast(device, autocast_dtype):
+                pred = model(X)
 
             num_correct += (pred.argmax(1) == y).type(torch.float).sum().item()
 
@@ -177,8 +189,25 @@ def compute_accuracy_on_whole_dataloader(model, dataloader):
 
 
 def train(
-    epochs, training_dataloader, validation_dataloader, model, loss_fn, optimizer
+    epochs,
+    training_dataloader,
+    validation_dataloader,
+    model,
+    loss_fn,
+    optimizer,
+    use_compile=False,
+    autocast_dtype=None,
 ):
+    metrics_model = model
+    if use_compile is True:
+        # forward, loss, backward and optimizer step are compiled, the metrics are computed with a separate compiled model
+        train_step = compile_util.CompiledTrainStep(
+            model, loss_fn, optimizer, autocast_dtype
+        )
+        metrics_model = compile_util.CompiledEvalModel(model)
+
+    grad_scaler = autocast_util.make_grad_scaler(device, autocast_dtype)
+
     # set the model on training model
     for current_epoch in range(0, epochs):
         print(f"current epoch: {current_epoch}")
@@ -188,33 +217,45 @@ def train(
 
             X, y = X.to(device), y.to(device)
 
+            if use_compile is True:
+                train_step(X, y)
+                continue
+
             # compute prediction error
-            # here we are making the prediction
-            trainig_pred = model(X)
-            # computing the loss from our prediction and true val
-            training_loss = loss_fn(trainig_pred, y)
+            # here we are making the prediction, with autocast the convs and linear layers run in bf16 / fp16
+            with autocast_util.autocast(device, autocast_dtype):
+                trainig_pred = model(X)
+            # computing the loss from our prediction and true val, the loss is always computed in fp32
+            training_loss = autocast_util.compute_loss(loss_fn, trainig_pred, y)
 
             # have to zero out the gradients, for each batch since they can be accumulated
             optimizer.zero_grad()
 
-            # backpropagation
-            training_loss.backward()
+            # backpropagation, the scaler only scales the loss for fp16 on cuda otherwise this is a normal backward
+            grad_scaler.scale(training_loss).backward()
 
             # Adjust learning weights
-            optimizer.step()
+            grad_scaler.step(optimizer)
+            grad_scaler.update()
 
         # getting valiation loss now
-        model.eval()
+        metrics_model.eval()
 
-        training_loss = compute_loss_on_whole_dataloader(model, training_dataloader)
-        validation_loss = compute_loss_on_whole_dataloader(model, validation_dataloader)
+        training_loss = compute_loss_on_whole_dataloader(
+            metrics_model, training_dataloader, autocast_dtype
+        )
+        validation_loss = compute_loss_on_whole_dataloader(
+            metrics_model, validation_dataloader, autocast_dtype
+        )
 
         train_model_training_loss_ls.append(training_loss)
         validation_model_training_loss_ls.append(validation_loss)
 
-        training_acc = compute_accuracy_on_whole_dataloader(model, training_dataloader)
+        training_acc = compute_accuracy_on_whole_dataloader(
+            metrics_model, training_dataloader, autocast_dtype
+        )
         validation_acc = compute_accuracy_on_whole_dataloader(
-            model, validation_dataloader
+            metrics_model, validation_dataloader, autocast_dtype
         )
 
         train_model_training_accuracy_ls.append(training_acc)
@@ -235,6 +276,13 @@ if __name__ == "__main__":
     print(f"Using {device} device")
 
     batch_size = 64
+    # torch.compile the training step, the compiled graphs are cached on disk so a rerun doesn't compile again
+    use_compile = False
+    # run the convs and linear layers in bf16 (torch.bfloat16, cpus with AMX / AVX512-BF16) or fp16 (torch.float16,
+    # cuda), None trains in fp32
+    autocast_dtype = None
+    if use_compile is True:
+        compile_util.enable_compile_cache("../../../compile_cache")
 
     trainig_data, test_data = load_dataset()
     train_dataloader, test_dataloader = create_dataloaders(
@@ -250,9 +298,9 @@ if __name__ == "__main__":
     # VGG3_dropout = VGG3_dropout().to(device)
     # VGG3_dropout.apply(he_initalization)
 
-    # print(summary(VGG1_dropout, input_size=(3, 32, 32)))
-    # print(summary(VGG2_dropout, input_size=(3, 32, 32)))
-    # print(summary(VGG3_dropout, input_size=(3, 32, 32)))
+    # profiler_util.print_profile(profiler_util.profile_model(VGG1_dropout, (3, 32, 32), device=device))
+    # profiler_util.print_profile(profiler_util.profile_model(VGG2_dropout, (3, 32, 32), device=device))
+    # profiler_util.print_profile(profiler_util.profile_model(VGG3_dropout, (3, 32, 32), device=device))
 
     # VGG1_BN = VGG1_BN().to(device)
     # VGG1_BN.apply(he_initalization)
@@ -263,9 +311,9 @@ if __name__ == "__main__":
     # VGG3_BN = VGG3_BN().to(device)
     # VGG3_BN.apply(he_initalization)
 
-    # print(summary(VGG1_BN, input_size=(3, 32, 32)))
-    # print(summary(VGG2_BN, input_size=(3, 32, 32)))
-    # print(summary(VGG3_BN, input_size=(3, 32, 32)))
+    # profiler_util.print_profile(profiler_util.profile_model(VGG1_BN, (3, 32, 32), device=device))
+    # profiler_util.print_profile(profiler_util.profile_model(VGG2_BN, (3, 32, 32), device=device))
+    # profiler_util.print_profile(profiler_util.profile_model(VGG3_BN, (3, 32, 32), device=device))
 
     # defining loss function
     loss_fn = nn.CrossEntropyLoss()
@@ -273,42 +321,42 @@ if __name__ == "__main__":
     # print("----------------- working on VGG1 dropout ---------------------")
     # optimize = torch.optim.SGD(VGG1_dropout.parameters(), lr=0.001, momentum=0.9)
     # train(100, train_dataloader, test_dataloader, VGG1_dropout, loss_fn, optimize)
-    # evaluate(VGG1_dropout, test_dataloader, loss_fn)
+    # evaluate(VGG1_dropout, test_dataloader, loss_fn, autocast_dtype)
     # plot_training_validation_loss_and_accuracy()
     # clear_histogram()
 
     # print("----------------- working on VGG2 dropout ---------------------")
     # optimize = torch.optim.SGD(VGG2_dropout.parameters(), lr=0.001, momentum=0.9)
     # train(100, train_dataloader, test_dataloader, VGG2_dropout, loss_fn, optimize)
-    # evaluate(VGG2_dropout, test_dataloader, loss_fn)
+    # evaluate(VGG2_dropout, test_dataloader, loss_fn, autocast_dtype)
     # plot_training_validation_loss_and_accuracy()
     # clear_histogram()
 
     # print("----------------- working on VGG3 dropout ---------------------")
     # optimize = torch.optim.SGD(VGG3_dropout.parameters(), lr=0.001, momentum=0.9)
     # train(100, train_dataloader, test_dataloader, VGG3_dropout, loss_fn, optimize)
-    # evaluate(VGG3_dropout, test_dataloader, loss_fn)
+    # evaluate(VGG3_dropout, test_dataloader, loss_fn, autocast_dtype)
     # plot_training_validation_loss_and_accuracy()
     # clear_histogram()
 
     # print("----------------- working on VGG1 BN ---------------------")
     # optimize = torch.optim.SGD(VGG1_BN.parameters(), lr=0.001, momentum=0.9)
     # train(100, train_dataloader, test_dataloader, VGG1_BN, loss_fn, optimize)
-    # evaluate(VGG1_BN, test_dataloader, loss_fn)
+    # evaluate(VGG1_BN, test_dataloader, loss_fn, autocast_dtype)
     # plot_training_validation_loss_and_accuracy()
     # clear_histogram()
 
     # print("----------------- working on VGG2 BN ---------------------")
     # optimize = torch.optim.SGD(VGG2_BN.parameters(), lr=0.001, momentum=0.9)
     # train(100, train_dataloader, test_dataloader, VGG2_BN, loss_fn, optimize)
-    # evaluate(VGG2_BN, test_dataloader, loss_fn)
+    # evaluate(VGG2_BN, test_dataloader, loss_fn, autocast_dtype)
     # plot_training_validation_loss_and_accuracy()
     # clear_histogram()
 
     # print("----------------- working on VGG3 BN ---------------------")
     # optimize = torch.optim.SGD(VGG3_BN.parameters(), lr=0.001, momentum=0.9)
     # train(100, train_dataloader, test_dataloader, VGG3_BN, loss_fn, optimize)
-    # evaluate(VGG3_BN, test_dataloader, loss_fn)
+    # evaluate(VGG3_BN, test_dataloader, loss_fn, autocast_dtype)
     # plot_training_validation_loss_and_accuracy()
     # clear_histogram()
 
@@ -318,19 +366,39 @@ if __name__ == "__main__":
     VGG3_dropout_BN = VGG3_dropout_BN().to(device)
     VGG3_dropout_BN.apply(he_initalization)
 
-    # print(summary(VGG3_BN_dropout, input_size=(3, 32, 32)))
-    # print(summary(VGG3_dropout_BN, input_size=(3, 32, 32)))
+    # profiler_util.print_profile(profiler_util.profile_model(VGG3_BN_dropout, (3, 32, 32), device=device))
+    # profiler_util.print_profile(profiler_util.profile_model(VGG3_dropout_BN, (3, 32, 32), device=device))
 
     print("----------------- working on VGG3 BN & Dropout ---------------------")
     optimize = torch.optim.SGD(VGG3_BN_dropout.parameters(), lr=0.001, momentum=0.9)
-    train(200, train_dataloader, test_dataloader, VGG3_BN_dropout, loss_fn, optimize)
-    evaluate(VGG3_BN_dropout, test_dataloader, loss_fn)
+    train(
+        200,
+        train_dataloader,
+        test_dataloader,
+        VGG3_BN_dropout,
+        loss_fn,
+        optimize,
+        use_compile,
+        autocast_dtype=autocast_dtype,
+    )
+    evaluate(VGG3_BN_dropout, test_dataloader, loss_fn, autocast_dtype)
+    utils.save_model(VGG3_BN_dropout, "VGG3_BN_dropout")
     plot_training_validation_loss_and_accuracy()
     clear_histogram()
     
     print("----------------- working on VGG3 Dropout & BN ---------------------")
     optimize = torch.optim.SGD(VGG3_dropout_BN.parameters(), lr=0.001, momentum=0.9)
-    train(200, train_dataloader, test_dataloader, VGG3_dropout_BN, loss_fn, optimize)
-    evaluate(VGG3_dropout_BN, test_dataloader, loss_fn)
+    train(
+        200,
+        train_dataloader,
+        test_dataloader,
+        VGG3_dropout_BN,
+        loss_fn,
+        optimize,
+        use_compile,
+        autocast_dtype=autocast_dtype,
+    )
+    evaluate(VGG3_dropout_BN, test_dataloader, loss_fn, autocast_dtype)
+    utils.save_model(VGG3_dropout_BN, "VGG3_dropout_BN")
     plot_training_validation_loss_and_accuracy()
     clear_histogram()